@@ -2,8 +2,10 @@ from ._version import VERSION
 __version__ = VERSION
 
 from .classifier import AzureSDKTrackClassifier, Language
+from .registry import ModelRegistry
 
 __all__ = [
     'AzureSDKTrackClassifier',
-    'Language'
+    'Language',
+    'ModelRegistry'
 ]
\ No newline at end of file
@@ -1,27 +1,23 @@
 import argparse
-import glob
-from io import BytesIO
+from contextlib import ExitStack
 import logging
-import math
-from multiprocessing import Process, Queue
 import os
-import queue
 import sys
-import zipfile
 import json
 
 import numpy
-import requests
 
 from .classifier import AzureSDKTrackClassifier, Language
-from .helpers import get_zip_uri_and_subpath_from_github_link, do_github_zip_request, run_multiproc_classifier
+from .helpers import classify_items, json_default, shared_model_file
+from .inputs import iter_github_archives, iter_jsonl_documents, walk_files, DEFAULT_EXCLUDE, DEFAULT_MAX_FILE_SIZE
+from .parallel import WorkerPool
+from .registry import ModelRegistry
 from .settings import Settings
-from .classifierV2 import extract_and_label_codefences
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Predict whether a given document contains Track1 content.\n\n(Note: If an existing model is not loaded, a new model will be trained.)', prog='azureSDKTrackClassifier')
-    parser.add_argument('text', type=str, help='The text to classify as containing T1 content')
+    parser.add_argument('text', type=str, nargs='+', help='The text to classify as containing T1 content.  (With --input-is-path, the path to classify, or any number of github links, which are downloaded concurrently.)')
     parser.add_argument('--language', default=None, type=str, help='Specify the language ({}) to tailor this classification for.  If unspecified, checks for all languages.'.format(', '.join([l.name for l in Language])))
     parser.add_argument('--service', default=None, type=str, help='Specify the service (any by name from Azure SDK release list, e.g. EventHubs) to tailor this classification for.  If unspecified, checks for all services.')
     
@@ -29,20 +25,51 @@ if __name__ == "__main__":
     parser.add_argument('--log-level', default=None, type=str, help='Specify log level (debug, info, warning, exception, error) to output alongside results.')
 
     parser.add_argument('--load-from-file', type=str, help='Load a cached model from a local file rather than training from scratch.  Specify the path with this argument.')
+    parser.add_argument('--model-directory', type=str, help='Load the prebuilt model for --language and --service from this directory rather than training from scratch; falling back to the language\'s all-services model, then to the all-up model, if there is none for the pair.  (Models are named as --save-to-file names them by default: azureSDKTrackClassifier_{language}_{service}.model)')
     parser.add_argument('--save-to-file', type=str, help='Save the model trained or used in this run to a file so it may be loaded again in the future.  Specify the path with this argument.')
     
+    parser.add_argument('--save-format', type=str, default='pickle', choices=['pickle', 'compact'], help='The format in which to save the model with --save-to-file or --save-to-blob.  "compact" is a smaller versioned format that is memory-mapped on load and does not depend on the installed sklearn version.  (Loading detects either format.)')
+
     parser.add_argument('--load-from-blob', type=str, help='Load a cached model from an azure storage blob rather than training from scratch.  Specify the blob path with this argument.  Azure credentials must be provided by environment variables AZURE_STORAGE_CONNECTION_STRING and AZURE_STORAGE_CONTAINER respectively. (connection string may also be a SAS signature connection string)')
     parser.add_argument('--save-to-blob', type=str, help='Save the model trained or used in this run to an azure storage blob so it may be loaded again in the future.  Specify the blob path with this argument.  Azure credentials must be provided by environment variables AZURE_STORAGE_CONNECTION_STRING and AZURE_STORAGE_CONTAINER respectively. (connection string may also be a SAS signature connection string)')
 
     parser.add_argument('--input-is-path', default=False, action='store_true', help='Enable this flag to indicate that the primary text argument is a path to a file that should be read and predicted.')
 
     parser.add_argument('--set-cache-path', type=str, default='.', help='This option specifies the location of the cache files pulled down to generate the model. (Training corpuses.)  By default this is the local directory.')
+    parser.add_argument('--set-corpus-cache-budget', type=int, default=Settings.CORPUS_CACHE_MAX_BYTES, help='This option specifies the most bytes of (compressed) training corpuses to keep in the cache path; the least recently used are evicted beyond it.  Default: {}'.format(Settings.CORPUS_CACHE_MAX_BYTES))
     parser.add_argument('--set-test-corpus-path', type=str, default='.', help='This option specifies the location of the test corpus tree used to supplement unsupervised model generation. (Test corpuses.)  By default this is the local directory.')
     parser.add_argument('--log-missing-training-to-file', type=str, default=None, help='This option logs all package-version-uri tuples found to be missing from unsupervised training to the specified file. (File is TSV-formatted with headers)')
-    parser.add_argument('--set-parallelism', type=int, default=1, help='This option specifies the degree of parallelism (number of processes) to use when performing classification.  Default is no parallelism. (1 process, this script)  Warning: Not advised to use because of process start time overhead unless you have MANY (hundreds) files to parse.')
+    parser.add_argument('--set-parallelism', type=int, default=1, help='This option specifies the degree of parallelism (number of worker processes) to use when classifying multiple files.  Default is no parallelism. (1 process, this script)  Workers start once and share one copy of the model, so this pays off from a few hundred files.')
+    parser.add_argument('--offline-mirror', type=str, default=None, help='This option trains from the local mirror directory at this path (built with `python -m azureSDKTrackClassifier.mirror build PATH`) rather than from github, so training needs no network access and is reproducible.')
+    parser.add_argument('--training-artifacts', type=str, default=None, help='This option keeps per-package training artifacts (tokens, versions and corpus files) in the directory at this path, so that later trainings with the same path only fetch and tokenize packages that are new or changed since.')
+    parser.add_argument('--set-tokenization-parallelism', type=int, default=None, help='This option specifies how many worker processes tokenize training corpora when training.  Default: one per core.')
+    parser.add_argument('--set-apistubgen-path', type=str, default=Settings.APISTUBGEN_PATH, help='This option specifies the directory apistubgen files ({{language}}_{{package}}_{{version}}.json) are looked for in during training.  Default: {}'.format(Settings.APISTUBGEN_PATH))
+    parser.add_argument('--set-english-wordlist', type=str, default=None, help='This option makes training prune English words using the wordlist (one word per line) at this path rather than pyenchant, which is then not needed.  `python -m azureSDKTrackClassifier.dictionary freeze PATH` writes the words pyenchant accepted in earlier trainings to such a wordlist.')
+    parser.add_argument('--score-training', default=False, action='store_true', help='Enable this flag to log the cross-validated accuracy of candidate classifiers when training.  (For model selection, see `python -m azureSDKTrackClassifier.evaluation`.)')
+    parser.add_argument('--set-download-concurrency', type=int, default=Settings.DOWNLOAD_CONCURRENCY, help='This option specifies how many training corpus zips to download at once when training; at most {} at a time from any one host.  Default: {}'.format(Settings.DOWNLOAD_PER_HOST_CONCURRENCY, Settings.DOWNLOAD_CONCURRENCY))
+    parser.add_argument('--set-download-timeout', type=float, default=Settings.DOWNLOAD_TIMEOUT, help='This option specifies how many seconds a download may wait to connect, or for more data, before it is retried or fails.  Default: {}'.format(Settings.DOWNLOAD_TIMEOUT))
     parser.add_argument('--obey-code-fences', default=False, action='store_true', help='This option causes the classifier to try and examine only codefenced blocks.  If none exists, runs on the whole file.')
+    parser.add_argument('--early-exit', default=False, action='store_true', help='Enable this flag to stop processing each document as soon as the rest of it could no longer change the result.  Faster for triage; verbose counts then only reflect the processed part of each document.')
+    parser.add_argument('--cache-results', default=False, action='store_true', help='Enable this flag to cache classification results by document content and model, both in memory and in a database under the cache path, so duplicate documents (in this or later runs with the same model) are not reclassified.')
+    parser.add_argument('--stream', default=False, action='store_true', help='Enable this flag (alongside --input-is-path) to classify a single file incrementally with bounded memory rather than reading it whole, or the files of github links one at a time as they are read rather than all at once.  A path of "-" streams from stdin.  Single files are not compatible with --obey-code-fences; --set-parallelism is ignored.')
+
+    parser.add_argument('--jsonl', default=False, action='store_true', help='Enable this flag to read documents as JSON lines records, {"text": ...} or {"path": ...} with an optional "id", from the file given as the text argument ("-" for stdin), and to write a JSON line result, {"id": ..., "result": ...}, for each document as it is classified, then a {"summary": ...} line, rather than one summary_result at the end.  Memory use does not grow with the number of documents.  (Unreadable records get an {"id": ..., "error": ...} line as they are read.)')
+
+    parser.add_argument('--include', action='append', default=[], help='For directory inputs: only classify files matching this glob (against their path relative to the directory, or their name).  May be given more than once.')
+    parser.add_argument('--exclude', action='append', default=list(DEFAULT_EXCLUDE), help='For directory inputs: skip files and directories matching this glob.  May be given more than once.  ({} are always excluded.)'.format(', '.join(DEFAULT_EXCLUDE)))
+    parser.add_argument('--max-file-size', type=int, default=DEFAULT_MAX_FILE_SIZE, help='For directory inputs: skip files larger than this many bytes.  0 for no limit.  Default: {}'.format(DEFAULT_MAX_FILE_SIZE))
+    parser.add_argument('--use-gitignore', default=False, action='store_true', help='For directory inputs: skip files ignored by .gitignore files.')
+    parser.add_argument('--all-extensions', default=False, action='store_true', help='For directory inputs: classify files of any extension, rather than only those of code and documentation. (e.g. .cs, .py, .md)')
 
     args = parser.parse_args()
+    paths, args.text = args.text, ' '.join(args.text) # Unquoted text arrives as several arguments.
+    is_github = args.input_is_path and all("github" in p for p in paths) and not os.path.exists(args.text)
+    if args.input_is_path and len(paths) > 1 and not is_github:
+        parser.error('Only github links may be given more than one at a time.')
+    if args.stream and (not args.input_is_path or (args.obey_code_fences and not is_github)):
+        parser.error('--stream requires --input-is-path and cannot be combined with --obey-code-fences for single files.')
+    if args.jsonl and (args.input_is_path or args.stream):
+        parser.error('--jsonl cannot be combined with --input-is-path or --stream; records name their own paths.')
 
     # == Prepare settings ==
     if args.log_level:
@@ -50,8 +77,26 @@ if __name__ == "__main__":
 
     if args.set_cache_path:
         Settings.CACHE_BASE_PATH = args.set_cache_path
+    if args.set_corpus_cache_budget:
+        Settings.CORPUS_CACHE_MAX_BYTES = args.set_corpus_cache_budget
     if args.set_test_corpus_path:
         Settings.TEST_CORPUS_BASE_PATH = args.set_test_corpus_path
+    if args.set_apistubgen_path:
+        Settings.APISTUBGEN_PATH = args.set_apistubgen_path
+    if args.offline_mirror:
+        Settings.OFFLINE_MIRROR_PATH = args.offline_mirror
+    if args.training_artifacts:
+        Settings.TRAINING_ARTIFACTS_PATH = args.training_artifacts
+    if args.set_tokenization_parallelism:
+        Settings.TOKENIZATION_PROCESSES = args.set_tokenization_parallelism
+    if args.set_english_wordlist:
+        Settings.ENGLISH_WORDLIST_PATH = args.set_english_wordlist
+    if args.score_training:
+        Settings.SCORE_TRAINING = True
+    if args.set_download_concurrency:
+        Settings.DOWNLOAD_CONCURRENCY = args.set_download_concurrency
+    if args.set_download_timeout:
+        Settings.DOWNLOAD_TIMEOUT = args.set_download_timeout
     if args.log_missing_training_to_file:
         Settings.MISSING_TRAINING_LOG = args.log_missing_training_to_file
         with open(Settings.MISSING_TRAINING_LOG, 'w') as f: # Truncate log file for this run.
@@ -59,6 +104,8 @@ if __name__ == "__main__":
 
     if args.load_from_file:
         is_t1_classifier = AzureSDKTrackClassifier.load(args.load_from_file)
+    elif args.model_directory:
+        is_t1_classifier = ModelRegistry(directory=args.model_directory).get(args.language, args.service)
     elif args.load_from_blob:
         CONN_STR = os.environ['AZURE_STORAGE_CONNECTION_STRING']
         CONTAINER = os.environ['AZURE_STORAGE_CONTAINER']
@@ -66,107 +113,130 @@ if __name__ == "__main__":
     else:
         is_t1_classifier = AzureSDKTrackClassifier(args.language, args.service)
 
+    if args.cache_results:
+        is_t1_classifier.enable_result_cache(persistent=True)
+
     # == Prepare or fetch inputs ==
     text = args.text
     multi_text = {} # For if we're provided an input with more than one file to classify. (A folder, github repo, etc.)
-    if args.input_is_path:
+    stream = None # For if a single file should be classified incrementally rather than read whole.
+    archive_files = None # For if the files of github archives should be classified as they are read rather than gathered into multi_text.
+    directory_files = None # For if the files of a directory should be classified as they are read rather than gathered into multi_text.
+    jsonl_documents = None # For if documents are read from, and results written as, JSON lines rather than gathered into summary_result.
+    open_inputs = ExitStack() # Files read as classification proceeds, closed once it is done.
+    if args.jsonl:
+        jsonl_documents = iter_jsonl_documents(sys.stdin if args.text == '-' else open_inputs.enter_context(open(args.text)))
+    elif args.input_is_path:
         path = args.text
-        if os.path.isfile(path):
+        if args.stream and path == '-':
+            stream = sys.stdin.buffer
+        elif args.stream and os.path.isfile(path):
+            stream = open(path, 'rb')
+        elif os.path.isfile(path):
             with open(path) as f:
                 text = f.read()
         elif os.path.isdir(path):
-            input_path_glob = os.path.join(path,'**')
-            for file_path in glob.glob(input_path_glob, recursive=True):
-                if not os.path.isdir(file_path):
-                    with open(file_path) as f:
-                        text = f.read()
-                        multi_text[file_path] = text
-        elif "github" in path:
-            if path.endswith('.zip'):
-                zip_uri, custom_subpath = path, ''
-            else:
-                zip_uri, custom_subpath = get_zip_uri_and_subpath_from_github_link(path)
-            logging.getLogger(__name__).info("Getting input uri: " + zip_uri)
-            input_zip = do_github_zip_request(zip_uri)
-            if input_zip == b'404: Not Found': # This is a github-ism.
-                logging.getLogger(__name__).warning("No zip for URI: {}".format(zip_uri))
-                exit()
-            with zipfile.ZipFile(BytesIO(input_zip), 'r') as zf:
-                for file in [n for n in zf.namelist() if not n.endswith('/') and (custom_subpath in n)]:
-                    body = zf.read(file)
-                    try:
-                        multi_text[file] = body.decode('UTF-8')
-                    except:
-                        try:
-                            multi_text[file] = body.decode('unicode_escape')
-                        except Exception as e:
-                            logging.getLogger(__name__).warning("Unable to read input file: {}; {}".format(file, e))
+            directory_files = walk_files(path, args.include, args.exclude, args.max_file_size, args.use_gitignore, args.all_extensions)
+        elif is_github: # Archives are spooled to disk rather than held in memory, and read one file at a time.
+            archive_files = iter_github_archives(paths)
+            if not args.stream:
+                multi_text, archive_files = dict(archive_files), None
         else:
             print("Provided input path is of no known type (local file, directory, or github repo or zip): {}".format(path))
             exit()
 
     if args.obey_code_fences:
-        if multi_text:
+        from .classifierV2 import extract_and_label_codefences
+        if jsonl_documents:
+            jsonl_documents = ((key, '\n'.join([e[0] for e in extract_and_label_codefences(text)]) if text is not None else None, error) for key, text, error in jsonl_documents)
+        elif archive_files:
+            archive_files = ((path, '\n'.join([e[0] for e in extract_and_label_codefences(text)])) for path, text in archive_files)
+        elif directory_files:
+            directory_files = ((path, '\n'.join([e[0] for e in extract_and_label_codefences(text)])) for path, text in directory_files)
+        elif multi_text:
             for key in multi_text.keys():
                 multi_text[key] = '\n'.join([e[0] for e in extract_and_label_codefences(multi_text[key])])
         else:
             text = '\n'.join([e[0] for e in extract_and_label_codefences(text)])
 
     # == Actually do classification ==
-    summary_result = {'t1_documents':0,'total_documents':0,'per_document_results':{}}
+    summary_result = {'t1_documents':0,'total_documents':0,'per_document_results':{}} if not args.jsonl else {'t1_documents':0,'total_documents':0,'errors':0}
     def increment_summary(path:str, result:dict):  # helper to keep track of state for printing a summary, mostly for multi-file classification.
         summary_result['t1_documents'] += int(result['result'] if not isinstance(result, bool) else result)
         summary_result['total_documents'] += 1
-        summary_result['per_document_results'][path] = result
+        if args.jsonl:
+            write_line({'id':path, 'result':result})
+        else:
+            summary_result['per_document_results'][path] = result
+    def write_line(record:dict):
+        sys.stdout.write(json.dumps(record, default=json_default) + '\n')
+        sys.stdout.flush() # So results can be consumed as they are produced.
+    def readable_jsonl_documents():
+        for key, text, error in jsonl_documents:
+            if error:
+                summary_result['errors'] += 1
+                write_line({'id':key, 'error':error})
+            else:
+                yield key, text
 
-    with numpy.errstate(divide='ignore'): # Disable the divide by zero warning that can sometimes be emitted by the model during prediction.
-        # TODO: multiproc is almost never worth it unless you have truly huge #s of files.  Consider deprecating if that never becomes a use case, since it adds both this extra logic, the extra param, and the extra helper function.
+    with open_inputs, numpy.errstate(divide='ignore'): # Disable the divide by zero warning that can sometimes be emitted by the model during prediction.
         num_procs = args.set_parallelism
-        if multi_text and num_procs and num_procs > 1: # run multi-file classification in parallel   
-            work_keys = list(multi_text.keys())
-            work_chunks = [work_keys[i:i+int(math.ceil(len(work_keys)/num_procs))] for i in range(0, len(work_keys), int(math.ceil(len(work_keys)/num_procs)))] # Breaks a list into even sized chunks.  The math.ceil handles off-by-one for odd vs. even length lists.
-
-            result_queue = Queue()
-            procs = [Process(target=run_multiproc_classifier, args=(is_t1_classifier, {k:multi_text[k] for k in work_chunks[i]}, result_queue, args.verbose)) for i in range(0,num_procs)]
-            for p in procs:
-                logging.getLogger(__name__).debug("Starting process: {}".format(p))
-                p.start()
-
-            while procs:
-                try:
-                    # Note: currently we do not use the result on this side of the process boundary, since printing it in the proc is both more immediate and sufficient.
-                    # Leaving this here, however, in case we ever need to de-interlace or aggregate in some way.
-                    res = result_queue.get(block=False)
-                    increment_summary(res[0], res[1])
-                except queue.Empty:
-                    pass
-                for p in procs:
-                    p.join(timeout=0)
-                    if p.exitcode is not None:
-                        logging.getLogger(__name__).debug("Cleaning up process: {}".format(p))
-                        procs.remove(p)
-
-        elif multi_text: # Run non-parallel multi-file classification
-            for path, text in multi_text.items():
+        gated_documents = 0 # Rejected by the relevance gates of worker processes, which this process's gate_stats doesn't see.
+        worker_cache_stats = None # Likewise for the result caches of worker processes.
+        if jsonl_documents and num_procs and num_procs > 1:
+            with shared_model_file(is_t1_classifier, args.load_from_file) as model_path, WorkerPool(model_path, num_procs, args.verbose, args.early_exit, cache_results=args.cache_results) as pool:
+                for key, result in pool.classify(readable_jsonl_documents()):
+                    increment_summary(key, result)
+                gated_documents, worker_cache_stats = pool.gated_documents, pool.result_cache_stats
+        elif jsonl_documents:
+            for key, result in classify_items(is_t1_classifier, readable_jsonl_documents(), args.verbose, args.early_exit):
+                increment_summary(key, result)
+        elif (multi_text or directory_files) and num_procs and num_procs > 1: # run multi-file classification in parallel
+            with shared_model_file(is_t1_classifier, args.load_from_file) as model_path, WorkerPool(model_path, num_procs, args.verbose, args.early_exit, cache_results=args.cache_results) as pool:
+                for path, result in pool.classify(directory_files or multi_text.items()):
+                    print("{}: {}".format(path, result))
+                    increment_summary(path, result)
+                gated_documents, worker_cache_stats = pool.gated_documents, pool.result_cache_stats
+
+        elif multi_text or directory_files: # Run non-parallel multi-file classification
+            for path, result in classify_items(is_t1_classifier, directory_files or multi_text.items(), args.verbose, args.early_exit):
+                increment_summary(path, result)
+        elif stream: # Classify a single file incrementally.
+            with stream:
+                if args.verbose:
+                    result = is_t1_classifier.is_t1_verbose_stream(stream, errors='replace', early_exit=args.early_exit)
+                else:
+                    result = is_t1_classifier.is_t1_stream(stream, errors='replace', early_exit=args.early_exit)
+            increment_summary(args.text, result)
+        elif archive_files: # Classify the files of github archives one at a time as they are read.
+            for path, text in archive_files:
                 if args.verbose:
-                    result = is_t1_classifier.is_t1_verbose(text)
+                    result = is_t1_classifier.is_t1_verbose(text, early_exit=args.early_exit)
                 else:
-                    result = is_t1_classifier.is_t1(text)
+                    result = is_t1_classifier.is_t1(text, early_exit=args.early_exit)
+                print("{}: {}".format(path, result))
                 increment_summary(path, result)
         else: # Classify a single text block.
             if args.verbose:
-                result = is_t1_classifier.is_t1_verbose(text)
+                result = is_t1_classifier.is_t1_verbose(text, early_exit=args.early_exit)
             else:
-                result = is_t1_classifier.is_t1(text)
+                result = is_t1_classifier.is_t1(text, early_exit=args.early_exit)
             increment_summary("text", result)
 
+    summary_result['gated_documents'] = gated_documents + is_t1_classifier.gate_stats()['gated_documents']
+    if args.cache_results:
+        summary_result['result_cache'] = {name:count + (worker_cache_stats or {}).get(name, 0) for name, count in is_t1_classifier.result_cache_stats().items()}
+
     # == Clean up ==
     if args.save_to_file:
-        is_t1_classifier.save(args.save_to_file)
+        is_t1_classifier.save(args.save_to_file, args.save_format)
     elif args.save_to_blob:
         CONN_STR = os.environ['AZURE_STORAGE_CONNECTION_STRING']
         CONTAINER = os.environ['AZURE_STORAGE_CONTAINER']
-        is_t1_classifier.save_to_blob(CONN_STR, CONTAINER, args.save_to_blob)
+        is_t1_classifier.save_to_blob(CONN_STR, CONTAINER, args.save_to_blob, args.save_format)
 
-    print(f"{json.dumps(summary_result)}")
+    if args.jsonl:
+        write_line({'summary':summary_result})
+    else:
+        print(f"{json.dumps(summary_result, default=json_default)}")
     sys.exit(summary_result.get('t1_documents', 0))
\ No newline at end of file
@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import logging
+import threading
+from typing import IO, Callable
+import zipfile
+
+from .corpus_store import get_corpus_store
+from .helpers import is_acceptable_extension, fetch_zip
+
+# Access to the zips package corpora are trimmed from, shared by the packages whose corpora come from the same zip.  (Most packages have a zip of their own
+# release tag, but packages whose custom repo URIs link into one tag of a monorepo, e.g. azure-sdk-for-java or azure-cosmos-dotnet-v3, all share its zip.)
+#
+# An archive's member names are scanned once, when it is opened, into an index of the members that could be corpus files, so each package's corpus is
+# looked up in that index rather than by rescanning every member.  An ArchiveCache keeps recently opened archives by zip URI, so a zip shared by several
+# packages is fetched (or opened from the corpus store) and indexed once for all of them.
+
+CORPUS_PATH_MARKERS = ('/samples/', '/examples/', '/tests/', '/test/', 'README')
+MAX_OPEN_ARCHIVES = 4
+
+
+class PackageArchive:
+    """ A package zip (a binary file object), with an index of its members that could be corpus files.  Safe to read from several threads. """
+
+    def __init__(self, version_zip:IO):
+        self._zip = zipfile.ZipFile(version_zip, 'r')
+        # (name, path under the last /sdk/ or None) of each member with an acceptable extension under a corpus path, in zip order.
+        # TODO: The sdk/ match is very "rough", find the proper sdk/ path better+filter smarter; may want to add yaml and md to this.
+        # TODO: We may want to adjust this to take n.lower().contains('samples/') as well for situations like this if ends up not being an outlier. https://github.com/Azure/azure-cosmos-dotnet-v3/tree/releases/4.0.0-preview3/Microsoft.Azure.Cosmos.Samples
+        self._candidates = [(name, name.split('/sdk/')[-1] if '/sdk/' in name else None) for name in self._zip.namelist()
+                            if not name.endswith('/') and is_acceptable_extension(name) and any(marker in name for marker in CORPUS_PATH_MARKERS)]
+
+    def files(self, package:str, custom_subpath:str=None) -> list:
+        """ Returns the names of the corpus files of package; those under custom_subpath, or if None, under an sdk/ path naming package. """
+        if custom_subpath is not None:
+            return [name for name, _ in self._candidates if custom_subpath in name]
+        return [name for name, sdk_path in self._candidates if sdk_path is not None and package in sdk_path]
+
+    def corpus(self, package:str, custom_subpath:str=None) -> dict:
+        """ Returns the corpus of package (see files), as a dict of name to text. """
+        corpus = {}
+        for file in self.files(package, custom_subpath):
+            body = self._zip.read(file)
+            try:
+                corpus[file] = body.decode('UTF-8')
+            except:
+                try:
+                    corpus[file] = body.decode('unicode_escape')
+                except Exception as e:
+                    logging.getLogger(__name__).warning("Unable to read corpus file: {}; {}".format(file, e))
+        return corpus
+
+    def close(self):
+        fp = self._zip.fp
+        self._zip.close()
+        if fp:
+            fp.close()
+
+
+class ArchiveCache:
+    """ The most recently opened max_open archives, by zip URI, so packages sharing a zip fetch and index it once; concurrent opens of one zip wait for
+        the first rather than fetching it again.  Use as a context manager, or close().
+
+        An archive dropped from the cache isn't closed here, as other threads may still be reading it; it closes once the last of them lets it go. """
+
+    def __init__(self, max_open:int=MAX_OPEN_ARCHIVES):
+        self.max_open = max_open
+        self._archives = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def __enter__(self) -> "ArchiveCache":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self, zip_uri:str, downloader:"ZipDownloader"=None, use_raw_corpus_cache:bool=False) -> PackageArchive:
+        """ Returns the archive of the zip at zip_uri, or None if there is no such zip.  The zip is fetched as helpers.fetch_zip would, unless
+            use_raw_corpus_cache and it is in the corpus store, where it is stored when fetched if use_raw_corpus_cache. """
+        return self.get(zip_uri, lambda: open_archive(zip_uri, downloader, use_raw_corpus_cache))
+
+    def get(self, key:str, open_function:Callable[[], PackageArchive]) -> PackageArchive:
+        """ Returns the archive cached by key, opening it with open_function if it isn't; for archives from elsewhere than a zip URI. (e.g. a mirror's files) """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._archives:
+                    self._archives.move_to_end(key)
+                    return self._archives[key]
+            archive = open_function()
+            with self._lock:
+                self._archives[key] = archive
+                while len(self._archives) > self.max_open:
+                    self._archives.popitem(last=False)
+        return archive
+
+    def close(self):
+        with self._lock:
+            archives, self._archives = list(self._archives.values()), OrderedDict()
+        for archive in archives:
+            if archive:
+                archive.close()
+
+
+def open_archive(zip_uri:str, downloader:"ZipDownloader"=None, use_raw_corpus_cache:bool=False) -> PackageArchive:
+    """ As ArchiveCache.open, without sharing the archive. """
+    store = get_corpus_store() if use_raw_corpus_cache else None
+    cache_name = "archive_{}".format(zip_uri)
+    version_zip = store.open(cache_name) if store else None # Read from the store's file as needed, rather than into memory.
+    if version_zip:
+        logging.getLogger(__name__).info("Found in cache {}".format(zip_uri))
+        try:
+            return PackageArchive(version_zip)
+        except zipfile.BadZipFile: # e.g. cut short by a crash while it was stored; fetched again once, as if it was never cached.
+            version_zip.close()
+            logging.getLogger(__name__).warning("Discarding corrupt cached zip {}; fetching it again".format(zip_uri))
+            store.discard(cache_name)
+    version_zip = fetch_zip(zip_uri, downloader)
+    if not version_zip:
+        return None
+    if store:
+        store.put(cache_name, version_zip, compress=False) # Zips are stored as is, since they are already compressed.
+        version_zip.seek(0)
+    try:
+        return PackageArchive(version_zip)
+    except zipfile.BadZipFile:
+        version_zip.close()
+        if store:
+            store.discard(cache_name) # So the next run fetches it again, rather than failing on it.
+        raise
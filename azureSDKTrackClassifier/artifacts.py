@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+from .constants import Language
+from .helpers import get_apistubgen_path, write_file_atomically
+
+# Per-package training artifacts, so that retraining only fetches and tokenizes the packages that are new or changed since the last run.
+#
+# Layout of an artifacts directory:
+#   index.json             {"version": 2, "packages": {key: {"file": name, "fingerprint": str}}}
+#   {sha256(key)}.json.gz  {"key": key, "corpus_files": {name: text}, "tokens": [...], "versions": [...]}, as get_corpus_files_tokens_and_versions_for_one_package
+#                          returns, gzipped; corpus text compresses several times over, and the artifacts of every package ever trained on are kept.
+#
+# A package's key is its language and the release metadata fields its artifacts are derived from (see package_key); its fingerprint covers everything else
+# they depend on: its apistubgen file, if any, and ARTIFACTS_VERSION.  A package whose key is not in the index, or whose fingerprint differs, is stale.
+
+ARTIFACTS_VERSION = 2 # Bump whenever tokenization (or the layout above) changes, so that existing artifacts are rebuilt.
+INDEX_NAME = 'index.json'
+
+
+def package_key(each:dict, each_language:Language) -> str:
+    return json.dumps([Language(each_language).value, each['Package'], each['VersionGA'], each['VersionPreview'], each['RepoPath']])
+
+
+def _fingerprint(each:dict, each_language:Language) -> str:
+    digest = hashlib.sha256(str(ARTIFACTS_VERSION).encode('utf-8'))
+    try:
+        with open(get_apistubgen_path(each_language, each['Package'], each['VersionGA'] or each['VersionPreview']), 'rb') as f:
+            digest.update(f.read())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """ An artifacts directory (see above).  Changes to the index are only written by save. """
+
+    def __init__(self, path:str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(os.path.join(path, INDEX_NAME)) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        self._packages = index.get('packages', {}) if index.get('version') == ARTIFACTS_VERSION else {}
+        if index.get('version') != ARTIFACTS_VERSION:
+            for entry in index.get('packages', {}).values(): # Artifacts of an older version are rebuilt rather than read, so never used again.
+                try:
+                    os.remove(os.path.join(path, entry['file']))
+                except OSError:
+                    pass
+
+    def stale(self, metadata:list) -> list:
+        """ Returns the (release metadata, language) of metadata whose artifacts are missing or out of date, once each. """
+        stale = {}
+        for each, each_language in metadata:
+            key = package_key(each, each_language)
+            entry = self._packages.get(key)
+            if key not in stale and (entry is None or entry['fingerprint'] != _fingerprint(each, each_language) or not os.path.exists(os.path.join(self.path, entry['file']))):
+                stale[key] = (each, each_language)
+        return list(stale.values())
+
+    def put(self, each:dict, each_language:Language, corpus_files:dict, tokens:set, versions:set, complete:bool=True):
+        """ Stores a package's artifacts.  Incomplete ones (e.g. of a package whose corpus could not be fetched) are used, but stay stale. """
+        key = package_key(each, each_language)
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json.gz'
+        body = {'key':key, 'corpus_files':corpus_files, 'tokens':sorted(tokens), 'versions':sorted(versions)}
+        write_file_atomically(os.path.join(self.path, name), gzip.compress(json.dumps(body).encode('utf-8'), compresslevel=6, mtime=0))
+        self._packages[key] = {'file':name, 'fingerprint':_fingerprint(each, each_language) if complete else None}
+
+    def get(self, each:dict, each_language:Language) -> tuple:
+        """ Returns the (corpus_files, tokens, versions) stored for a package. """
+        with gzip.open(os.path.join(self.path, self._packages[package_key(each, each_language)]['file']), 'rt', encoding='utf-8') as f:
+            body = json.load(f)
+        return body['corpus_files'], set(body['tokens']), set(body['versions'])
+
+    def merge(self, metadata:list) -> tuple:
+        """ As helpers.get_corpus_files_tokens_and_versions_for_package, from stored artifacts. """
+        corpus_files = {}
+        tokens = set()
+        versions = set()
+        for each, each_language in metadata:
+            package_corpus_files, package_tokens, package_versions = self.get(each, each_language)
+            corpus_files.update(package_corpus_files)
+            tokens |= package_tokens
+            versions |= package_versions
+        return corpus_files, tokens, versions
+
+    def prune(self, languages:list, metadata:list) -> int:
+        """ Drops the artifacts of packages of languages that are no longer in metadata, returning how many were dropped. """
+        current = {package_key(each, each_language) for each, each_language in metadata}
+        languages = {Language(l).value for l in languages}
+        dropped = [key for key in self._packages if json.loads(key)[0] in languages and key not in current]
+        for key in dropped:
+            logging.getLogger(__name__).info("Pruning training artifacts of {}, which is no longer released".format(key))
+            try:
+                os.remove(os.path.join(self.path, self._packages.pop(key)['file']))
+            except OSError:
+                pass
+        return len(dropped)
+
+    def save(self):
+        write_file_atomically(os.path.join(self.path, INDEX_NAME), json.dumps({'version':ARTIFACTS_VERSION, 'packages':self._packages}, indent=1, sort_keys=True).encode('utf-8'))
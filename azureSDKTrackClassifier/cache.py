@@ -0,0 +1,147 @@
+from collections import OrderedDict
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+from typing import Callable, Iterable, Iterator
+
+import numpy
+
+from .helpers import json_default
+from .settings import Settings
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_STORED_ENTRIES = 1000000
+STORE_LOCK_TIMEOUT = 60 # Seconds to wait for another process's write to the store to finish.
+RESULT_CACHE_FILE_NAME = "classification_results.sqlite"
+
+
+class ResultCache:
+    """ Content-addressed cache of classification results.
+
+        Entries are keyed by a hash of the text, the kind of call that produced them, and the fingerprint of the trained model, so results
+        computed by a different model are never returned.  Holds at most max_entries results in memory (least recently used are evicted),
+        and if persistent, also stores them as JSON in a sqlite database under Settings.CACHE_BASE_PATH that survives across runs.  Opening the store
+        deletes the results of other models (which could never be returned again), and it holds at most max_stored_entries results, the oldest
+        written being deleted first. """
+
+    def __init__(self, model_fingerprint:str, max_entries:int=DEFAULT_MAX_ENTRIES, persistent:bool=False, path:str=None, max_stored_entries:int=DEFAULT_MAX_STORED_ENTRIES):
+        self._model_fingerprint = model_fingerprint
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._connection = None
+        if persistent:
+            path = path or os.path.join(Settings.CACHE_BASE_PATH, RESULT_CACHE_FILE_NAME)
+            self._connection = sqlite3.connect(path, timeout=STORE_LOCK_TIMEOUT, check_same_thread=False) # Parallel workers share the store, each waiting its turn to write.
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)")
+            with self._connection:
+                # substr rather than LIKE, as LIKE would treat any '_' or '%' in the fingerprint as a wildcard; BLOB values were pickled by earlier versions.
+                self._connection.execute("DELETE FROM results WHERE substr(key, 1, ?) != ? OR typeof(value) != 'text'", (len(model_fingerprint) + 1, model_fingerprint + ':'))
+            self._max_stored_entries = max_stored_entries
+            self._stored = self._trim()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {'memory_hits':self.memory_hits, 'disk_hits':self.disk_hits, 'hits':self.memory_hits + self.disk_hits, 'misses':self.misses, 'entries':len(self._entries)}
+
+    def key(self, kind:tuple, text:str) -> str:
+        digest = hashlib.sha256(text if isinstance(text, bytes) else text.encode('utf-8', 'surrogatepass'))
+        digest.update(repr(kind).encode('utf-8'))
+        return "{}:{}".format(self._model_fingerprint, digest.hexdigest())
+
+    def get(self, key:str):
+        """ Returns the cached result for key, or None. """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return self._entries[key]
+        if self._connection:
+            row = self._connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.disk_hits += 1
+                value = _decode(row[0])
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key:str, value):
+        self.put_many([(key, value)])
+
+    def put_many(self, items:list):
+        """ Caches each (key, value) of items; if persistent, they are written in a single transaction. """
+        for key, value in items:
+            self._remember(key, value)
+        if self._connection and items:
+            with self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", [(key, json.dumps(value, default=json_default)) for key, value in items])
+            self._stored += len(items) # An overestimate when keys are replaced, which only makes the next trim come early.
+            if self._stored > self._max_stored_entries:
+                self._stored = self._trim()
+
+    def _trim(self) -> int:
+        """ Deletes the oldest written results beyond max_stored_entries, and returns how many are left. """
+        with self._connection:
+            # INSERT OR REPLACE gives a replaced row a new rowid, so rowid order is the order results were last written in.
+            self._connection.execute("DELETE FROM results WHERE rowid <= (SELECT rowid FROM results ORDER BY rowid DESC LIMIT 1 OFFSET ?)", (self._max_stored_entries,))
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _remember(self, key:str, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, kind:tuple, text:str, compute:Callable):
+        key = self.key(kind, text)
+        result = self.get(key)
+        if result is None:
+            result = compute(text)
+            self.put(key, result)
+        return _copy(result)
+
+    def map_many(self, kind:tuple, texts:Iterable[str], compute_many:Callable, batch_size:int) -> Iterator:
+        """ Yields cached or computed results for texts in input order.  Misses are computed batch_size texts at a time with a single call to compute_many,
+            and texts duplicated within a batch are only computed once; each batch's results are stored together. """
+        texts = iter(texts)
+        while True:
+            batch = list(itertools.islice(texts, batch_size))
+            if not batch:
+                return
+            keys = [self.key(kind, text) for text in batch]
+            results = {}
+            for key in keys:
+                if key in results:
+                    self.memory_hits += 1 # Duplicate within the batch; served by the first occurrence's result.
+                else:
+                    results[key] = self.get(key)
+            missing = {key:text for key, text in zip(keys, batch) if results[key] is None}
+            computed = list(zip(missing.keys(), compute_many(missing.values())))
+            self.put_many(computed) # One transaction per batch rather than per miss.
+            results.update(computed)
+            for key in keys:
+                yield _copy(results[key])
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+def _decode(value:str):
+    result = json.loads(value)
+    if isinstance(result, dict):
+        result['ml_result_probability'] = numpy.array(result['ml_result_probability'])
+    return result
+
+
+def _copy(result):
+    # Verbose results are dicts; hand out copies so callers mutating them (or the probability array inside them) can't corrupt the cache.
+    if not isinstance(result, dict):
+        return result
+    result = dict(result)
+    result['ml_result_probability'] = result['ml_result_probability'].copy()
+    return result
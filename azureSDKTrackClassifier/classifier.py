@@ -1,10 +1,11 @@
 from enum import Enum
 import pickle
+from typing import IO, Iterable, Iterator, Union
 
-from azure.storage.blob import BlobServiceClient
-from azure.core.exceptions import ResourceExistsError
-
-from .model import train_model
+from .cache import ResultCache, DEFAULT_MAX_ENTRIES
+from .model import train_model, BATCH_SIZE
+from .model_file import dump_model, is_compact_model, load_model, load_model_file, MAGIC, COMPACT_FORMAT, PICKLE_FORMAT
+from .tokenizers import CHUNK_SIZE
 from .constants import Language
 
 
@@ -18,36 +19,139 @@ class AzureSDKTrackClassifier: # Someone with more sense than me can rename this
             Pretrained models may be saved and loaded to save training time."""
         self._language, self._service = language, service
         self._trained_model = train_model(language, service)
+        self._result_cache = None
+
+    def __getstate__(self):
+        # The result cache is per-process state (and may hold a database connection), so is never saved with the model.
+        state = self.__dict__.copy()
+        state['_result_cache'] = None
+        return state
+
+    def enable_result_cache(self, max_entries:int=DEFAULT_MAX_ENTRIES, persistent:bool=False, path:str=None):
+        """ Caches the results of is_t1, is_t1_verbose and their batch counterparts, keyed by a hash of the text and a fingerprint of this model.
+            Up to max_entries results are kept in memory.  If persistent, results are also stored on disk (under Settings.CACHE_BASE_PATH unless a path is given)
+            and reused across runs for as long as the same model is used."""
+        self.disable_result_cache()
+        self._result_cache = ResultCache(self._trained_model.fingerprint(), max_entries, persistent, path)
+
+    def disable_result_cache(self):
+        if getattr(self, '_result_cache', None):
+            self._result_cache.close()
+        self._result_cache = None
+
+    def result_cache_stats(self) -> dict:
+        """ Returns the hit and miss counters of the result cache, or None if it is not enabled. """
+        cache = getattr(self, '_result_cache', None)
+        return cache.stats() if cache else None
+
+    def gate_stats(self) -> dict:
+        """ Returns how many documents were found not T1 by the relevance gate alone (containing none of the model's tokens or versions), in this process. """
+        return self._trained_model.gate_stats()
 
-    def is_t1(self, text:str) -> bool:
-        """ Classify given text as containing T1 content """
-        return self._trained_model.classify(text)
+    def is_t1(self, text:str, early_exit:bool=False) -> bool:
+        """ Classify given text as containing T1 content
 
-    def is_t1_verbose(self, text:str, extra_verbosity:bool=False) -> dict:
+            early_exit stops processing the text as soon as the rest of it could no longer change the result, which is faster for bulk triage.
+        """
+        cache = getattr(self, '_result_cache', None)
+        if cache:
+            return cache.get_or_compute(('is_t1', early_exit), text, lambda t: self._trained_model.classify(t, early_exit))
+        return self._trained_model.classify(text, early_exit)
+
+    def is_t1_verbose(self, text:str, extra_verbosity:bool=False, early_exit:bool=False) -> dict:
         """ Classify given text as containing T1 content, returning a dictionary containing not only the result but supplementary metadata used for classification. 
 
             extra_verbosity outputs to logging the new and old tokens that were detected.
+            early_exit behaves as in is_t1; the counts returned are then those of the processed part of the text, and 'early_exit_skipped_fraction' reports how much was skipped.
+        """
+        cache = getattr(self, '_result_cache', None)
+        if cache and not extra_verbosity: # Extra verbosity is for its logging, which a cached result would skip.
+            return cache.get_or_compute(('is_t1_verbose', early_exit), text, lambda t: self._trained_model.classify_verbose(t, False, early_exit))
+        return self._trained_model.classify_verbose(text, extra_verbosity, early_exit)
+
+    def is_t1_many(self, texts:Iterable[str], early_exit:bool=False) -> Iterator[bool]:
+        """ Classify each of the given texts as containing T1 content, yielding results in input order. """
+        cache = getattr(self, '_result_cache', None)
+        if cache:
+            return cache.map_many(('is_t1', early_exit), texts, lambda misses: self._trained_model.classify_many(misses, early_exit), BATCH_SIZE)
+        return self._trained_model.classify_many(texts, early_exit)
+
+    def is_t1_verbose_many(self, texts:Iterable[str], extra_verbosity:bool=False, batch_size:int=BATCH_SIZE) -> Iterator[dict]:
+        """ Classify each of the given texts as containing T1 content, yielding the same dictionaries as is_t1_verbose in input order.
+            Texts are featurized and run through the model batch_size at a time, which is much faster than calling is_t1_verbose per text.
         """
-        return self._trained_model.classify_verbose(text, extra_verbosity)
+        cache = getattr(self, '_result_cache', None)
+        if cache and not extra_verbosity:
+            return cache.map_many(('is_t1_verbose', False), texts, lambda misses: self._trained_model.classify_verbose_many(misses, False, batch_size), batch_size)
+        return self._trained_model.classify_verbose_many(texts, extra_verbosity, batch_size)
 
-    def save(self, path:str = None) -> str:
+    def is_t1_stream(self, source:Union[IO, bytes, "mmap.mmap"], chunk_size:int=CHUNK_SIZE, encoding:str='utf-8', errors:str='strict', early_exit:bool=False) -> bool:
+        """ Classify the text read from a file object (text or binary), bytes or mmap as containing T1 content.
+            The input is tokenized chunk_size at a time so memory stays bounded regardless of its size; results are identical to is_t1 on the whole (decoded) text.
+        """
+        return self._trained_model.classify_stream(source, chunk_size=chunk_size, encoding=encoding, errors=errors, early_exit=early_exit)
+
+    def is_t1_verbose_stream(self, source:Union[IO, bytes, "mmap.mmap"], extra_verbosity:bool=False, chunk_size:int=CHUNK_SIZE, encoding:str='utf-8', errors:str='strict', early_exit:bool=False) -> dict:
+        """ Streaming counterpart of is_t1_verbose; see is_t1_stream. """
+        return self._trained_model.classify_verbose_stream(source, extra_verbosity, chunk_size=chunk_size, encoding=encoding, errors=errors, early_exit=early_exit)
+
+    @staticmethod
+    def _from_trained_model(trained_model:"_TrainedModel", language:Language = None, service:str = None) -> "AzureSDKTrackClassifier":
+        classifier = AzureSDKTrackClassifier.__new__(AzureSDKTrackClassifier) # Bypasses __init__, which would train.
+        classifier._language, classifier._service = Language(language) if language else None, service
+        classifier._trained_model = trained_model
+        classifier._result_cache = None
+        return classifier
+
+    def _default_file_name(self) -> str:
+        # As registry.model_file_name, so saved models can be served from a registry directory as they are.
+        return 'azureSDKTrackClassifier_{}_{}.model'.format(Language(self._language).value if self._language else None, self._service)
+
+    def _dumps(self, model_format:str) -> bytes:
+        if model_format == COMPACT_FORMAT:
+            return dump_model(self._trained_model, {'language':self._language, 'service':self._service})
+        elif model_format == PICKLE_FORMAT:
+            return pickle.dumps(self)
+        raise ValueError("Unknown model format: {} (expected one of {}, {})".format(model_format, PICKLE_FORMAT, COMPACT_FORMAT))
+
+    @staticmethod
+    def _loads(data:bytes) -> "AzureSDKTrackClassifier":
+        if is_compact_model(data):
+            trained_model, metadata = load_model(data)
+            return AzureSDKTrackClassifier._from_trained_model(trained_model, metadata.get('language'), metadata.get('service'))
+        return pickle.loads(data)
+
+    def save(self, path:str = None, model_format:str = PICKLE_FORMAT) -> str:
         """ Saves the model to a file.
-            The file will be located at the path parameter if provided, otherwise, in the local directory."""
-        path = path or 'azureSDKTrackClassifier_{}_{}.model'.format(self._language, self._service)
+            The file will be located at the path parameter if provided, otherwise, in the local directory.
+            
+            model_format may be 'pickle' (the whole classifier object), or 'compact', a smaller versioned format that is loaded via mmap and does not
+            depend on the installed sklearn version; loaded with shared=True, it opens near-instantly and shares its pages between processes."""
+        path = path or self._default_file_name()
         with open(path, 'wb') as f:
-            pickle.dump(self, f)
+            f.write(self._dumps(model_format))
             return path
 
     @staticmethod
-    def load(path:str) -> "AzureSDKTrackClassifier":
-        """ Loads the model from a file located at the specified path."""
+    def load(path:str, shared:bool=False) -> "AzureSDKTrackClassifier":
+        """ Loads the model from a file located at the specified path.  Either model format is detected automatically.
+
+            shared (compact format only) uses the token index and MLP weights in place from the mmapped file rather than building the index in memory, so any number of
+            processes loading the same file share a single copy of it.  Classification is somewhat slower per document; intended for parallel workers.
+            Each process still builds its own version matcher and relevance gate from the version tables: about 9 MB of memory for 10,000 versions."""
         with open(path, 'rb') as f:
-            return pickle.load(f)
+            if not is_compact_model(f.read(len(MAGIC))):
+                f.seek(0)
+                return pickle.load(f)
+        trained_model, metadata = load_model_file(path, shared)
+        return AzureSDKTrackClassifier._from_trained_model(trained_model, metadata.get('language'), metadata.get('service'))
 
-    def save_to_blob(self, connection_string:str, container:str, path:str = None) -> str:
+    def save_to_blob(self, connection_string:str, container:str, path:str = None, model_format:str = PICKLE_FORMAT) -> str:
         """ Saves the model to an azure storage blob.
-            The file will be located at the container and path parameter if provided, otherwise, in the root of the container."""
-        path = path or 'azureSDKTrackClassifier_{}_{}.model'.format(self._language, self._service)
+            The file will be located at the container and path parameter if provided, otherwise, in the root of the container.  See save for model_format."""
+        from azure.storage.blob import BlobServiceClient # Imported on use, as most consumers never touch blob storage.
+        from azure.core.exceptions import ResourceExistsError
+        path = path or self._default_file_name()
         if 'sig=' in connection_string and 'AccountKey=' not in connection_string: # SAS signature.
             service_client = BlobServiceClient(connection_string)
         else:
@@ -57,15 +161,16 @@ class AzureSDKTrackClassifier: # Someone with more sense than me can rename this
         except ResourceExistsError:
             pass
         blob_client = service_client.get_blob_client(container, path)
-        blob_client.upload_blob(pickle.dumps(self), overwrite=True)
+        blob_client.upload_blob(self._dumps(model_format), overwrite=True)
         return path
 
     @staticmethod
     def load_from_blob(connection_string:str, container:str, path:str) -> "AzureSDKTrackClassifier":
         """ Loads the model from an azure storage blob located at the specified path."""
+        from azure.storage.blob import BlobServiceClient
         if 'sig=' in connection_string and 'AccountKey=' not in connection_string: # SAS signature.
             service_client = BlobServiceClient(connection_string)
         else:
             service_client = BlobServiceClient.from_connection_string(conn_str=connection_string)
         blob_client = service_client.get_blob_client(container, path)
-        return pickle.loads(blob_client.download_blob().content_as_bytes())
+        return AzureSDKTrackClassifier._loads(blob_client.download_blob().content_as_bytes())
@@ -3,9 +3,8 @@ import io
 from azureSDKTrackClassifier.constants import Language
 from azureSDKTrackClassifier.helpers import is_markdown, is_code, is_yaml
 
-import exdown
-
 def extract_and_label_codefences(text:str, service:str=None, language:str=None):
+    import exdown # Imported on use, since only needed when obeying code fences.
     targeted_content = []
     seen_blocks = set()
     for known_language, md_language in {Language.python : "python", \
@@ -0,0 +1,155 @@
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import IO, Union
+import zlib
+
+from .settings import Settings
+
+# Disk cache of training corpora (trimmed corpora, and optionally raw zips, see helpers.get_corpus_for_package; and apistubgen tokens), under Settings.CACHE_BASE_PATH/corpus_store.
+#
+# Entries are files named by a hash of their name, gzipped unless already compressed, and written to a temporary file then renamed into place, so an
+# interrupted run never leaves a partial entry.  An sqlite index records each entry's size and last access; once the entries exceed the byte budget
+# (Settings.CORPUS_CACHE_MAX_BYTES), the least recently used are evicted.  An entry whose file doesn't match the index, or doesn't decompress, is
+# dropped (with a warning) and refetched rather than silently ignored.
+
+STORE_DIRECTORY_NAME = "corpus_store"
+INDEX_NAME = "index.sqlite"
+_COPY_CHUNK_SIZE = 1 << 20
+
+
+class CorpusStore:
+    """ A size-budgeted, least-recently-used store of named binary entries (see above).  Safe to use from several threads. """
+
+    def __init__(self, path:str, max_bytes:int):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, INDEX_NAME), check_same_thread=False, timeout=60)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, file TEXT, compressed INTEGER, size INTEGER, last_access REAL)")
+
+    def open(self, name:str) -> IO:
+        """ Returns the entry called name as a binary file object (decompressing as it is read, if compressed), or None if there is no such entry. """
+        with self._lock:
+            row = self._connection.execute("SELECT file, compressed, size FROM entries WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            file, compressed, size = row
+            file_path = os.path.join(self.path, file)
+            try:
+                f = gzip.open(file_path, 'rb') if compressed else open(file_path, 'rb')
+                matches = os.path.getsize(file_path) == size
+            except OSError:
+                f, matches = None, False
+            if not matches:
+                if f:
+                    f.close()
+                logging.getLogger(__name__).warning("Dropping corpus cache entry {}; its file does not match the index".format(name))
+                self._remove(name, file)
+                return None
+            with self._connection:
+                self._connection.execute("UPDATE entries SET last_access = ? WHERE name = ?", (time.time(), name))
+        return f
+
+    def read(self, name:str) -> bytes:
+        """ Returns the whole contents of the entry called name, or None if there is no such entry or it is corrupt (in which case it is dropped). """
+        f = self.open(name)
+        if f is None:
+            return None
+        try:
+            with f:
+                return f.read()
+        except (OSError, EOFError, zlib.error) as e:
+            logging.getLogger(__name__).warning("Dropping corpus cache entry {}; {}".format(name, e))
+            self.discard(name)
+            return None
+
+    def put(self, name:str, source:Union[bytes, IO], compress:bool=True):
+        """ Stores source (bytes, or a binary file object, read from its current position to its end) as the entry called name, gzipped if compress,
+            then evicts the least recently used entries while the store is over its budget.  Entries larger than the whole budget are not stored. """
+        file = hashlib.sha256(name.encode('utf-8')).hexdigest() + ('.gz' if compress else '')
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix='.partial-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with (gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0) if compress else _Unclosed(f)) as destination:
+                    if isinstance(source, bytes):
+                        destination.write(source)
+                    else:
+                        shutil.copyfileobj(source, destination, _COPY_CHUNK_SIZE)
+                size = f.tell()
+            if size > self.max_bytes:
+                logging.getLogger(__name__).info("Not caching {}; {} bytes is over the corpus cache budget".format(name, size))
+                os.remove(temp_path)
+                return
+            with self._lock:
+                os.replace(temp_path, os.path.join(self.path, file))
+                with self._connection:
+                    self._connection.execute("INSERT OR REPLACE INTO entries (name, file, compressed, size, last_access) VALUES (?, ?, ?, ?, ?)", (name, file, int(compress), size, time.time()))
+                self._evict()
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def discard(self, name:str):
+        with self._lock:
+            row = self._connection.execute("SELECT file FROM entries WHERE name = ?", (name,)).fetchone()
+            if row:
+                self._remove(name, row[0])
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for name, file, size in self._connection.execute("SELECT name, file, size FROM entries ORDER BY last_access").fetchall():
+            logging.getLogger(__name__).info("Evicting {} from the corpus cache".format(name))
+            self._remove(name, file)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _remove(self, name:str, file:str):
+        with self._connection:
+            self._connection.execute("DELETE FROM entries WHERE name = ?", (name,))
+        try:
+            os.remove(os.path.join(self.path, file))
+        except OSError:
+            pass
+
+    def close(self):
+        self._connection.close()
+
+
+class _Unclosed:
+    """ Lets an uncompressed destination be used like the GzipFile wrapping a compressed one, without closing the file underneath. """
+    def __init__(self, f):
+        self.write = f.write
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        pass
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+def get_corpus_store() -> CorpusStore:
+    """ Returns the store under the current Settings.CACHE_BASE_PATH, with the current Settings.CORPUS_CACHE_MAX_BYTES budget. """
+    path = os.path.join(Settings.CACHE_BASE_PATH, STORE_DIRECTORY_NAME)
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = CorpusStore(path, Settings.CORPUS_CACHE_MAX_BYTES)
+        _STORES[path].max_bytes = Settings.CORPUS_CACHE_MAX_BYTES
+        return _STORES[path]
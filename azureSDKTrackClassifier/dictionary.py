@@ -0,0 +1,100 @@
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import Callable, Iterable
+
+from .helpers import check_in_english_dictionary
+from .settings import Settings
+
+DICTIONARY_CACHE_FILE_NAME = "english_dictionary.sqlite"
+_QUERY_BATCH_SIZE = 500 # Words per query when reading cached verdicts. (Below sqlite's default limit on bound parameters.)
+
+
+def _enchant_identity() -> str:
+    import enchant
+    dictionary = enchant.Dict("en_US")
+    return "enchant:{}:{}:{}:{}".format(enchant.__version__, dictionary.tag, dictionary.provider.name, dictionary.provider.file)
+
+
+def _is_storable(word:str) -> bool:
+    try:
+        word.encode('utf-8')
+        return True
+    except UnicodeEncodeError: # Lone surrogates, from corpus files decoded with unicode_escape.
+        return False
+
+
+class EnglishDictionary:
+    """ The English dictionary check used to prune tokens during training, answering for many words at once.
+
+        By default words are checked with pyenchant (see helpers.check_in_english_dictionary), and each verdict is persisted in a sqlite database under
+        Settings.CACHE_BASE_PATH keyed by the identity of the dictionary (pyenchant version, tag and provider), so a word is only ever checked once per
+        dictionary; later runs only check words they haven't seen.  If wordlist_path is given (one word per line; see export_wordlist), a word is English
+        iff it is in that file, and pyenchant is not needed at all.
+
+        check and identity replace pyenchant with another dictionary, given as a function of a word and a name for its verdicts in the cache. """
+
+    def __init__(self, wordlist_path:str=None, cache_path:str=None, check:Callable=None, identity:str=None):
+        self._words = None
+        self._connection = None
+        if wordlist_path:
+            with open(wordlist_path, 'rb') as f:
+                body = f.read()
+            self.identity = "wordlist:" + hashlib.sha256(body).hexdigest()
+            self._words = frozenset(body.decode('utf-8', 'surrogatepass').split('\n')) - {''}
+            return
+        self._check = check or check_in_english_dictionary
+        self.identity = identity or _enchant_identity()
+        self._connection = sqlite3.connect(cache_path or os.path.join(Settings.CACHE_BASE_PATH, DICTIONARY_CACHE_FILE_NAME))
+        self._connection.execute("CREATE TABLE IF NOT EXISTS words (dictionary TEXT, word TEXT, english INTEGER, PRIMARY KEY (dictionary, word))")
+
+    def english_words(self, words:Iterable[str]) -> set:
+        """ Returns those of words that are in the dictionary. """
+        words = set(words)
+        if self._words is not None:
+            return words & self._words
+        verdicts = {}
+        ordered = [word for word in words if _is_storable(word)]
+        unstorable = words.difference(ordered) # Checked every time; sqlite can't hold them.
+        for start in range(0, len(ordered), _QUERY_BATCH_SIZE):
+            batch = ordered[start:start + _QUERY_BATCH_SIZE]
+            verdicts.update(self._connection.execute("SELECT word, english FROM words WHERE dictionary = ? AND word IN ({})".format(','.join('?' * len(batch))),
+                                                     [self.identity] + batch).fetchall())
+        unseen = [word for word in ordered if word not in verdicts]
+        if unseen:
+            logging.getLogger(__name__).info("Checking {} of {} words not yet seen by dictionary {}".format(len(unseen), len(ordered), self.identity))
+            new_verdicts = [(word, int(bool(self._check(word)))) for word in unseen]
+            with self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO words (dictionary, word, english) VALUES (?, ?, ?)", [(self.identity, word, english) for word, english in new_verdicts])
+            verdicts.update(new_verdicts)
+        return {word for word, english in verdicts.items() if english} | {word for word in unstorable if self._check(word)}
+
+    def export_wordlist(self, path:str) -> int:
+        """ Writes the words known to be English (those seen so far, for a cached dictionary) to path as a wordlist for wordlist_path, returning how many.
+            Training with it then prunes exactly as this dictionary did, for every word this dictionary has seen. """
+        if self._words is not None:
+            words = self._words
+        else:
+            words = [word for word, in self._connection.execute("SELECT word FROM words WHERE dictionary = ? AND english = 1", (self.identity,))]
+        with open(path, 'wb') as f:
+            f.write(''.join(word + '\n' for word in sorted(words)).encode('utf-8', 'surrogatepass'))
+        return len(words)
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage the English dictionary used to prune tokens during training.', prog='azureSDKTrackClassifier.dictionary')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    freeze = subparsers.add_parser('freeze', help='Write the words found English by pyenchant during training (with this cache path) to a wordlist, for training without pyenchant. (See --set-english-wordlist)')
+    freeze.add_argument('path', type=str, help='The wordlist file to write.')
+    freeze.add_argument('--set-cache-path', type=str, default='.', help='The cache path used when training.')
+
+    args = parser.parse_args()
+    Settings.CACHE_BASE_PATH = args.set_cache_path
+    dictionary = EnglishDictionary()
+    print("Wrote {} words to {}".format(dictionary.export_wordlist(args.path), args.path))
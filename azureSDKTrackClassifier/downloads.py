@@ -0,0 +1,121 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import tempfile
+import threading
+import time
+from typing import IO
+from urllib.parse import urlsplit
+import zipfile
+
+from .archives import ArchiveCache
+from .helpers import get_corpus_arguments, get_corpus_for_package, get_package_zip_uri_and_subpath, log_missing_training_corpus
+from .settings import Settings
+
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+RETRY_BACKOFF = 0.5 # Seconds before the first retry; doubled for each retry after.
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ZipDownloader:
+    """ Fetches zips through one pooled HTTP session, from any number of threads.
+
+        At most per_host_concurrency requests go to any one host at a time (the pool itself is sized for concurrency threads).  Failed requests (connection
+        errors, stalls of more than timeout seconds, bodies cut short) and 429/5xx responses are retried up to retries times with exponential backoff, honoring
+        Retry-After.  Downloads are spooled to temporary files. """
+
+    def __init__(self, concurrency:int=None, per_host_concurrency:int=None, retries:int=None, backoff:float=RETRY_BACKOFF, timeout:float=None):
+        import requests # Imported on use, as most consumers never download.
+        from requests.adapters import HTTPAdapter
+        self.concurrency = concurrency or Settings.DOWNLOAD_CONCURRENCY
+        self._per_host_concurrency = per_host_concurrency or Settings.DOWNLOAD_PER_HOST_CONCURRENCY
+        self._retries = Settings.DOWNLOAD_RETRIES if retries is None else retries
+        self._backoff = backoff
+        self._timeout = timeout or Settings.DOWNLOAD_TIMEOUT # requests has no default, so a stalled connection would otherwise hang forever.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self._per_host_concurrency))
+        self._host_slots_lock = threading.Lock()
+
+    def _host_slot(self, uri:str) -> threading.BoundedSemaphore:
+        with self._host_slots_lock:
+            return self._host_slots[urlsplit(uri).netloc]
+
+    def _get(self, uri:str) -> IO:
+        """ Returns the body at uri spooled to a temporary file, or None if it is 404. """
+        import requests
+        for attempt in range(self._retries + 1):
+            delay = self._backoff * 2 ** attempt
+            try:
+                with self._host_slot(uri), self._session.get(uri, stream=True, timeout=self._timeout) as response:
+                    if response.status_code == 404:
+                        return None
+                    if response.status_code not in _RETRY_STATUSES:
+                        response.raise_for_status()
+                        spool, complete = tempfile.TemporaryFile(), False
+                        try:
+                            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                                spool.write(chunk)
+                            spool.seek(0)
+                            complete = True
+                            return spool
+                        finally:
+                            if not complete: # Don't leak the partial download of a failed attempt.
+                                spool.close()
+                    if attempt == self._retries:
+                        response.raise_for_status()
+                    retry_after = response.headers.get('Retry-After', '')
+                    delay = max(delay, float(retry_after)) if retry_after.isdigit() else delay
+            except requests.HTTPError:
+                raise # Only the statuses above are worth retrying.
+            except requests.RequestException as e: # Including a body cut short. (ChunkedEncodingError)
+                if attempt == self._retries:
+                    raise
+                logging.getLogger(__name__).info("Retrying {} after {}".format(uri, e))
+            time.sleep(delay)
+
+    def fetch(self, zip_uri:str) -> IO:
+        """ Returns the zip at zip_uri as a temporary file, or None if there is no such zip.  (Trying main.zip if master.zip does not exist, as do_github_zip_request.) """
+        version_zip = self._get(zip_uri)
+        if version_zip is None and 'master.zip' in zip_uri:
+            version_zip = self._get(zip_uri.replace('master.zip', 'main.zip'))
+        return version_zip
+
+    def close(self):
+        self._session.close()
+
+
+def prefetch_corpora(metadata:list, downloader:ZipDownloader=None, failed:set=None) -> dict:
+    """ Fetches the corpora of all the packages in metadata (a list of (release metadata, language) as used by train_model) concurrently,
+        returning them keyed by helpers.get_corpus_arguments, for get_corpus_files_tokens_and_versions_for_package.
+        Each zip is trimmed to its corpus (and cached, as get_corpus_for_package) as soon as it arrives, so only the trimmed corpora (and the few zips
+        most recently fetched, spooled to disk; see archives.ArchiveCache) are kept.
+        A package whose zip can't be fetched (once out of retries) or read is logged, and recorded as missing (see log_missing_training_corpus) with an empty
+        corpus, rather than failing the whole run; if failed is given, its arguments are added to it. """
+    owns_downloader = downloader is None
+    downloader = downloader or ZipDownloader()
+    packages = list(dict.fromkeys(get_corpus_arguments(each, each_language) for each, each_language in metadata)) # Unique, in order.
+    # Packages sharing a zip are fetched together, so it is fetched and indexed once and is still open for each of them.
+    zip_uris = {arguments:get_package_zip_uri_and_subpath(*arguments)[0] for arguments in packages}
+    try:
+        with ArchiveCache() as archives, ThreadPoolExecutor(downloader.concurrency) as executor:
+            ordered = sorted(packages, key=lambda arguments: zip_uris[arguments])
+            corpora = dict(zip(ordered, executor.map(lambda arguments: _fetch_corpus(arguments, downloader, archives, failed), ordered)))
+            return {arguments:corpora[arguments] for arguments in packages}
+    finally:
+        if owns_downloader:
+            downloader.close()
+
+
+def _fetch_corpus(arguments:tuple, downloader:ZipDownloader, archives:ArchiveCache, failed:set) -> dict:
+    try:
+        return get_corpus_for_package(*arguments, downloader=downloader, archives=archives)
+    except (OSError, zipfile.BadZipFile) as e: # requests' exceptions are OSErrors.
+        repo, package, version, _ = arguments
+        logging.getLogger(__name__).warning("Failed to fetch the corpus of {} {} {}; {}".format(repo, package, version, e))
+        log_missing_training_corpus(get_package_zip_uri_and_subpath(*arguments)[0], repo, package, version)
+        if failed is not None:
+            failed.add(arguments) # Sets are safe to add to from several threads.
+        return {}
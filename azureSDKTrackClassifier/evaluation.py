@@ -0,0 +1,128 @@
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+
+from .constants import Language
+from .helpers import write_file_atomically
+from .settings import Settings
+
+# Model selection, kept apart from training: cross-validates candidate classifiers on a training set, folds and candidates in parallel, and records the
+# results in a history file (one JSON record per run; see record_history) to check against regressions.
+#
+#   python -m azureSDKTrackClassifier.evaluation --language dotnet --n-jobs -1
+#
+# Building the training set (fetching, tokenizing and featurizing corpora) is the slow part, so the feature matrix is cached under Settings.CACHE_BASE_PATH
+# per language, service and data source (an offline mirror's manifest, or 'online'), and reused by later evaluations until rebuilt.
+
+DEFAULT_FOLDS = 10
+DEFAULT_HISTORY_PATH = os.path.join('Experiments', 'TestScoreHistory.jsonl')
+
+
+def default_candidates() -> list:
+    """ The classifiers that experimentally seemed to perform best on the style of feature vectors we use. """
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.svm import SVC
+    # (Tested RandomForest (which is more advised for if this went a multi-class approach), KNeighborsClassifier, Linear SVM, RBF SVM, Neural Net, Naive Bayes)
+    # MLP and Linear SVC are most promising.  RBF/Kneighbors may be good with more training data, or if we find eccentricities in real world results that benefit from how they classify.
+    return [KNeighborsClassifier(), # Performs least well but _may_ give some good extrapolative properties.  Leaving in for testing.
+            SVC(kernel="linear"),
+            SVC(gamma=.5),
+            MLPClassifier(solver='lbfgs', max_iter=1000)]
+
+
+def _score_fold(candidate, vectors, classes, train, test) -> float:
+    from sklearn.base import clone
+    return clone(candidate).fit(vectors[train], classes[train]).score(vectors[test], classes[test])
+
+
+def evaluate(vectors:list, classes:list, candidates:list=None, folds:int=DEFAULT_FOLDS, n_jobs:int=None) -> list:
+    """ Returns the accuracy of each of candidates (default_candidates if None) over folds stratified folds of vectors and classes, as cross_val_score would
+        score them, as a list of {'classifier', 'accuracy_mean', 'accuracy_std', 'fold_scores'}.  Every fold of every candidate is fitted in parallel on
+        n_jobs processes (joblib's convention: None is 1, -1 is all cores). """
+    import numpy
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import StratifiedKFold
+    candidates = default_candidates() if candidates is None else candidates
+    vectors, classes = numpy.asarray(vectors), numpy.asarray(classes)
+    splits = list(StratifiedKFold(folds).split(vectors, classes))
+    scores = Parallel(n_jobs=n_jobs)(delayed(_score_fold)(candidate, vectors, classes, train, test) for candidate in candidates for train, test in splits)
+    results = []
+    for index, candidate in enumerate(candidates):
+        fold_scores = numpy.array(scores[index * folds:(index + 1) * folds])
+        results.append({'classifier':str(candidate), 'accuracy_mean':float(fold_scores.mean()), 'accuracy_std':float(fold_scores.std()), 'fold_scores':fold_scores.tolist()})
+    return results
+
+
+def log_results(results:list, samples:int=None):
+    for result in results:
+        logging.getLogger(__name__).info("%s Accuracy: %0.2f (+/- %0.2f)%s" % (result['classifier'], result['accuracy_mean'], result['accuracy_std'] * 2, " N={}".format(samples) if samples else ""))
+
+
+def _data_source() -> str:
+    if not Settings.OFFLINE_MIRROR_PATH:
+        return 'online'
+    from .mirror import MANIFEST_NAME
+    with open(os.path.join(Settings.OFFLINE_MIRROR_PATH, MANIFEST_NAME), 'rb') as f:
+        return 'mirror-' + hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+def feature_matrix(language:Language=None, service:str=None, rebuild:bool=False) -> tuple:
+    """ Returns the (vectors, classes) that train_model would train with for language and service, from the cache unless rebuild. """
+    import numpy
+    path = os.path.join(Settings.CACHE_BASE_PATH, "feature_matrix_{}_{}_{}.npz".format(Language(language).value if language else None, service, _data_source()))
+    if not rebuild and os.path.exists(path):
+        logging.getLogger(__name__).info("Found feature matrix in cache: {}".format(path))
+        with numpy.load(path) as cached:
+            return cached['vectors'], cached['classes']
+    from .model import build_training_set
+    _, vectors, classes = build_training_set(language, service)
+    vectors, classes = numpy.asarray(vectors, dtype=float), numpy.asarray(classes, dtype=str)
+    buffer = io.BytesIO()
+    numpy.savez(buffer, vectors=vectors, classes=classes)
+    write_file_atomically(path, buffer.getvalue())
+    return vectors, classes
+
+
+def record_history(path:str, language:Language, service:str, samples:int, folds:int, results:list, note:str=None) -> dict:
+    """ Appends one run's results to the history file at path, returning the record written. """
+    record = {'timestamp':datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+              'language':Language(language).value if language else None, 'service':service,
+              'samples':samples, 'folds':folds, 'results':results}
+    if note:
+        record['note'] = note
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cross-validate candidate classifiers on the training set, recording the results.', prog='azureSDKTrackClassifier.evaluation')
+    parser.add_argument('--language', type=str, default=None, choices=[l.value for l in Language], help='Evaluate on the training set for this language only.')
+    parser.add_argument('--service', type=str, default=None, help='Evaluate on the training set for this service only.')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--n-jobs', type=int, default=-1, help='Processes to fit folds on.  Default: all cores (-1).')
+    parser.add_argument('--history', type=str, default=DEFAULT_HISTORY_PATH, help='The history file to append results to.  Default: {}'.format(DEFAULT_HISTORY_PATH))
+    parser.add_argument('--note', type=str, default=None, help='A note to record with the results. (e.g. what was changed)')
+    parser.add_argument('--rebuild-features', default=False, action='store_true', help='Rebuild the training set rather than using the cached feature matrix.')
+    parser.add_argument('--set-cache-path', type=str, default='.', help='The location of training cache files, and of the cached feature matrix.')
+    parser.add_argument('--set-test-corpus-path', type=str, default='.', help='The location of the test corpus tree.')
+    parser.add_argument('--set-apistubgen-path', type=str, default=Settings.APISTUBGEN_PATH, help='The directory apistubgen files are looked for in.')
+    parser.add_argument('--offline-mirror', type=str, default=None, help='Build the training set from this local mirror rather than from github. (See azureSDKTrackClassifier.mirror)')
+    parser.add_argument('--log-level', default='info', type=str, help='Specify log level (debug, info, warning, exception, error) to output alongside results.')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    Settings.CACHE_BASE_PATH = args.set_cache_path
+    Settings.TEST_CORPUS_BASE_PATH = args.set_test_corpus_path
+    Settings.APISTUBGEN_PATH = args.set_apistubgen_path
+    Settings.OFFLINE_MIRROR_PATH = args.offline_mirror
+
+    vectors, classes = feature_matrix(args.language, args.service, args.rebuild_features)
+    results = evaluate(vectors, classes, folds=args.folds, n_jobs=args.n_jobs)
+    log_results(results, len(vectors))
+    print(json.dumps(record_history(args.history, args.language, args.service, len(vectors), args.folds, results, args.note)))
@@ -1,19 +1,24 @@
+from collections import deque
+from contextlib import contextmanager
 import csv
+import hashlib
 from functools import lru_cache
 import io
 from io import BytesIO
 import json
 import logging
 import os
-import zipfile
-
-import enchant
-import exdown
-import requests
+import tempfile
+import threading
+from typing import IO, Iterable, Iterator
 
 from .constants import Language, LANGUAGE_REPO_MAP
+from .corpus_store import get_corpus_store
 from .settings import Settings
-from .tokenizers import tokenize_text, tokenize_apistubgen
+from .tokenizers import tokenize_text, tokenize_texts, tokenize_apistubgen_file, CHUNK_SIZE
+
+
+_MISSING_TRAINING_LOG_LOCK = threading.Lock()
 
 
 def get_extension(name:str):
@@ -56,8 +61,12 @@ def is_markdown(contents:str, name:str=None):
     return False
 
 
-_DICTIONARY = enchant.Dict("en_US")
+_DICTIONARY = None # Constructed on first use, since loading enchant is only needed for training.
 def check_in_english_dictionary(word:str) -> bool:
+    global _DICTIONARY
+    if _DICTIONARY is None:
+        import enchant
+        _DICTIONARY = enchant.Dict("en_US")
     try:
         return _DICTIONARY.check(word)
     except Exception as e:
@@ -66,6 +75,7 @@ def check_in_english_dictionary(word:str) -> bool:
 
 def do_github_zip_request(zip_uri):
     # Does the actual request, along with some heuristics in case the main branch is main or master.
+    import requests
     version_zip = requests.get(zip_uri).content
     if version_zip == b'404: Not Found' and 'master.zip' in zip_uri: # This is a github-ism.
         version_zip = requests.get(zip_uri.replace('master.zip', 'main.zip')).content
@@ -73,8 +83,18 @@ def do_github_zip_request(zip_uri):
 
 @lru_cache
 def get_release_metadata(language:Language):
+    return parse_release_metadata(fetch_release_metadata_text(language))
+
+
+def fetch_release_metadata_text(language:Language) -> str:
+    """Fetches the raw release CSV for language from the azure-sdk repo."""
+    import requests
     language = Language(language) # Basically an assert.
-    releases = requests.get("https://raw.githubusercontent.com/Azure/azure-sdk/master/_data/releases/latest/{}-packages.csv".format(language.value)).text
+    return requests.get("https://raw.githubusercontent.com/Azure/azure-sdk/master/_data/releases/latest/{}-packages.csv".format(language.value)).text
+
+
+def parse_release_metadata(releases:str) -> dict:
+    """Groups the rows of a release CSV by ServiceName."""
     # Split by newline so it picks up header associations.
     reader = csv.DictReader(releases.split())
     info = {}
@@ -86,25 +106,64 @@ def get_release_metadata(language:Language):
     return info
 
 
-def get_corpus_for_package(repo:str, package:str, version:str, custom_repo_uri:str=None, use_cache:bool=True, use_raw_corpus_cache:bool=False) -> dict:
+def log_missing_training_corpus(package_zip_uri:str, repo:str, package:str, version:str):
+    """If desired, (Settings.MISSING_TRAINING_LOG) logs a package whose corpus could not be fetched to file for triage."""
+    if Settings.MISSING_TRAINING_LOG:
+        with _MISSING_TRAINING_LOG_LOCK, open(Settings.MISSING_TRAINING_LOG, 'a') as f: # Corpora may be fetched from several threads.
+            f.write("{}\t{}\t{}\t{}".format(package_zip_uri, repo, package, version))
+
+
+def get_corpus_for_package(repo:str, package:str, version:str, custom_repo_uri:str=None, use_cache:bool=True, use_raw_corpus_cache:bool=False, downloader:"ZipDownloader"=None, archives:"ArchiveCache"=None) -> dict:
     """Fetches a dict of 'public interface code' files (samples, tests, readme, representative samples you'd see in public documentation) from a specified
-    repo, package, and version. (for Azure SDK packages on github)."""
+    repo, package, and version. (for Azure SDK packages on github).
+    Zips are fetched with downloader (see downloads.ZipDownloader) if provided, otherwise with do_github_zip_request.  If archives (see archives.ArchiveCache)
+    is provided, zips are opened through it, so packages sharing a zip fetch and index it once."""
+    from .archives import open_archive
     corpus = {}
 
     if not package or not version:
         logging.getLogger(__name__).warning("Cannot fetch corpus for null package ({})/version ({}) for {} (custom_repo_uri:{})".format(package, version, repo, custom_repo_uri))
         return {}
 
+    store = get_corpus_store() if use_cache else None
     if use_cache:
-        cache_name = os.path.join(Settings.CACHE_BASE_PATH, "trimmed_corpus_{}_{}_{}.cache".format(repo, package.replace('/', '_'), version)) # The replace is for JS packages.
-        try:
-            with open(cache_name, 'r') as f:
+        cache_name = "trimmed_corpus_{}_{}_{}".format(repo, package, version)
+        cached = store.read(cache_name)
+        if cached is not None:
+            try:
+                corpus = json.loads(cached.decode('utf-8'))
                 logging.getLogger(__name__).info("Found in trimmed cache {} {} {}".format(repo, package, version))
-                return json.loads(f.read())
-        except:
-            pass
+                return corpus
+            except ValueError as e:
+                logging.getLogger(__name__).warning("Dropping corrupt trimmed cache entry for {} {} {}; {}".format(repo, package, version, e))
+                store.discard(cache_name)
 
+    package_zip_uri, custom_subpath = get_package_zip_uri_and_subpath(repo, package, version, custom_repo_uri)
+
+    # Attempt to get custom repo uri + version from releases.
+    # TODO: maybe go up a directory level and look for "tests" and "Samples" if nothing in local dir?  May be more trouble than worth in the long run, apistubgen may be better for the one-offs that are structured this weird, but worth keeping in mind.
+    logging.getLogger(__name__).info("Fetching {} {} {}".format(repo, package, version))
+    # So that in testing we don't take ages, zips can be cached too. (use_raw_corpus_cache)
+    archive = (archives.open if archives else open_archive)(package_zip_uri, downloader, use_raw_corpus_cache)
+    if not archive:
+        logging.getLogger(__name__).warning("No zip for URI: {} (repo: {} package: {} version: {})".format(package_zip_uri, repo, package, version))
+        log_missing_training_corpus(package_zip_uri, repo, package, version)
+        corpus = {}
+    else:
+        corpus = archive.corpus(package, custom_subpath)
+        if not archives:
+            archive.close()
+
+    if use_cache:
+        store.put(cache_name, json.dumps(corpus).encode('utf-8'))
+
+    return corpus
+
+
+def get_package_zip_uri_and_subpath(repo:str, package:str, version:str, custom_repo_uri:str=None) -> tuple:
+    """Returns the zip holding the corpus of a package, and the subpath of the zip the corpus is in; None if the zip is a standard release tag, laid out by sdk/ paths."""
     package_zip_uri = "https://github.com/Azure/{}/archive/{}_{}.zip".format(repo, package, version)
+    custom_subpath = None
     if custom_repo_uri == 'NA':
         custom_repo_uri = None
     # NOTE: This assumes all repos are github.
@@ -117,55 +176,22 @@ def get_corpus_for_package(repo:str, package:str, version:str, custom_repo_uri:s
 
         except Exception as e:
             logging.getLogger(__name__).warning("Warning: Exception while parsing custom_repo_uri: {}".format(e))
-            custom_repo_uri = None # Something went wrong, so let's _try_ to fall back to the normal pattern, and report the warning for diagnosis in either case.
+            custom_subpath = None # Something went wrong, so let's _try_ to fall back to the normal pattern, and report the warning for diagnosis in either case.
+    return package_zip_uri, custom_subpath
 
-    # Attempt to get custom repo uri + version from releases.
-    # TODO: maybe go up a directory level and look for "tests" and "Samples" if nothing in local dir?  May be more trouble than worth in the long run, apistubgen may be better for the one-offs that are structured this weird, but worth keeping in mind.
-    logging.getLogger(__name__).info("Fetching {} {} {}".format(repo, package, version))
-    # So that in testing we don't take ages, cache intermediate results.
-    if use_raw_corpus_cache:
-        raw_cache_name = os.path.join(Settings.CACHE_BASE_PATH, "corpus_{}_{}_{}.cache".format(repo, package.replace('/', '_'), version)) # The replace is for JS packages.
-        try:
-            with open(raw_cache_name, 'rb') as f:
-                version_zip = f.read()
-                logging.getLogger(__name__).info("Found in cache {} {} {}".format(repo, package, version))
-        except:
-            version_zip = do_github_zip_request(package_zip_uri)
-            with open(raw_cache_name, 'wb') as f:
-                f.write(version_zip)
-    else:
-        version_zip = do_github_zip_request(package_zip_uri)
 
-    if version_zip == b'404: Not Found': # This is a github-ism.
-        logging.getLogger(__name__).warning("No zip for URI: {} (repo: {} package: {} version: {})".format(package_zip_uri, repo, package, version))
-        if Settings.MISSING_TRAINING_LOG: # If desired, log missing corpuses to file for triage.
-            with open(Settings.MISSING_TRAINING_LOG, 'a') as f:
-                f.write("{}\t{}\t{}\t{}".format(package_zip_uri, repo, package, version))
-        corpus = {}
-    else:
-        with zipfile.ZipFile(BytesIO(version_zip), 'r') as zf:
-            files = [n for n in zf.namelist() \
-                        if not n.endswith('/') \
-                            and is_acceptable_extension(n) \
-                            and ((custom_repo_uri and custom_subpath in n) or (not custom_repo_uri and '/sdk/' in n and package in n.split('/sdk/')[-1])) \
-                            and any([k in n for k in ['/samples/', '/examples/', '/tests/', '/test/', 'README']])] 
-                     # TODO: The second part of above is very "rough", find the proper sdk/ path better+filter smarter; may want to add yaml and md to this.
-                     # TODO: We may want to adjust this to take n.lower().contains('samples/') as well for situations like this if ends up not being an outlier. https://github.com/Azure/azure-cosmos-dotnet-v3/tree/releases/4.0.0-preview3/Microsoft.Azure.Cosmos.Samples
-            for file in files:
-                body = zf.read(file)
-                try:
-                    corpus[file] = body.decode('UTF-8')
-                except:
-                    try:
-                        corpus[file] = body.decode('unicode_escape')
-                    except Exception as e:
-                        logging.getLogger(__name__).warning("Unable to read corpus file: {}; {}".format(file, e))
+def trim_corpus(version_zip:IO, package:str, custom_subpath:str=None) -> dict:
+    """Returns the 'public interface code' files of package from its zip (see get_package_zip_uri_and_subpath), as a dict of name to text."""
+    from .archives import PackageArchive
+    return PackageArchive(version_zip).corpus(package, custom_subpath) # Leaving version_zip to the caller to close.
 
-    if use_cache:
-        with open(cache_name, 'w') as f:
-            f.write(json.dumps(corpus))
 
-    return corpus
+def fetch_zip(zip_uri:str, downloader:"ZipDownloader"=None) -> IO:
+    """ Returns the zip at zip_uri as a binary file object, or None if there is no such zip. """
+    if downloader:
+        return downloader.fetch(zip_uri)
+    version_zip = do_github_zip_request(zip_uri)
+    return None if version_zip == b'404: Not Found' else BytesIO(version_zip) # This is a github-ism.
 
 
 def get_zip_uri_and_subpath_from_github_link(custom_repo_uri:str)->tuple:
@@ -195,51 +221,148 @@ def get_zip_uri_and_subpath_from_github_link(custom_repo_uri:str)->tuple:
     return package_zip_uri, custom_subpath
 
 
-def get_apistubgen_tokens_for_package(language:Language, package:str, version:str) -> set:
+def get_apistubgen_path(language:Language, package:str, version:str) -> str:
+    return os.path.join(Settings.APISTUBGEN_PATH, "{}_{}_{}.json".format(Language(language).value, package, version))
+
+
+APISTUBGEN_TOKENS_VERSION = 1 # Bump when tokenize_apistubgen changes, so tokens cached by earlier versions aren't used.
+
+def get_apistubgen_tokens_for_package(language:Language, package:str, version:str, use_cache:bool=True) -> set:
     # This requires an apistubgen file to be generated and named properly to be picked up.
+    # Its tokens are cached (see corpus_store) by the hash of the file, so it's only parsed again once it changes.
     try:
-        with open("./ApiStubGen/{}_{}_{}.json".format(Language(language).value, package, version)) as f:
-            logging.getLogger(__name__).info("Found apistubgen file for {} {} {};".format(language, package, version))
-            return set([token for token_list in tokenize_apistubgen(json.loads(f.read())).values() for token in token_list])
+        f = open(get_apistubgen_path(language, package, version), 'rb')
     except IOError:
         return set()
+    with f:
+        logging.getLogger(__name__).info("Found apistubgen file for {} {} {};".format(language, package, version))
+        if use_cache:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            store = get_corpus_store()
+            cache_name = "apistubgen_tokens_{}_{}".format(APISTUBGEN_TOKENS_VERSION, digest.hexdigest())
+            cached = store.read(cache_name)
+            if cached is not None:
+                try:
+                    return set(json.loads(cached.decode('utf-8')))
+                except ValueError as e:
+                    logging.getLogger(__name__).warning("Dropping corrupt apistubgen cache entry for {} {} {}; {}".format(language, package, version, e))
+                    store.discard(cache_name)
+            f.seek(0)
+        tokens = set([token for token_list in tokenize_apistubgen_file(f).values() for token in token_list])
+        if use_cache:
+            store.put(cache_name, json.dumps(sorted(tokens)).encode('utf-8'))
+        return tokens
+
+
+def get_corpora_without_apistubgen(metadata:list, corpora:dict) -> dict:
+    """ Returns those of corpora (keyed by get_corpus_arguments) whose packages in metadata have no apistubgen file; the only ones whose tokens come from
+        their corpus files, and so are worth tokenizing up front. (See parallel.tokenize_corpora)  Any whose apistubgen file turns out to have no tokens
+        are tokenized when their tokens are extracted instead. """
+    with_apistubgen = {get_corpus_arguments(each, each_language) for each, each_language in metadata
+                       if os.path.exists(get_apistubgen_path(each_language, each['Package'], each['VersionGA'] or each['VersionPreview']))}
+    return {arguments:corpus for arguments, corpus in corpora.items() if arguments not in with_apistubgen}
+
+
+def get_corpus_arguments(each:dict, each_language:Language) -> tuple:
+    """ Returns the (repo, package, version, custom_repo_uri) to fetch the corpus of a package with, from its release metadata. """
+    version = each['VersionGA'] or each['VersionPreview']
+    custom_repo_path = each['RepoPath'] if each['RepoPath'].startswith('http') else None # If RepoPath is a uri instead of just a package name, use that instead. (this can be e.g. historical or nonstandard repos)
+    return LANGUAGE_REPO_MAP[each_language], each['Package'], version, custom_repo_path
 
 
 # Helper function to do the corpus lookup and tokenization for a given list of package metadata.
 # Also extracts version tokens seperately since we can use them for special heuristics.
-def get_corpus_files_tokens_and_versions_for_package(metadata:list) -> tuple:
+# corpora may provide already-fetched corpora, keyed by get_corpus_arguments (see downloads.prefetch_corpora), and corpus_tokens their already-extracted tokens. (See parallel.tokenize_corpora)
+def get_corpus_files_tokens_and_versions_for_package(metadata:list, corpora:dict=None, corpus_tokens:dict=None) -> tuple:
     corpus_files = {}
     tokens = set()
     versions = set()
     for (each, each_language) in metadata:
-        raw_corpus = None
-        last_exception = None
+        package_corpus_files, package_tokens, package_versions = get_corpus_files_tokens_and_versions_for_one_package(each, each_language, corpora, corpus_tokens)
+        corpus_files.update(package_corpus_files)
+        tokens |= package_tokens
+        versions |= package_versions
 
-        version = each['VersionGA'] or each['VersionPreview']
-        package = each['Package']
-        custom_repo_path = each['RepoPath'] if each['RepoPath'].startswith('http') else None # If RepoPath is a uri instead of just a package name, use that instead. (this can be e.g. historical or nonstandard repos)
+    return corpus_files, tokens, versions
 
-        raw_corpus = get_corpus_for_package(LANGUAGE_REPO_MAP[each_language], package, version, custom_repo_path)
 
-        corpus_files.update(raw_corpus)
-        # If you have apistubgen, get that and build tokens.  If not, use the corpus files.
-        stubgen_tokens = get_apistubgen_tokens_for_package(each_language, package, version) # If we have apistubgen, use it, otherwise fall back to unsupervised.
-        tokens = tokens.union(stubgen_tokens or tokenize_text('\n'.join(raw_corpus.values())))
+# As above, for a single package; what is kept per package for incremental training. (See artifacts.ArtifactStore)
+def get_corpus_files_tokens_and_versions_for_one_package(each:dict, each_language:Language, corpora:dict=None, corpus_tokens:dict=None) -> tuple:
+    arguments = get_corpus_arguments(each, each_language)
+    _, package, version, _ = arguments
 
-        versions.add(package)
-        for version_id in [each['VersionGA'], each['VersionPreview']]:
-            if version_id:
-                versions.add(version_id.split('-')[0])
+    raw_corpus = corpora[arguments] if corpora and arguments in corpora else get_corpus_for_package(*arguments)
 
-    return corpus_files, tokens, versions
+    # If you have apistubgen, get that and build tokens.  If not, use the corpus files.
+    stubgen_tokens = get_apistubgen_tokens_for_package(each_language, package, version) # If we have apistubgen, use it, otherwise fall back to unsupervised.
+    if stubgen_tokens:
+        tokens = stubgen_tokens
+    elif corpus_tokens and arguments in corpus_tokens:
+        tokens = corpus_tokens[arguments]
+    else:
+        tokens = tokenize_texts(raw_corpus.values()) # File by file, rather than joining the whole corpus into one string.
+
+    versions = {package}
+    for version_id in [each['VersionGA'], each['VersionPreview']]:
+        if version_id:
+            versions.add(version_id.split('-')[0])
+
+    return raw_corpus, tokens, versions
 
 
-# Helper function used for parallelizing __main__ classifier evaluation.
-def run_multiproc_classifier(is_t1_classifier:"AzureSDKTrackClassifier", multi_text:dict, queue:"Queue", verbose:bool):
-    for path, text in multi_text.items():
-        if verbose:
-            result = is_t1_classifier.is_t1_verbose(text)
-        else:
-            result = is_t1_classifier.is_t1(text)
-        print("{}: {}".format(path, result))
-        queue.put((path, result))
+def write_file_atomically(path:str, body:bytes):
+    """ Writes body to path such that readers see either the old or the new file, never part of one. """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.partial-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def json_default(value):
+    """ For json.dumps(default=...); verbose results hold numpy values (e.g. ml_result_probability), which the json module doesn't know. """
+    return value.tolist() if hasattr(value, 'tolist') else str(value)
+
+
+def classify_texts(is_t1_classifier:"AzureSDKTrackClassifier", texts:Iterable[str], verbose:bool=False, early_exit:bool=False) -> Iterator:
+    """ Yields the results of is_t1 (or is_t1_verbose if verbose) for each of texts in order, through the batch APIs where possible. """
+    if verbose and early_exit: # Early exit is decided per document, so there is no batched verbose form of it.
+        return (is_t1_classifier.is_t1_verbose(text, early_exit=True) for text in texts)
+    elif verbose:
+        return is_t1_classifier.is_t1_verbose_many(texts)
+    return is_t1_classifier.is_t1_many(texts, early_exit)
+
+
+def classify_items(is_t1_classifier:"AzureSDKTrackClassifier", items:Iterable[tuple], verbose:bool=False, early_exit:bool=False) -> Iterator[tuple]:
+    """ Like classify_texts, for (key, text) items, yielding (key, result); items is read lazily, so may be arbitrarily long. """
+    keys = deque()
+    def texts():
+        for key, text in items:
+            keys.append(key)
+            yield text
+    for result in classify_texts(is_t1_classifier, texts(), verbose, early_exit):
+        yield keys.popleft(), result
+
+
+@contextmanager
+def shared_model_file(is_t1_classifier:"AzureSDKTrackClassifier", path:str=None) -> Iterator[str]:
+    """ Yields the path of a compact model file holding is_t1_classifier's model, for worker processes to attach to with AzureSDKTrackClassifier.load(path, shared=True).
+        path is used as is if it already is a compact model file; otherwise the model is written to a temporary file, removed afterwards. """
+    from .model_file import is_compact_model, MAGIC, COMPACT_FORMAT
+    if path:
+        with open(path, 'rb') as f:
+            if is_compact_model(f.read(len(MAGIC))):
+                yield path
+                return
+    fd, temp_path = tempfile.mkstemp(suffix='.model')
+    os.close(fd)
+    try:
+        is_t1_classifier.save(temp_path, COMPACT_FORMAT)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatchcase
+import json
+import logging
+import os
+from typing import IO, Iterable, Iterator
+import zipfile
+
+from .helpers import get_zip_uri_and_subpath_from_github_link, is_acceptable_extension
+from .downloads import ZipDownloader
+
+DEFAULT_MAX_FILE_SIZE = 1 << 20
+DEFAULT_EXCLUDE = ('.git', '.hg', '.svn')
+_SNIFF_BYTES = 8192
+
+
+def get_zip_uri_and_subpath(path:str) -> tuple:
+    """ Like get_zip_uri_and_subpath_from_github_link, but also accepts a direct link to a zip (whose whole contents are then used). """
+    if path.endswith('.zip'):
+        return path, ''
+    return get_zip_uri_and_subpath_from_github_link(path)
+
+
+def decode_member(name:str, body:bytes) -> str:
+    """ Decodes the contents of an archive member as text, or returns None (logging why) if it can't be. """
+    try:
+        return body.decode('UTF-8')
+    except:
+        try:
+            return body.decode('unicode_escape')
+        except Exception as e:
+            logging.getLogger(__name__).warning("Unable to read input file: {}; {}".format(name, e))
+            return None
+
+
+def iter_zip_members(zip_file:IO, subpath:str='') -> Iterator[tuple]:
+    """ Yields (name, text) for each file in the zip whose name contains subpath, reading and decoding one member at a time. """
+    with zipfile.ZipFile(zip_file, 'r') as zf:
+        for info in zf.infolist():
+            if info.is_dir() or subpath not in info.filename:
+                continue
+            text = decode_member(info.filename, zf.read(info))
+            if text is not None:
+                yield info.filename, text
+
+
+def iter_github_archives(paths:Iterable[str], downloader:ZipDownloader=None) -> Iterator[tuple]:
+    """ Yields (name, text) for the files of each GitHub link (or zip link) in paths; see get_zip_uri_and_subpath.
+        Archives are downloaded concurrently through downloader (a new ZipDownloader if None; so with its retries and timeout, spooled to disk), and each
+        one's files are yielded as soon as it has finished downloading, so archives come in order of completion. """
+    sources = [get_zip_uri_and_subpath(path) for path in paths]
+    owns_downloader = downloader is None
+    downloader = downloader or ZipDownloader()
+    try:
+        with ThreadPoolExecutor(downloader.concurrency) as executor:
+            downloads = {executor.submit(downloader.fetch, zip_uri):(zip_uri, subpath) for zip_uri, subpath in sources}
+            for download in as_completed(downloads):
+                zip_uri, subpath = downloads[download]
+                spool = download.result()
+                if spool is None:
+                    logging.getLogger(__name__).warning("No zip for URI: {}".format(zip_uri))
+                    continue
+                logging.getLogger(__name__).info("Downloaded input uri: " + zip_uri)
+                with spool:
+                    yield from iter_zip_members(spool, subpath)
+    finally:
+        if owns_downloader:
+            downloader.close()
+
+
+def iter_jsonl_documents(lines:Iterable[str]) -> Iterator[tuple]:
+    """ Yields (key, text, error) for each JSON lines record: {"text": str} for inline text or {"path": str} for a file to read, either with an optional "id".
+        key is the record's id, else its path, else its line number.  If the record is malformed or its file can't be read, text is None and error says why.
+        Files are read as UTF-8, replacing undecodable bytes, so that one stray encoding doesn't fail a document in a long run. """
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            key = record.get('id', record.get('path', line_number))
+        except (ValueError, AttributeError) as e:
+            yield line_number, None, "Malformed record: {}".format(e)
+            continue
+        if isinstance(record.get('text'), str):
+            yield key, record['text'], None
+        elif isinstance(record.get('path'), str):
+            try:
+                with open(record['path'], encoding='utf-8', errors='replace') as f:
+                    text = f.read()
+            except (OSError, ValueError) as e:
+                yield key, None, "Unable to read input file: {}".format(e)
+                continue
+            yield key, text, None
+        else:
+            yield key, None, 'Record has neither a "text" nor a "path".'
+
+
+class _GitignoreRules:
+    """ The rules of the .gitignore files seen so far on the way down a directory tree; a common subset of git's semantics
+        (comments, negation, directory-only and anchored patterns, '**/' prefixes), with shell-style wildcards that may also match '/'. """
+
+    def __init__(self, rules:tuple=()):
+        self._rules = rules # (directory relative to the walk's root, pattern, negated, directories only, anchored)
+
+    def extended(self, directory:str, gitignore_path:str) -> "_GitignoreRules":
+        """ Returns these rules followed by those of the .gitignore at gitignore_path, in directory (relative to the walk's root). """
+        rules = []
+        try:
+            with open(gitignore_path, encoding='utf-8', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            line = line[1:] if negated else line
+            directories_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line.startswith('**/'):
+                line, anchored = line[3:], False
+            else:
+                anchored = '/' in line
+            rules.append((directory, line.lstrip('/'), negated, directories_only, anchored))
+        return _GitignoreRules(self._rules + tuple(rules)) if rules else self
+
+    def ignored(self, relative_path:str, is_directory:bool) -> bool:
+        ignored = False
+        for directory, pattern, negated, directories_only, anchored in self._rules:
+            if directories_only and not is_directory:
+                continue
+            if directory:
+                if not relative_path.startswith(directory + '/'):
+                    continue
+                path = relative_path[len(directory) + 1:]
+            else:
+                path = relative_path
+            if fnmatchcase(path if anchored else path.rsplit('/', 1)[-1], pattern):
+                ignored = not negated
+        return ignored
+
+
+def _matches_any(globs:Iterable[str], relative_path:str, name:str) -> bool:
+    return any(fnmatchcase(relative_path, g) or fnmatchcase(name, g) for g in globs)
+
+
+def walk_files(root:str, include:Iterable[str]=(), exclude:Iterable[str]=DEFAULT_EXCLUDE, max_file_size:int=DEFAULT_MAX_FILE_SIZE,
+               use_gitignore:bool=False, all_extensions:bool=False) -> Iterator[tuple]:
+    """ Yields (path, text) for the files under root worth classifying, reading and decoding one file at a time.
+
+        Skipped, without reading them past their first few KB: files without an acceptable extension (see helpers.is_acceptable_extension, unless all_extensions),
+        files larger than max_file_size bytes (if set), binary files (containing a NUL byte), files not matching any of the include globs (if any), files and
+        directories matching any of the exclude globs, and if use_gitignore, those ignored by .gitignore files.  Globs are matched against both the path relative
+        to root (with '/' separators) and the name alone.  Files that can't be decoded are skipped with a warning (see decode_member). """
+    include, exclude = tuple(include), tuple(exclude)
+    pending = [('', _GitignoreRules())]
+    while pending:
+        directory, gitignore = pending.pop()
+        directory_path = os.path.join(root, directory) if directory else root
+        if use_gitignore and os.path.isfile(os.path.join(directory_path, '.gitignore')):
+            gitignore = gitignore.extended(directory, os.path.join(directory_path, '.gitignore'))
+        try:
+            with os.scandir(directory_path) as scan:
+                entries = sorted(scan, key=lambda e: e.name)
+        except OSError as e:
+            logging.getLogger(__name__).warning("Unable to read input directory: {}; {}".format(directory_path, e))
+            continue
+        subdirectories = []
+        for entry in entries:
+            relative_path = directory + '/' + entry.name if directory else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not _matches_any(exclude, relative_path, entry.name) and not (use_gitignore and gitignore.ignored(relative_path, True)):
+                    subdirectories.append((relative_path, gitignore))
+                continue
+            if not entry.is_file() \
+               or not (all_extensions or is_acceptable_extension(entry.name)) \
+               or (include and not _matches_any(include, relative_path, entry.name)) \
+               or _matches_any(exclude, relative_path, entry.name) \
+               or (use_gitignore and gitignore.ignored(relative_path, False)):
+                continue
+            try:
+                if max_file_size and entry.stat().st_size > max_file_size:
+                    logging.getLogger(__name__).debug("Skipping input file larger than {} bytes: {}".format(max_file_size, entry.path))
+                    continue
+                with open(entry.path, 'rb') as f:
+                    head = f.read(_SNIFF_BYTES)
+                    if b'\x00' in head:
+                        logging.getLogger(__name__).debug("Skipping binary input file: {}".format(entry.path))
+                        continue
+                    body = head + f.read()
+            except OSError as e:
+                logging.getLogger(__name__).warning("Unable to read input file: {}; {}".format(entry.path, e))
+                continue
+            text = decode_member(entry.path, body)
+            if text is not None:
+                yield entry.path, text
+        pending.extend(reversed(subdirectories)) # Popped in name order, so files are yielded in a stable order: a directory's own files, then each subdirectory's in turn.
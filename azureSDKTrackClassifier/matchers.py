@@ -0,0 +1,165 @@
+import bisect
+import itertools
+import operator
+import re
+
+# Precompiled lookup structures used at classification time, built once during training (or on load) and stored on the trained model.
+
+class VersionMatcher:
+    """ Matcher over a fixed set of version-identifier strings (package names and versions).
+
+        find_all(text) returns exactly the set of patterns p for which `p in text` holds, but does so in a single pass over the text instead of one full
+        substring scan per pattern.  The pass is a regular expression over a trie of the patterns, which the re engine runs in C and which stops wherever some
+        pattern starts; only there are the text's substrings of each pattern length looked up.  It holds little more than the patterns themselves, where an
+        automaton of one dict per trie state took tens of MB for a few thousand versions, in every process using the model. """
+
+    def __init__(self, patterns):
+        self._patterns = frozenset(patterns)
+        self._always_found = frozenset(p for p in self._patterns if not p) # '' in text is always true, mirror that.
+        self._lengths = sorted({len(p) for p in self._patterns if p})
+        self._starts = re.compile(_trie_pattern(p for p in self._patterns if p)) if self._lengths else None # Matches the shortest pattern at each position.
+        # The most distinct patterns that can newly match at any one character: those ending there, i.e. the suffixes of the longest such pattern.
+        self.max_matches_per_position = max((sum(p[i:] in self._patterns for i in range(len(p))) for p in self._patterns if p), default=0)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __getstate__(self):
+        # The compiled pattern is derived data; only ship the patterns and rebuild on load.
+        return {'patterns':tuple(sorted(self._patterns))}
+
+    def __setstate__(self, state):
+        self.__init__(state['patterns'])
+
+    def find_all(self, text:str) -> set:
+        """ Returns the set of patterns that occur anywhere in text. """
+        scanner = self.scanner()
+        scanner.feed(text)
+        return scanner.found()
+
+    def scanner(self) -> "VersionScanner":
+        """ Returns a scanner that can be fed a text in consecutive chunks; matches spanning chunk boundaries are found as if the text were whole. """
+        return VersionScanner(self)
+
+    def _find_into(self, text:str, found:set):
+        """ Adds the patterns occurring in text to found. """
+        search, patterns, lengths = self._starts.search, self._patterns, self._lengths
+        match = search(text)
+        while match:
+            start = match.start()
+            found.update(text[start:start + length] for length in lengths[bisect.bisect_left(lengths, match.end() - start):] if text[start:start + length] in patterns)
+            match = search(text, start + 1)
+
+
+class VersionScanner:
+    """ Incremental state of a VersionMatcher pass over a text.  Should not be constructed directly; use `VersionMatcher.scanner` instead. """
+
+    def __init__(self, matcher:VersionMatcher):
+        self._matcher = matcher
+        self._carried = '' # The end of the text fed so far that a pattern completed by the next chunk could start in.
+        self._found = set(matcher._always_found)
+
+    def feed(self, chunk:str):
+        if self._matcher._starts is None:
+            return
+        text = self._carried + chunk
+        self._matcher._find_into(text, self._found)
+        self._carried = text[len(text) - self._matcher._lengths[-1] + 1:] if len(text) >= self._matcher._lengths[-1] else text
+
+    def found(self) -> set:
+        """ Returns the set of patterns found in everything fed so far. """
+        return set(self._found)
+
+class TokenIndex:
+    """ Frozen index of the tokens exclusive to T2 (new) or T1 (old) code.
+
+        Held as one frozenset of tokens per class label, no larger than the token sets it replaces.  (Interning the tokens, or mapping them to labels in a
+        dict, would cost about as much again.)  Counting a document's hits is a membership pass per label that never allocates intersection sets; the matching
+        token names are only materialized when asked for. """
+
+    NEW, OLD, MISSING = 0, 1, 2
+
+    def __init__(self, only_new_tokens, only_old_tokens):
+        old = frozenset(only_old_tokens)
+        self._tokens = (frozenset(t for t in only_new_tokens if t not in old), old) # By label; a token in both is OLD, as it always was.
+
+    def __getstate__(self):
+        return {'only_new_tokens':self.tokens(self.NEW), 'only_old_tokens':self.tokens(self.OLD)}
+
+    def __setstate__(self, state):
+        self.__init__(state['only_new_tokens'], state['only_old_tokens'])
+
+    def size(self, label:int) -> int:
+        """ Number of tokens in the index with the given label. """
+        return len(self._tokens[label])
+
+    def tokens(self, label:int) -> list:
+        """ Sorted list of every token in the index with the given label. """
+        return sorted(self._tokens[label])
+
+    def iter_tokens(self):
+        """ Every token in the index, of any label, in no particular order. """
+        return itertools.chain(*self._tokens)
+
+    def count(self, tokens) -> tuple:
+        """ Returns (new, old): how many of the given (distinct) tokens are in the index with each label. """
+        tokens = tokens if isinstance(tokens, (set, frozenset, list, tuple)) else list(tokens)
+        return tuple(operator.countOf(map(labelled.__contains__, tokens), True) for labelled in self._tokens)
+
+    def hits(self, tokens) -> set:
+        """ Returns the subset of the given tokens that are in the index with any label. """
+        tokens = tokens if isinstance(tokens, (set, frozenset)) else set(tokens)
+        return self._tokens[self.NEW].intersection(tokens) | self._tokens[self.OLD].intersection(tokens)
+
+    def find(self, tokens, label:int) -> set:
+        """ Returns the subset of the given tokens that are in the index with the given label. """
+        return set(self._tokens[label].intersection(tokens))
+
+    def any_hit(self, tokens) -> bool:
+        """ Whether any of the given tokens is in the index; stops at the first. """
+        tokens = tokens if isinstance(tokens, (set, frozenset, list, tuple)) else list(tokens)
+        return not all(labelled.isdisjoint(tokens) for labelled in self._tokens)
+
+
+_word_token = re.compile(r"\w+")
+_punctuation_token = re.compile(r"[^\w\s]+")
+
+class RelevanceGate:
+    """ Cheap pre-filter for documents that can contain none of a model's tokens or versions, and so would get an all-zero feature vector.
+
+        admits(text) is False only if no token of the token index is a token of the text, and no version occurs in the text; it never rejects a text with
+        a hit.  Tokens of word characters (nearly all of them) can only be whole words of a text, so the text's words (those at least as long as the shortest
+        such token) are looked up in the token index, stopping at the first hit.  Versions, which match anywhere, and any punctuation tokens are found with
+        one regular expression over a trie of them, which the re engine scans in C; it runs first, as documents using Azure SDKs mostly name their packages.
+        Both are several times cheaper than tokenizing the text and scanning it for versions character by character. """
+
+    def __init__(self, token_index:"TokenIndex", versions):
+        self._token_index = token_index
+        self._always = '' in versions # '' is in every text; mirror VersionMatcher.
+        word_lengths, literals = [], set(versions)
+        for token in token_index.iter_tokens():
+            if _word_token.fullmatch(token):
+                word_lengths.append(len(token))
+            elif _punctuation_token.fullmatch(token):
+                literals.add(token)
+            # Anything else can never be produced by the tokenizer, so never hits.
+        self._words = re.compile(r"\w{%d,}" % min(word_lengths)) if word_lengths else None # Matches exactly the whole words at least that long.
+        self._literals = re.compile(_trie_pattern(literals)) if literals and not self._always else None
+
+    def admits(self, text:str) -> bool:
+        if self._always or (self._literals and self._literals.search(text)):
+            return True
+        return self._words is not None and self._token_index.any_hit(self._words.findall(text))
+
+
+def _trie_pattern(strings) -> str:
+    """ A regular expression matching any of strings, as a trie, so that alternatives sharing a prefix are only tried once. """
+    def pattern(strings:list, depth:int) -> str: # strings are sorted, and share their first depth characters.
+        if len(strings[0]) == depth:
+            return '' # Ends a string; anything longer that it prefixes is then redundant for search.
+        if len(strings) == 1:
+            return re.escape(strings[0][depth:])
+        alternatives = [re.escape(char) + pattern(list(group), depth + 1) for char, group in itertools.groupby(strings, operator.itemgetter(depth))]
+        return alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    # Grouping the sorted strings by character walks the trie without building it, which for thousands of strings would briefly take tens of MB.
+    return pattern(sorted(set(strings)), 0)
@@ -0,0 +1,210 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+
+from .archives import ArchiveCache, PackageArchive
+from .constants import Language, LANGUAGE_REPO_MAP
+from .downloads import ZipDownloader
+from .helpers import fetch_release_metadata_text, write_file_atomically, get_corpus_arguments, get_package_zip_uri_and_subpath, parse_release_metadata, trim_corpus
+from .tokenizers import CHUNK_SIZE
+
+# A local copy of everything training fetches from github (release CSVs and package corpora), so that training can run without network access.
+#
+# Layout of a mirror directory:
+#   manifest.json                 {"version": 1, "release_metadata": {language: entry}, "packages": [entry, ...]}
+#   releases/{language}.csv       The release CSV of each language, as served.
+#   corpora/{sha256}.json|.zip    Package corpora, named by content: trimmed (a JSON dict of file name to text, as get_corpus_for_package returns) or raw (the package's zip).
+#
+# Each entry records the path (relative to the mirror), sha256 and size of its file; package entries also record repo, package, version and custom_repo_uri
+# (see helpers.get_corpus_arguments), and kind: 'trimmed', 'raw', or 'missing' (no zip existed when mirrored; path, sha256 and size are then null).
+# Files are checked against their entries when read, and a package missing from the manifest is an error rather than a fetch.
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+TRIMMED, RAW, MISSING = 'trimmed', 'raw', 'missing'
+
+
+class CorpusMirror:
+    """ A mirror directory (see above), with its manifest read once up front. """
+
+    def __init__(self, path:str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError("Unsupported mirror manifest version: {} (expected {})".format(manifest.get('version'), MANIFEST_VERSION))
+        self._release_metadata = manifest['release_metadata']
+        self._packages = {_package_key(entry):entry for entry in manifest['packages']}
+
+    def release_metadata(self, language:Language) -> dict:
+        """ As helpers.get_release_metadata, from the mirror. """
+        language = Language(language)
+        if language.value not in self._release_metadata:
+            raise KeyError("No release metadata for {} in mirror {}".format(language.value, self.path))
+        return parse_release_metadata(self._read(self._release_metadata[language.value]).decode('utf-8'))
+
+    def corpus(self, repo:str, package:str, version:str, custom_repo_uri:str=None, archives:ArchiveCache=None) -> dict:
+        """ As helpers.get_corpus_for_package, from the mirror.  If archives is provided, raw zips are opened through it, so packages sharing one open,
+            check and index it once. """
+        if not package or not version:
+            return {}
+        entry = self._packages.get((repo, package, version, custom_repo_uri))
+        if entry is None:
+            raise KeyError("No corpus for {} {} {} (custom_repo_uri: {}) in mirror {}; refresh the mirror.".format(repo, package, version, custom_repo_uri, self.path))
+        if entry['kind'] == MISSING:
+            logging.getLogger(__name__).warning("No zip was mirrored for {} {} {}".format(repo, package, version))
+            return {}
+        if entry['kind'] == TRIMMED:
+            return json.loads(self._read(entry).decode('utf-8'))
+        _, custom_subpath = get_package_zip_uri_and_subpath(repo, package, version, custom_repo_uri)
+        archive = archives.get(entry['path'], lambda: self._open_archive(entry)) if archives else self._open_archive(entry)
+        corpus = archive.corpus(package, custom_subpath)
+        if not archives:
+            archive.close()
+        return corpus
+
+    def corpora(self, metadata:list) -> dict:
+        """ As downloads.prefetch_corpora, from the mirror. """
+        packages = list(dict.fromkeys(get_corpus_arguments(each, each_language) for each, each_language in metadata)) # Unique, in order.
+        path = lambda arguments: (self._packages.get(arguments) or {}).get('path') or ''
+        with ArchiveCache() as archives: # Packages sharing a raw zip are read together, so it is opened once and is still open for each of them.
+            corpora = {arguments:self.corpus(*arguments, archives=archives) for arguments in sorted(packages, key=path)}
+        return {arguments:corpora[arguments] for arguments in packages}
+
+    def _open_archive(self, entry:dict) -> PackageArchive:
+        """ Opens a raw zip in place from its file, once checked against its entry a chunk at a time, rather than reading it into memory. """
+        f = open(os.path.join(self.path, entry['path']), 'rb')
+        try:
+            digest, size = hashlib.sha256(), 0
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+            self._check(entry, size, digest.hexdigest())
+            f.seek(0)
+            return PackageArchive(f)
+        except BaseException:
+            f.close()
+            raise
+
+    def _read(self, entry:dict) -> bytes:
+        with open(os.path.join(self.path, entry['path']), 'rb') as f:
+            body = f.read()
+        self._check(entry, len(body), hashlib.sha256(body).hexdigest())
+        return body
+
+    def _check(self, entry:dict, size:int, sha256:str):
+        if size != entry['size'] or sha256 != entry['sha256']:
+            raise ValueError("Mirror file {} does not match its manifest entry; refresh the mirror.".format(entry['path']))
+
+
+def _package_key(entry:dict) -> tuple:
+    return entry['repo'], entry['package'], entry['version'], entry['custom_repo_uri']
+
+
+def _sort_key(arguments:tuple) -> tuple:
+    return tuple(e or '' for e in arguments) # custom_repo_uri may be None.
+
+
+def _store(mirror_path:str, name:str, body:bytes) -> dict:
+    path = os.path.join(mirror_path, name)
+    write_file_atomically(path, body)
+    return {'path':name.replace(os.sep, '/'), 'sha256':hashlib.sha256(body).hexdigest(), 'size':len(body)}
+
+
+def _is_intact(mirror_path:str, entry:dict) -> bool:
+    if entry['kind'] == MISSING:
+        return True
+    try:
+        return os.path.getsize(os.path.join(mirror_path, entry['path'])) == entry['size']
+    except OSError:
+        return False
+
+
+def _mirror_package(mirror_path:str, arguments:tuple, kind:str, downloader:ZipDownloader) -> dict:
+    repo, package, version, custom_repo_uri = arguments
+    entry = {'repo':repo, 'package':package, 'version':version, 'custom_repo_uri':custom_repo_uri, 'kind':kind}
+    package_zip_uri, custom_subpath = get_package_zip_uri_and_subpath(*arguments)
+    version_zip = downloader.fetch(package_zip_uri)
+    if version_zip is None:
+        logging.getLogger(__name__).warning("No zip for URI: {} (repo: {} package: {} version: {})".format(package_zip_uri, repo, package, version))
+        return dict(entry, kind=MISSING, path=None, sha256=None, size=None)
+    with version_zip:
+        if kind == TRIMMED:
+            body, extension = json.dumps(trim_corpus(version_zip, package, custom_subpath), sort_keys=True).encode('utf-8'), '.json'
+        else:
+            body, extension = version_zip.read(), '.zip'
+    logging.getLogger(__name__).info("Mirrored {} {} {}".format(repo, package, version))
+    return dict(entry, **_store(mirror_path, os.path.join('corpora', hashlib.sha256(body).hexdigest() + extension), body))
+
+
+def build_mirror(path:str, languages:list=None, kind:str=TRIMMED, refetch:bool=False, downloader:ZipDownloader=None) -> dict:
+    """ Creates or refreshes the mirror at path for languages (all by default), returning its manifest.
+
+        The release CSVs are always fetched anew; the corpora of packages already in the mirror are kept (unless refetch), so a refresh only downloads
+        new package versions.  Packages no longer in the release CSVs are dropped.  kind is how new corpora are stored: 'trimmed' (smaller) or 'raw'. """
+    if kind not in (TRIMMED, RAW):
+        raise ValueError("kind must be '{}' or '{}'".format(TRIMMED, RAW))
+    languages = [Language(l) for l in languages] if languages else list(LANGUAGE_REPO_MAP.keys())
+    for directory in ['releases', 'corpora']:
+        os.makedirs(os.path.join(path, directory), exist_ok=True)
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = {'release_metadata':{}, 'packages':[]}
+    existing = {} if refetch else {_package_key(entry):entry for entry in previous['packages'] if _is_intact(path, entry)}
+
+    release_metadata = dict(previous['release_metadata'])
+    packages = set()
+    for language in languages:
+        releases = fetch_release_metadata_text(language)
+        release_metadata[language.value] = _store(path, os.path.join('releases', language.value + '.csv'), releases.encode('utf-8'))
+        for rows in parse_release_metadata(releases).values():
+            packages.update(arguments for arguments in (get_corpus_arguments(each, language) for each in rows) if arguments[1] and arguments[2])
+    # Keep the packages of languages not refreshed this time.
+    packages.update(_package_key(entry) for entry in previous['packages'] if entry['repo'] not in {LANGUAGE_REPO_MAP[l] for l in languages})
+
+    owns_downloader = downloader is None
+    downloader = downloader or ZipDownloader()
+    try:
+        with ThreadPoolExecutor(downloader.concurrency) as executor:
+            to_fetch = sorted((arguments for arguments in packages if arguments not in existing), key=_sort_key)
+            fetched = executor.map(lambda arguments: _mirror_package(path, arguments, kind, downloader), to_fetch)
+            entries = {**{arguments:existing[arguments] for arguments in packages if arguments in existing}, **dict(zip(to_fetch, fetched))}
+    finally:
+        if owns_downloader:
+            downloader.close()
+
+    manifest = {'version':MANIFEST_VERSION,
+                'release_metadata':release_metadata,
+                'packages':[entries[arguments] for arguments in sorted(entries, key=_sort_key)]}
+    write_file_atomically(os.path.join(path, MANIFEST_NAME), json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+    referenced = {entry['path'] for entry in manifest['packages'] if entry['path']}
+    for name in os.listdir(os.path.join(path, 'corpora')):
+        if 'corpora/' + name not in referenced:
+            os.remove(os.path.join(path, 'corpora', name))
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or refresh a local mirror of the training data, for training without network access. (See --offline-mirror)', prog='azureSDKTrackClassifier.mirror')
+    parser.add_argument('--log-level', default=None, type=str, help='Specify log level (debug, info, warning, exception, error) to output alongside results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Create the mirror, or refresh an existing one: fetch the latest release metadata, and the corpora of packages not yet mirrored.')
+    build.add_argument('path', type=str, help='The mirror directory.')
+    build.add_argument('--language', action='append', default=None, choices=[l.value for l in Language], help='Mirror only this language.  May be given more than once.  (Default: all languages.)')
+    build.add_argument('--raw', default=False, action='store_true', help='Store new corpora as their whole package zips rather than trimmed to the files training uses.')
+    build.add_argument('--refetch', default=False, action='store_true', help='Fetch the corpora of all packages again, rather than only of those not yet mirrored.')
+    build.add_argument('--set-download-concurrency', type=int, default=None, help='How many zips to download at once.')
+
+    args = parser.parse_args()
+    if args.log_level:
+        logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    manifest = build_mirror(args.path, args.language, RAW if args.raw else TRIMMED, args.refetch, ZipDownloader(args.set_download_concurrency))
+    print(json.dumps({'packages':len(manifest['packages']), 'missing':sum(entry['kind'] == MISSING for entry in manifest['packages'])}))
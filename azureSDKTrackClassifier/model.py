@@ -1,46 +1,145 @@
 import os
 import re
 import glob
-
-from sklearn.model_selection import cross_val_score
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.svm import SVC
-from sklearn.neural_network import MLPClassifier
+import hashlib
+import itertools
+from typing import IO, Iterable, Iterator, Union
 
 from .helpers import *
 from .constants import Language, LANGUAGE_REPO_MAP
+from .matchers import RelevanceGate, TokenIndex, VersionMatcher
 from .settings import Settings
-from .tokenizers import tokenize_apistubgen, tokenize_text
+from .tokenizers import tokenize_apistubgen, tokenize_text, iter_text_chunks, StreamingTokenizer, CHUNK_SIZE
+
+BATCH_SIZE = 512 # Default number of documents featurized and run through the model per call in the batch APIs.
+EARLY_EXIT_CHUNK_SIZE = 1 << 16 # Characters read between checks of whether the decision is already settled, when classifying with early_exit.
+_MAX_CHARACTERS_PER_BYTE = 4 # Upper bound on characters decoded per byte (reached by errors='backslashreplace'), used to bound what the unread part of binary input could contain.
+_MAX_PENDING_BYTES = 4 # Upper bound on bytes an incremental decoder holds back awaiting the rest of a character.
 
 # Contains the metadata produced by training to allow for classification.  Is the "heavy lifting" behind the public classifier API.
 # Should not be constructed directly; use `train_model` instead.
 class _TrainedModel:
     def __init__(self, only_new_tokens:set, only_old_tokens:set, only_new_versions:set, only_old_versions:set):
-        self._only_new_tokens = only_new_tokens
-        self._only_old_tokens = only_old_tokens
+        self._token_index = TokenIndex(only_new_tokens, only_old_tokens) # Replaces the raw token sets; counts hits without building intersection sets.
         self._only_new_versions = only_new_versions
         self._only_old_versions = only_old_versions
+        self._version_matcher = VersionMatcher(only_new_versions | only_old_versions) # Precompiled so version lookup is one pass over the text rather than one per version.
 
         self._model = None # This gets populated incrementally once trained.
+        self._fingerprint = None # Computed on first use, once trained.
+        self._relevance_gate = None # Built once trained, or on first use once loaded.
+        self._gated_documents = 0
+
+    def __getstate__(self):
+        # The relevance gate is derived from the token and version tables (and holds compiled patterns), and the gate count is per-process, so neither is saved.
+        state = self.__dict__.copy()
+        for derived in ['_relevance_gate', '_zero_verbose_result', '_gated_documents']:
+            state.pop(derived, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if '_token_index' not in state: # Models pickled before the token index existed.
+            self._token_index = TokenIndex(self.__dict__.pop('_only_new_tokens'), self.__dict__.pop('_only_old_tokens'))
+        if '_version_matcher' not in state: # Models pickled before the matcher existed.
+            self._version_matcher = VersionMatcher(self._only_new_versions | self._only_old_versions)
+
+    def fingerprint(self) -> str:
+        """Returns a stable hash of everything that determines this model's classification results: token and version tables and the trained MLP."""
+        if getattr(self, '_fingerprint', None) is None:
+            digest = hashlib.sha256()
+            for table in [self._token_index.tokens(TokenIndex.NEW), self._token_index.tokens(TokenIndex.OLD), sorted(self._only_new_versions), sorted(self._only_old_versions)]:
+                digest.update('\n'.join(table).encode('utf-8', 'surrogatepass'))
+                digest.update(b'\0')
+            if self._model is not None:
+                for array in self._model.coefs_ + self._model.intercepts_:
+                    digest.update(array.tobytes())
+                digest.update(repr([str(c) for c in self._model.classes_]).encode('utf-8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def relevance_gate(self) -> RelevanceGate:
+        """Returns the gate rejecting documents that contain none of this model's tokens or versions. (See matchers.RelevanceGate)"""
+        if getattr(self, '_relevance_gate', None) is None:
+            self._relevance_gate = RelevanceGate(self._token_index, self._only_new_versions | self._only_old_versions)
+        return self._relevance_gate
+
+    def _is_gated(self, text:str) -> bool:
+        """Whether text is rejected by the relevance gate; its feature vector is then all zeros, so it is not T1, and needn't be tokenized or scanned."""
+        if self.relevance_gate().admits(text):
+            return False
+        self._gated_documents = getattr(self, '_gated_documents', 0) + 1
+        return True
+
+    def gate_stats(self) -> dict:
+        """Returns how many documents the relevance gate has rejected in this process."""
+        return {'gated_documents':getattr(self, '_gated_documents', 0)}
 
     def create_feature_vector(self, text:bytes, verbose:bool=False) -> list:
-        tokens = tokenize_text(text)
-        found_new_tokens = self._only_new_tokens.intersection(tokens)
-        found_old_tokens = self._only_old_tokens.intersection(tokens)
-        found_new_versions = [v for v in self._only_new_versions if v in text]
-        found_old_versions = [v for v in self._only_old_versions if v in text]
-        if verbose:
-            logging.getLogger(__name__).info(f"\n new_versions: {found_new_versions}\n old_versions: {found_old_versions}\n found_new_tokens: {found_new_tokens}\n found_old_tokens: {found_old_tokens}\n")
-        else:
-            logging.getLogger(__name__).debug(f"\n new_versions: {found_new_versions}\n old_versions: {found_old_versions}\n found_new_tokens: {found_new_tokens}\n found_old_tokens: {found_old_tokens}\n")
+        return self._build_feature_vector(tokenize_text(text), self._version_matcher.find_all(text), verbose)
+
+    def create_feature_vector_streaming(self, source:"Union[IO, bytes, mmap.mmap]", verbose:bool=False, chunk_size:int=CHUNK_SIZE, encoding:str='utf-8', errors:str='strict', early_exit:bool=False) -> list:
+        """Builds the same feature vector as create_feature_vector, but reads the document from source a chunk at a time.
+           Only the tokens that hit the index are accumulated, so memory is bounded by the chunk size and model size rather than the document size.
+           If early_exit is set, stops reading as soon as the naive decision is settled; the counts are then only those of the text read so far."""
+        return self._scan_stream(source, verbose, chunk_size, encoding, errors, early_exit)[0]
+
+    def _scan_stream(self, source:"Union[IO, bytes, mmap.mmap]", verbose:bool=False, chunk_size:int=CHUNK_SIZE, encoding:str='utf-8', errors:str='strict', early_exit:bool=False) -> tuple:
+        """Returns the feature vector for source along with the fraction of it skipped by early exit. (None if the length of source is unknown, as for file objects.)"""
+        total_units = None if hasattr(source, 'read') else len(source)
+        characters_per_unit = 1 if isinstance(source, str) else _MAX_CHARACTERS_PER_BYTE
+        tokenizer = StreamingTokenizer()
+        version_scanner = self._version_matcher.scanner()
+        found_tokens = set()
+        consumed_units = 0
+        for chunk in iter_text_chunks(source, chunk_size, encoding, errors):
+            version_scanner.feed(chunk)
+            found_tokens |= self._token_index.hits(tokenizer.feed(chunk))
+            if total_units is not None:
+                consumed_units = min(total_units, consumed_units + chunk_size)
+            if early_exit:
+                remaining_characters = None
+                if total_units is not None: # Leave room for any bytes held back by the incremental decoder.
+                    remaining_characters = (total_units - consumed_units + (characters_per_unit > 1) * _MAX_PENDING_BYTES) * characters_per_unit + tokenizer.carried
+                if self._is_settled(found_tokens, version_scanner.found(), remaining_characters):
+                    break
+        found_tokens |= self._token_index.hits(tokenizer.flush())
+        skipped_fraction = None if total_units is None else (total_units - consumed_units) / max(1, total_units)
+        return self._build_feature_vector(found_tokens, version_scanner.found(), verbose), skipped_fraction
+
+    def _is_settled(self, tokens:set, found_versions:set, remaining_characters:int=None) -> bool:
+        """Whether the naive decision can no longer change, whatever the remaining_characters of the document (unbounded if None) contain.
+           Relies on the decision being monotonic in the counts: more T2 hits can only push it towards T2, and more T1 hits towards T1."""
+        new_token_count, old_token_count = self._token_index.count(tokens)
+        new_version_count, old_version_count = len(found_versions & self._only_new_versions), len(found_versions & self._only_old_versions)
+        def headroom(found:int, total:int, per_character:int) -> int: # How many more hits the rest of the document could supply.
+            return total - found if remaining_characters is None else min(total - found, remaining_characters * per_character)
+        most_t2 = self._feature_vector_from_counts(new_token_count + headroom(new_token_count, self._token_index.size(TokenIndex.NEW), 1), old_token_count,
+                                                   new_version_count + headroom(new_version_count, len(self._only_new_versions), self._version_matcher.max_matches_per_position), old_version_count)
+        most_t1 = self._feature_vector_from_counts(new_token_count, old_token_count + headroom(old_token_count, self._token_index.size(TokenIndex.OLD), 1),
+                                                   new_version_count, old_version_count + headroom(old_version_count, len(self._only_old_versions), self._version_matcher.max_matches_per_position))
+        return self._do_naive_prediction(most_t2) == self._do_naive_prediction(most_t1)
+
+    def _build_feature_vector(self, tokens:set, found_versions:set, verbose:bool) -> list:
+        found_new_token_count, found_old_token_count = self._token_index.count(tokens)
+        found_new_versions = found_versions & self._only_new_versions
+        found_old_versions = found_versions & self._only_old_versions
+        log_level = logging.INFO if verbose else logging.DEBUG
+        if logging.getLogger(__name__).isEnabledFor(log_level): # Only materialize the found token names if they're actually going to be logged.
+            found_new_tokens = self._token_index.find(tokens, TokenIndex.NEW)
+            found_old_tokens = self._token_index.find(tokens, TokenIndex.OLD)
+            logging.getLogger(__name__).log(log_level, f"\n new_versions: {found_new_versions}\n old_versions: {found_old_versions}\n found_new_tokens: {found_new_tokens}\n found_old_tokens: {found_old_tokens}\n")
+        return self._feature_vector_from_counts(found_new_token_count, found_old_token_count, len(found_new_versions), len(found_old_versions))
+
+    def _feature_vector_from_counts(self, new_token_count:int, old_token_count:int, new_version_count:int, old_version_count:int) -> list:
         # In theory we might consider normalizing this by the text length too, but gut-feel is that'd cause more bias than fix. (since "Density of T1 code" may be highly variable)  NOTE: If using SVM, there's even more need to log-normalize.
         # Similarly, I provide both the absolute and relative lengths since it's not "True" normalization, a lib can be big but only have part of it used often.
-        return [len(found_new_tokens),
-                len(found_old_tokens),
-                len(found_new_tokens) / max(1,len(self._only_new_tokens)),
-                len(found_old_tokens) / max(1,len(self._only_new_tokens)),
-                len(found_new_versions),
-                len(found_old_versions)]
+        return [new_token_count,
+                old_token_count,
+                new_token_count / max(1,self._token_index.size(TokenIndex.NEW)),
+                old_token_count / max(1,self._token_index.size(TokenIndex.NEW)),
+                new_version_count,
+                old_version_count]
 
     def _do_naive_prediction(self, feature_vector:list) -> bool:
         """Internal function that makes the actual yes/no decision based on the feature vector (Based on human-comprehensable decision criterea)"""
@@ -50,40 +149,122 @@ class _TrainedModel:
         return (feature_vector[2] + max(feature_vector[2] / max(1,feature_vector[0]), 1) * feature_vector[4] * 2) < (feature_vector[3] + max(feature_vector[3] / max(1,feature_vector[1]), 1) * feature_vector[5] * 2)
         #return feature_vector[2] < feature_vector[3]
 
-    def _do_ml_prediction(self, feature_vector:list) -> bool:
-        """Internal function that makes the actual yes/no decision based on the feature vector (Based on a pre-trained ML model)"""
+    def _do_ml_prediction(self, feature_vectors:list) -> list:
+        """Internal function that makes the actual yes/no decision for each of a batch of feature vectors (Based on a pre-trained ML model)"""
         # TODO: This is very overfit right now.  Would likely be better when we get a more realistic training set. (false positives etc.)
-        return "T1" == self._model.predict([feature_vector])[0] and any(feature_vector) # The last part is a hack to make the empty case look good even if the model isn't trained on it well 
+        return ["T1" == prediction and any(v) for prediction, v in zip(self._model.predict(feature_vectors), feature_vectors)] # The last part is a hack to make the empty case look good even if the model isn't trained on it well 
+
+    def classify(self, text:bytes, early_exit:bool=False) -> bool:
+        if self._is_gated(text):
+            return False
+        if early_exit:
+            v = self._scan_stream(text, chunk_size=EARLY_EXIT_CHUNK_SIZE, early_exit=True)[0]
+        else:
+            v = self.create_feature_vector(text)
+        return self._do_naive_prediction(v)
+
+    def classify_verbose(self, text:bytes, extra_verbosity:bool=False, early_exit:bool=False) -> bool:
+        if early_exit:
+            if self._is_gated(text):
+                return dict(self._gated_verbose_result(), early_exit_skipped_fraction=1.0) # None of it needed tokenizing.
+            return self.classify_verbose_stream(text, extra_verbosity, chunk_size=EARLY_EXIT_CHUNK_SIZE, early_exit=True)
+        return next(self.classify_verbose_many([text], extra_verbosity))
+
+    def classify_many(self, texts:Iterable[str], early_exit:bool=False) -> Iterator[bool]:
+        for text in texts:
+            yield self.classify(text, early_exit)
 
-    def classify(self, text:bytes) -> bool:
-        v = self.create_feature_vector(text)
+    def classify_verbose_many(self, texts:Iterable[str], extra_verbosity:bool=False, batch_size:int=BATCH_SIZE) -> Iterator[dict]:
+        """Verbose classification of many texts, yielded in input order.  Feature vectors are built per batch so the model runs once per batch rather than once per text,
+           since sklearn's per-call input validation otherwise dominates."""
+        texts = iter(texts)
+        while True:
+            batch = list(itertools.islice(texts, batch_size))
+            if not batch:
+                return
+            gated = [self._is_gated(text) for text in batch]
+            results = iter(self._verbose_results([self.create_feature_vector(text, extra_verbosity) for text, is_gated in zip(batch, gated) if not is_gated]))
+            yield from (self._gated_verbose_result() if is_gated else next(results) for is_gated in gated)
+
+    def classify_stream(self, source:"Union[IO, bytes, mmap.mmap]", **kwargs) -> bool:
+        """Classifies a document read incrementally from a file object, bytes or mmap; see create_feature_vector_streaming for the keyword arguments."""
+        v = self.create_feature_vector_streaming(source, **kwargs)
         return self._do_naive_prediction(v)
 
-    def classify_verbose(self, text:bytes, extra_verbosity:bool=False) -> bool:
-        v = self.create_feature_vector(text, extra_verbosity)
-        return {'result':self._do_naive_prediction(v),
-                'ml_result':self._do_ml_prediction(v),
-                'ml_result_probability':self._model.predict_log_proba([v])[0],
-                't2_token_count':v[0],
-                't1_token_count':v[1],
-                'percent_of_all_t2':v[2],
-                'percent_of_all_t1':v[3],
-                't2_version_count':v[4],
-                't1_version_count':v[5]}
+    def _gated_verbose_result(self) -> dict:
+        """The verbose result of a document rejected by the relevance gate: that of an all-zero feature vector, which the model is only asked for once."""
+        if getattr(self, '_zero_verbose_result', None) is None:
+            self._zero_verbose_result = self._verbose_results([self._feature_vector_from_counts(0, 0, 0, 0)])[0]
+        result = dict(self._zero_verbose_result, gated=True)
+        result['ml_result_probability'] = result['ml_result_probability'].copy()
+        return result
+
+    def classify_verbose_stream(self, source:"Union[IO, bytes, mmap.mmap]", extra_verbosity:bool=False, **kwargs) -> dict:
+        v, skipped_fraction = self._scan_stream(source, extra_verbosity, **kwargs)
+        result = self._verbose_results([v])[0]
+        if kwargs.get('early_exit'):
+            result['early_exit_skipped_fraction'] = skipped_fraction
+        return result
+
+    def _verbose_results(self, feature_vectors:list) -> list:
+        if not feature_vectors:
+            return []
+        ml_results = self._do_ml_prediction(feature_vectors)
+        ml_result_probabilities = self._model.predict_log_proba(feature_vectors)
+        return [{'result':self._do_naive_prediction(v),
+                 'ml_result':ml_result,
+                 'ml_result_probability':ml_result_probability,
+                 't2_token_count':v[0],
+                 't1_token_count':v[1],
+                 'percent_of_all_t2':v[2],
+                 'percent_of_all_t1':v[3],
+                 't2_version_count':v[4],
+                 't1_version_count':v[5],
+                 'gated':False} for v, ml_result, ml_result_probability in zip(feature_vectors, ml_results, ml_result_probabilities)]
 
 
 # Should arguably be the initializer of the _TrainedModel but this oddly feels cleaner. (with the model just being the exportable bits, and this is exclusively "Training")
-def train_model(language : Language = None, service : str = None) -> _TrainedModel:
+def train_model(language : Language = None, service : str = None, score : bool = None) -> _TrainedModel:
     """Returns a model trained to classify text as being T1 for the specified language or service.  None implies wildcard.
-        Specifying include_verbose_classifier returns a function returning both the classification result and the features that lead to it."""  
+        Specifying include_verbose_classifier returns a function returning both the classification result and the features that lead to it.
+        If score (Settings.SCORE_TRAINING if None), first logs the cross-validated accuracy of candidate classifiers on the training set. (See evaluation.evaluate)"""  
+    # sklearn is imported here rather than at module level so that loading and using an already-trained model doesn't pay for the training-only imports.
+    from sklearn.neural_network import MLPClassifier
+
+    trained_model, training_vectors, training_classes = build_training_set(language, service)
+
+    logging.getLogger(__name__).info("Beginning model training")
+    # Then actually train the model.
+    if Settings.SCORE_TRAINING if score is None else score: # Model selection proper lives in the evaluation command; this is a quick check of a single training run.
+        from .evaluation import evaluate, log_results
+        log_results(evaluate(training_vectors, training_classes))
+
+    trained_model._model = MLPClassifier(solver='lbfgs', max_iter=1000, random_state=0 if Settings.OFFLINE_MIRROR_PATH else None) # Seeded offline, so that the same mirror trains the same model.
+    trained_model._model.fit(training_vectors, training_classes)
+    trained_model.relevance_gate() # Built now so the first classifications don't pay for it.
+
+    return trained_model
+
+
+def build_training_set(language : Language = None, service : str = None) -> tuple:
+    """Returns an untrained model for the specified language or service (its token and version tables, without the MLP), and the feature vectors
+        and classes to train it with."""
+    from .downloads import prefetch_corpora # As is fetching and mirroring.
+    from .mirror import CorpusMirror
+    from .artifacts import ArtifactStore
+    from .parallel import tokenize_corpora
+    from .dictionary import EnglishDictionary
 
     # Get releases metadata, extract T2 and T1 package versions to build training datasets.
     new_package_metadata = []
     old_package_metadata = []
 
+    # With an offline mirror, everything is read from it (and nothing fetched).
+    mirror = CorpusMirror(Settings.OFFLINE_MIRROR_PATH) if Settings.OFFLINE_MIRROR_PATH else None
+
     languages_to_fetch = [language] if language else LANGUAGE_REPO_MAP.keys()
     for each_language in languages_to_fetch:
-        release_info = get_release_metadata(each_language)
+        release_info = mirror.release_metadata(each_language) if mirror else get_release_metadata(each_language)
         repo = LANGUAGE_REPO_MAP[each_language]
 
         services_to_fetch = [service] if service else release_info.keys()
@@ -91,17 +272,39 @@ def train_model(language : Language = None, service : str = None) -> _TrainedMod
             new_package_metadata += [(e, each_language) for e in release_info[each_service] if e['New'].lower() == 'true']
             old_package_metadata += [(e, each_language) for e in release_info[each_service] if e['New'].lower() != 'true']
 
-    # Get the old/new corpus files.
-    new_corpus_files, new_tokens, new_versions = get_corpus_files_tokens_and_versions_for_package(new_package_metadata)
-    old_corpus_files, old_tokens, old_versions = get_corpus_files_tokens_and_versions_for_package(old_package_metadata)
+    # Get the old/new corpus files; downloaded concurrently up front, then tokenized.
+    failed = set() # Packages whose corpus could not be fetched this run.
+    get_corpora = lambda metadata: mirror.corpora(metadata) if mirror else prefetch_corpora(metadata, failed=failed)
+    if Settings.TRAINING_ARTIFACTS_PATH: # Only packages new or changed since the last run are fetched and tokenized; the rest come from its artifacts.
+        artifacts = ArtifactStore(Settings.TRAINING_ARTIFACTS_PATH)
+        stale_package_metadata = artifacts.stale(new_package_metadata + old_package_metadata)
+        corpora = get_corpora(stale_package_metadata)
+        corpus_tokens = tokenize_corpora(get_corpora_without_apistubgen(stale_package_metadata, corpora), Settings.TOKENIZATION_PROCESSES)
+        for (each, each_language) in stale_package_metadata:
+            artifacts.put(each, each_language, *get_corpus_files_tokens_and_versions_for_one_package(each, each_language, corpora, corpus_tokens),
+                          complete=get_corpus_arguments(each, each_language) not in failed) # So a failed fetch is retried next run.
+        dropped = artifacts.prune(languages_to_fetch, new_package_metadata + old_package_metadata) if not service else 0 # Other services' packages aren't in the metadata.
+        artifacts.save()
+        logging.getLogger(__name__).info("Incremental training: {} packages new or changed, {} dropped".format(len(stale_package_metadata), dropped))
+        new_corpus_files, new_tokens, new_versions = artifacts.merge(new_package_metadata)
+        old_corpus_files, old_tokens, old_versions = artifacts.merge(old_package_metadata)
+    else:
+        corpora = get_corpora(new_package_metadata + old_package_metadata)
+        corpus_tokens = tokenize_corpora(get_corpora_without_apistubgen(new_package_metadata + old_package_metadata, corpora), Settings.TOKENIZATION_PROCESSES)
+        new_corpus_files, new_tokens, new_versions = get_corpus_files_tokens_and_versions_for_package(new_package_metadata, corpora, corpus_tokens)
+        old_corpus_files, old_tokens, old_versions = get_corpus_files_tokens_and_versions_for_package(old_package_metadata, corpora, corpus_tokens)
 
     # Use tokens to build t1/t2 intersection sets
     intersection = new_tokens.intersection(old_tokens)
-    only_new_tokens = new_tokens - intersection - set([t for t in new_tokens if not re.search('[a-zA-Z]', t) or check_in_english_dictionary(t)]) # remove english words as that causes false positives as opposed to only looking at "tech terms", and remove punctuation-only noise.
-    only_old_tokens = old_tokens - intersection - set([t for t in old_tokens if not re.search('[a-zA-Z]', t) or check_in_english_dictionary(t)]) # MAYBE TODO: Should only do this for non-apistubgenned files?  TODO: If you end up using this for language classification, disable punctuation removal.
     version_intersection = new_versions.intersection(old_versions)
-    only_new_versions = new_versions - version_intersection - set([t for t in new_versions if not t.strip() or check_in_english_dictionary(t)])
-    only_old_versions = old_versions - version_intersection - set([t for t in old_versions if not t.strip() or check_in_english_dictionary(t)])
+    # Only tokens outside the intersections can survive, so only they are looked up; all at once, and memoized across runs. (See dictionary.EnglishDictionary)
+    english = EnglishDictionary(Settings.ENGLISH_WORDLIST_PATH)
+    english_words = english.english_words([t for t in new_tokens ^ old_tokens if re.search('[a-zA-Z]', t)] + [t for t in new_versions ^ old_versions if t.strip()])
+    english.close()
+    only_new_tokens = new_tokens - intersection - set([t for t in new_tokens if not re.search('[a-zA-Z]', t) or t in english_words]) # remove english words as that causes false positives as opposed to only looking at "tech terms", and remove punctuation-only noise.
+    only_old_tokens = old_tokens - intersection - set([t for t in old_tokens if not re.search('[a-zA-Z]', t) or t in english_words]) # MAYBE TODO: Should only do this for non-apistubgenned files?  TODO: If you end up using this for language classification, disable punctuation removal.
+    only_new_versions = new_versions - version_intersection - set([t for t in new_versions if not t.strip() or t in english_words])
+    only_old_versions = old_versions - version_intersection - set([t for t in old_versions if not t.strip() or t in english_words])
 
     # Train classifier on old/new corpus files.  (TODO: Yes, this is highly overfitting, mostly here as PoC, as we improve the testcorpus (which we should incorporate once mature) and train this on real content we will get better false positive/negative representation, in the meantime we'll use a naive decision function that "mostly performs pretty well".) 
     # First, build training vectors, and the vectorizer we'll be exporting with our classifier. (we build our model incrementally)
@@ -117,7 +320,7 @@ def train_model(language : Language = None, service : str = None) -> _TrainedMod
 
     # We want to include not only the "perfect examples" (corpus files) but real-world/ambiguous examples.
     test_corpus_glob = os.path.join(Settings.TEST_CORPUS_BASE_PATH, '/TestCorpus/*/*/*/*')
-    for file_path in glob.glob(test_corpus_glob, recursive=True):
+    for file_path in sorted(glob.glob(test_corpus_glob, recursive=True)):
         with open(file_path) as f:
             path_base, path_language, path_service, path_tier, file_name = os.path.normpath(file_path).split(os.sep)
             assert path_base == 'TestCorpus'
@@ -127,20 +330,4 @@ def train_model(language : Language = None, service : str = None) -> _TrainedMod
             training_classes.append(path_tier)
             logging.getLogger(__name__).info("INCORPORATING TEST CORPUS FILE: {}".format(file_path))
 
-    logging.getLogger(__name__).info("Beginning model training")
-    # Then actually train the model.
-    should_score = True
-    if should_score:
-        # These are the classifiers that experimentally seemed to perform best on the style of feature vectors we were using. (Tested RandomForest (which is more advised for if this went a multi-class approach), KNeighborsClassifier, Linear SVM, RBF SVM, Neural Net, Naive Bayes)
-        # MLP and Linear SVC are most promising.  RBF/Kneighbors may be good with more training data, or if we find eccentricities in real world results that benefit from how they classify.
-        for classifier in [KNeighborsClassifier(), # Performs least well but _may_ give some good extrapolative properties.  Leaving in for testing.
-                           SVC(kernel="linear"),
-                           SVC(gamma=.5),
-                           MLPClassifier(solver='lbfgs', max_iter=1000)]:
-            scores = cross_val_score(classifier, training_vectors, training_classes, cv=10)
-            logging.getLogger(__name__).info("%s Accuracy: %0.2f (+/- %0.2f) N=%0.2f" % (str(classifier), scores.mean(), scores.std() * 2, len(training_vectors)/10))
-
-    trained_model._model = MLPClassifier(solver='lbfgs', max_iter=1000)
-    trained_model._model.fit(training_vectors, training_classes)
-
-    return trained_model
+    return trained_model, training_vectors, training_classes
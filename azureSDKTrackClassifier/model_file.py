@@ -0,0 +1,252 @@
+import json
+import mmap
+from itertools import compress
+from operator import methodcaller
+import struct
+import zlib
+
+import numpy
+
+from .matchers import TokenIndex
+
+# Compact, versioned model file format; an alternative to pickling the whole classifier object graph.
+#
+# Layout: MAGIC | uint32 header length | JSON header | sections...
+# The header records the format version, the model fingerprint and metadata, and the offset/length of every section.  Sections are the token
+# and version tables (uint64 offsets followed by the concatenated UTF-8 strings), the MLP weights as raw little-endian float64 arrays, and for
+# the tokens, arrays of their crc32s and labels.  Sections are 8-byte aligned so that they can be used in place from a read-only mmap: the MLP
+# weights always are, and tokens are stored ordered by crc32 so that the token index can be as well. (See MappedTokenIndex.)  Only a model loaded
+# with shared=True opens near-instantly and shares its pages between processes; otherwise every token is decoded into an in-memory TokenIndex,
+# which costs time proportional to the token table on open but classifies faster.
+
+MAGIC = b'AZT1MDL\x00'
+FORMAT_VERSION = 1
+_ALIGNMENT = 8
+_DECODE_SLICE = 4096 # Tokens decoded at a time by MappedTokenIndex.iter_tokens.
+
+PICKLE_FORMAT = 'pickle'
+COMPACT_FORMAT = 'compact'
+
+
+def is_compact_model(prefix:bytes) -> bool:
+    """ Whether the given leading bytes of a model file are those of the compact format. """
+    return bytes(prefix[:len(MAGIC)]) == MAGIC
+
+
+class MLPWeights:
+    """ Inference-only stand-in for a trained sklearn MLPClassifier, holding just its weights.
+
+        Reproduces MLPClassifier.predict / predict_log_proba without needing sklearn (or a matching sklearn version) at load time. """
+
+    _ACTIVATIONS = {'identity':lambda x: x,
+                    'relu':lambda x: numpy.maximum(x, 0),
+                    'tanh':numpy.tanh,
+                    'logistic':lambda x: 1 / (1 + numpy.exp(-x))}
+
+    def __init__(self, coefs:list, intercepts:list, classes:list, activation:str='relu', out_activation:str='logistic'):
+        self.coefs_ = coefs
+        self.intercepts_ = intercepts
+        self.classes_ = numpy.array(classes)
+        self.activation = activation
+        self.out_activation_ = out_activation
+
+    @classmethod
+    def from_sklearn(cls, mlp:"MLPClassifier") -> "MLPWeights":
+        return cls(mlp.coefs_, mlp.intercepts_, [str(c) for c in mlp.classes_], mlp.activation, mlp.out_activation_)
+
+    def _forward(self, X) -> numpy.ndarray:
+        activation = numpy.asarray(X, dtype=numpy.float64)
+        with numpy.errstate(over='ignore'):
+            for i, (coef, intercept) in enumerate(zip(self.coefs_, self.intercepts_)):
+                activation = activation @ coef + intercept
+                if i != len(self.coefs_) - 1:
+                    activation = self._ACTIVATIONS[self.activation](activation)
+            if self.out_activation_ == 'softmax':
+                activation = numpy.exp(activation - activation.max(axis=1, keepdims=True))
+                return activation / activation.sum(axis=1, keepdims=True)
+            return self._ACTIVATIONS[self.out_activation_](activation)
+
+    def predict_proba(self, X) -> numpy.ndarray:
+        y_pred = self._forward(X)
+        if y_pred.shape[1] == 1:
+            y_pred = y_pred.ravel()
+            return numpy.vstack([1 - y_pred, y_pred]).T
+        return y_pred
+
+    def predict_log_proba(self, X) -> numpy.ndarray:
+        return numpy.log(self.predict_proba(X))
+
+    def predict(self, X) -> numpy.ndarray:
+        y_pred = self._forward(X)
+        if y_pred.shape[1] == 1:
+            return self.classes_[(y_pred.ravel() > 0.5).astype(int)]
+        return self.classes_[y_pred.argmax(axis=1)]
+
+
+_encode = methodcaller('encode', 'utf-8', 'surrogatepass')
+
+
+class MappedTokenIndex:
+    """ Read-only TokenIndex used in place from a compact model's buffer, so processes mapping the same model file share it rather than each building their own.
+
+        Lookups hash each document token (crc32 of its UTF-8), find candidates in the sorted hash array with a vectorized binary search, and confirm
+        them against the token table, so only actual hits are handled one at a time.  Slower per document than the in-memory TokenIndex. """
+
+    NEW, OLD, MISSING = TokenIndex.NEW, TokenIndex.OLD, TokenIndex.MISSING
+
+    def __init__(self, buffer, base:int, sections:dict):
+        self._buffer, self._base, self._sections = buffer, base, sections
+        self._hashes = _array(buffer, base, sections['token_hashes'])
+        self._labels = _array(buffer, base, sections['token_labels'])
+        self._offsets = numpy.frombuffer(buffer, dtype='<u8', count=sections['tokens']['count'] + 1, offset=base + sections['tokens']['offset'])
+        self._data_offset = base + sections['tokens']['offset'] + self._offsets.nbytes
+        self._sizes = tuple(int(numpy.count_nonzero(self._labels == label)) for label in [self.NEW, self.OLD])
+
+    def __reduce__(self):
+        # A buffer can't be shared through pickling; degrade to the ordinary in-memory index.
+        return (TokenIndex, (self.tokens(self.NEW), self.tokens(self.OLD)))
+
+    def size(self, label:int) -> int:
+        return self._sizes[label]
+
+    def tokens(self, label:int) -> list:
+        return _tokens_with_label(self._buffer, self._base, self._sections, label)
+
+    def iter_tokens(self):
+        # Decoded a slice of the table at a time, so a pass over every token never holds them all in memory at once.
+        count = self._sections['tokens']['count']
+        for start in range(0, count, _DECODE_SLICE):
+            end = min(start + _DECODE_SLICE, count)
+            data = bytes(self._buffer[self._data_offset + int(self._offsets[start]):self._data_offset + int(self._offsets[end])])
+            offsets = (self._offsets[start:end + 1] - self._offsets[start]).tolist()
+            yield from (data[s:e].decode('utf-8', 'surrogatepass') for s, e in zip(offsets, offsets[1:]))
+
+    def _labelled_hits(self, tokens) -> list:
+        """ Returns (token, label) for each of the given tokens present in the index. """
+        tokens = list(tokens)
+        if not tokens or not len(self._hashes):
+            return []
+        encoded = list(map(_encode, tokens))
+        hashes = numpy.fromiter(map(zlib.crc32, encoded), dtype=numpy.uint32, count=len(encoded))
+        positions = numpy.searchsorted(self._hashes, hashes)
+        candidates = numpy.flatnonzero(self._hashes[numpy.minimum(positions, len(self._hashes) - 1)] == hashes)
+        hits = []
+        for i in candidates.tolist():
+            position = int(positions[i])
+            while position < len(self._hashes) and self._hashes[position] == hashes[i]: # crc32 can collide, so confirm against the token itself.
+                start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+                if self._buffer[self._data_offset + start:self._data_offset + end] == encoded[i]:
+                    hits.append((tokens[i], int(self._labels[position])))
+                    break
+                position += 1
+        return hits
+
+    def count(self, tokens) -> tuple:
+        labels = [label for _, label in self._labelled_hits(tokens)]
+        return labels.count(self.NEW), labels.count(self.OLD)
+
+    def hits(self, tokens) -> set:
+        return {token for token, _ in self._labelled_hits(tokens)}
+
+    def find(self, tokens, label:int) -> set:
+        return {token for token, l in self._labelled_hits(tokens) if l == label}
+
+    def any_hit(self, tokens) -> bool:
+        return bool(self._labelled_hits(tokens))
+
+
+def _tokens_with_label(buffer, base:int, sections:dict, label:int) -> list:
+    tokens = _decode_table(buffer, base + sections['tokens']['offset'], sections['tokens']['count'])
+    return sorted(compress(tokens, (_array(buffer, base, sections['token_labels']) == label).tolist()))
+
+
+def _array(buffer, base:int, section:dict) -> numpy.ndarray:
+    shape = section['shape']
+    return numpy.frombuffer(buffer, dtype=section.get('dtype', '<f8'), count=int(numpy.prod(shape)), offset=base + section['offset']).reshape(shape)
+
+
+def _encode_table(strings:list) -> bytes:
+    encoded = [s if isinstance(s, bytes) else _encode(s) for s in strings]
+    offsets = numpy.cumsum([0] + [len(e) for e in encoded], dtype='<u8')
+    return offsets.tobytes() + b''.join(encoded)
+
+
+def _decode_table(buffer, offset:int, count:int) -> list:
+    offsets = numpy.frombuffer(buffer, dtype='<u8', count=count + 1, offset=offset).tolist()
+    data = bytes(buffer[offset + 8 * (count + 1):offset + 8 * (count + 1) + offsets[-1]])
+    return [data[start:end].decode('utf-8', 'surrogatepass') for start, end in zip(offsets, offsets[1:])]
+
+
+def dump_model(trained_model:"_TrainedModel", metadata:dict) -> bytes:
+    """ Serializes a trained model (and arbitrary JSON-able metadata, e.g. the language and service it was trained for) into the compact format. """
+    mlp = trained_model._model if isinstance(trained_model._model, MLPWeights) else MLPWeights.from_sklearn(trained_model._model)
+    by_hash = sorted((zlib.crc32(e), e, label) for label in [TokenIndex.NEW, TokenIndex.OLD] for e in map(_encode, trained_model._token_index.tokens(label)))
+    sections = [('tokens', 'table', [e for _, e, _ in by_hash]),
+                ('token_hashes', 'array', numpy.array([h for h, _, _ in by_hash], dtype='<u4')),
+                ('token_labels', 'array', numpy.array([l for _, _, l in by_hash], dtype='u1')),
+                ('only_new_versions', 'table', sorted(trained_model._only_new_versions)),
+                ('only_old_versions', 'table', sorted(trained_model._only_old_versions))]
+    sections += [('coefs_{}'.format(i), 'array', c) for i, c in enumerate(mlp.coefs_)]
+    sections += [('intercepts_{}'.format(i), 'array', c) for i, c in enumerate(mlp.intercepts_)]
+
+    body, section_headers = bytearray(), {}
+    for name, kind, value in sections:
+        body += b'\x00' * (-len(body) % _ALIGNMENT)
+        if kind == 'table':
+            section_headers[name] = {'offset':len(body), 'count':len(value)}
+            body += _encode_table(value)
+        else:
+            array = numpy.ascontiguousarray(value, dtype=value.dtype if value.dtype.kind in 'ui' else '<f8')
+            section_headers[name] = {'offset':len(body), 'shape':list(array.shape), 'dtype':array.dtype.str}
+            body += array.tobytes()
+
+    header = json.dumps({'format_version':FORMAT_VERSION,
+                         'fingerprint':trained_model.fingerprint(),
+                         'metadata':metadata,
+                         'mlp':{'layers':len(mlp.coefs_), 'classes':[str(c) for c in mlp.classes_], 'activation':mlp.activation, 'out_activation':mlp.out_activation_},
+                         'sections':section_headers}).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(header)) + header
+    prefix += b'\x00' * (-len(prefix) % _ALIGNMENT) # Keeps section offsets aligned relative to the start of the file, too.
+    return prefix + bytes(body)
+
+
+def read_header(buffer) -> tuple:
+    """ Returns the parsed header of a compact model, and the offset at which its sections begin. """
+    if not is_compact_model(buffer):
+        raise ValueError("Not a compact model file.")
+    (header_length,) = struct.unpack_from('<I', buffer, len(MAGIC))
+    header_end = len(MAGIC) + 4 + header_length
+    header = json.loads(bytes(buffer[len(MAGIC) + 4:header_end]).decode('utf-8'))
+    if header['format_version'] > FORMAT_VERSION:
+        raise ValueError("Model file format version {} is newer than the supported version {}; upgrade this package to load it.".format(header['format_version'], FORMAT_VERSION))
+    return header, header_end + (-header_end % _ALIGNMENT)
+
+
+def load_model(buffer, shared:bool=False) -> tuple:
+    """ Returns the (_TrainedModel, metadata) stored in a compact model held in buffer (bytes or an mmap).
+        The MLP weights reference buffer directly rather than being copied, so an mmap must stay open for as long as the model is used.
+        If shared, the token index is also used in place (see MappedTokenIndex) rather than built in memory. """
+    from .model import _TrainedModel
+    header, base = read_header(buffer)
+    sections = header['sections']
+    tables = {name:_decode_table(buffer, base + sections[name]['offset'], sections[name]['count']) for name in ['only_new_versions', 'only_old_versions']}
+    array = lambda name: _array(buffer, base, sections[name])
+
+    trained_model = _TrainedModel((), (), set(tables['only_new_versions']), set(tables['only_old_versions']))
+    if shared:
+        trained_model._token_index = MappedTokenIndex(buffer, base, sections)
+    else:
+        trained_model._token_index = TokenIndex(*(_tokens_with_label(buffer, base, sections, label) for label in [TokenIndex.NEW, TokenIndex.OLD]))
+    mlp = header['mlp']
+    trained_model._model = MLPWeights([array('coefs_{}'.format(i)) for i in range(mlp['layers'])],
+                                      [array('intercepts_{}'.format(i)) for i in range(mlp['layers'])],
+                                      mlp['classes'], mlp['activation'], mlp['out_activation'])
+    trained_model._fingerprint = header['fingerprint']
+    return trained_model, header['metadata']
+
+
+def load_model_file(path:str, shared:bool=False) -> tuple:
+    """ Memory-maps the compact model file at path and loads it; see load_model. """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # Outlives the file handle; closed once nothing references the model's arrays.
+    return load_model(mapped, shared)
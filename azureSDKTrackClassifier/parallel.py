@@ -0,0 +1,137 @@
+from collections import deque
+import multiprocessing
+import os
+from typing import Iterable, Iterator
+
+from .helpers import classify_texts
+from .model import BATCH_SIZE
+from .tokenizers import tokenize_texts
+
+# Target amount of text per batch handed to a worker.  Small enough that work stays evenly spread as workers finish at different rates,
+# large enough that the per-batch round trip between processes is negligible next to classifying it.
+BATCH_CHARACTERS = 1 << 18
+
+# Target amount of text per batch of corpus files tokenized by a worker when training; see tokenize_corpora.
+TOKENIZATION_BATCH_CHARACTERS = 1 << 22
+# Below this much text in all, corpora are tokenized serially; about a second of tokenizing.
+TOKENIZATION_PARALLEL_THRESHOLD = 1 << 24
+
+_worker_classifier = None
+_worker_options = None
+
+
+def _initialize_worker(model_path:str, verbose:bool, early_exit:bool, cache_results:bool=False):
+    global _worker_classifier, _worker_options
+    from .classifier import AzureSDKTrackClassifier
+    _worker_classifier = AzureSDKTrackClassifier.load(model_path, shared=True) # Attaches to the model file rather than receiving a private copy of the model.
+    if cache_results:
+        _worker_classifier.enable_result_cache(persistent=True) # Every worker shares the one on-disk store.
+    _worker_options = verbose, early_exit
+
+
+def _classify_batch(batch:list) -> tuple:
+    # Returns the batch's (key, result) pairs, how many of its documents the relevance gate rejected, and how it changed the result cache's counters (if any).
+    keys, texts = zip(*batch)
+    gated_before = _worker_classifier.gate_stats()['gated_documents']
+    cache_before = _worker_classifier.result_cache_stats()
+    pairs = list(zip(keys, classify_texts(_worker_classifier, texts, *_worker_options)))
+    cache_after = _worker_classifier.result_cache_stats()
+    cache_delta = {name:cache_after[name] - cache_before[name] for name in cache_after} if cache_after else None
+    return pairs, _worker_classifier.gate_stats()['gated_documents'] - gated_before, cache_delta
+
+
+def _batches(items:Iterable[tuple], batch_characters:int, max_batch_size:int) -> Iterator[list]:
+    """ Groups (key, text) items into batches of about batch_characters of text, and at most max_batch_size items. """
+    batch, characters = [], 0
+    for key, text in items:
+        batch.append((key, text))
+        characters += len(text)
+        if characters >= batch_characters or len(batch) >= max_batch_size:
+            yield batch
+            batch, characters = [], 0
+    if batch:
+        yield batch
+
+
+class WorkerPool:
+    """ Persistent pool of classification worker processes.
+
+        Each worker attaches once, at startup, to the compact model file at model_path (see helpers.shared_model_file), then repeatedly pulls the
+        next batch of documents as it finishes the last, so a slow batch never leaves the other workers idle.  If cache_results, each worker enables the
+        persistent result cache (see AzureSDKTrackClassifier.enable_result_cache).  Use as a context manager, or close(). """
+
+    def __init__(self, model_path:str, processes:int, verbose:bool=False, early_exit:bool=False, batch_characters:int=BATCH_CHARACTERS, max_batch_size:int=BATCH_SIZE,
+                 cache_results:bool=False):
+        self._batch_characters, self._max_batch_size = batch_characters, max_batch_size
+        self._max_pending_batches = 2 * processes # Enough to keep every worker busy, while bounding how much of items is read ahead.
+        self.gated_documents = 0 # Documents found not T1 by the workers' relevance gates; see AzureSDKTrackClassifier.gate_stats.
+        self.result_cache_stats = None # The workers' result cache counters, summed; see AzureSDKTrackClassifier.result_cache_stats.
+        self._pool = multiprocessing.Pool(processes, initializer=_initialize_worker, initargs=(model_path, verbose, early_exit, cache_results))
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def classify(self, items:Iterable[tuple]) -> Iterator[tuple]:
+        """ Classifies (key, text) items, yielding (key, result) in input order as results arrive; results are those of is_t1, or of is_t1_verbose if verbose.
+            items is read lazily, only a few batches ahead of the results, so it may be arbitrarily long. """
+        pending = deque()
+        for batch in _batches(items, self._batch_characters, self._max_batch_size):
+            pending.append(self._pool.apply_async(_classify_batch, (batch,)))
+            if len(pending) >= self._max_pending_batches:
+                yield from self._results(pending.popleft())
+        while pending:
+            yield from self._results(pending.popleft())
+
+    def _results(self, pending_batch) -> list:
+        pairs, gated_documents, cache_delta = pending_batch.get()
+        self.gated_documents += gated_documents
+        if cache_delta:
+            self.result_cache_stats = {name:(self.result_cache_stats or {}).get(name, 0) + count for name, count in cache_delta.items()}
+        return pairs
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+def _tokenize_corpus_batch(batch:tuple) -> tuple:
+    # Tokens never contain whitespace, so one newline-joined string carries them back far more cheaply than a pickled set would.
+    key, texts = batch
+    return key, '\n'.join(tokenize_texts(texts))
+
+
+def _corpus_batches(corpora:dict, batch_characters:int) -> Iterator[tuple]:
+    """ Splits each corpus into (key, texts, characters) batches of its files' texts, of about batch_characters of text each. """
+    for key, corpus in corpora.items():
+        texts, characters = [], 0
+        for text in corpus.values():
+            texts.append(text)
+            characters += len(text)
+            if characters >= batch_characters:
+                yield key, texts, characters
+                texts, characters = [], 0
+        if texts:
+            yield key, texts, characters
+
+
+def tokenize_corpora(corpora:dict, processes:int=None, batch_characters:int=TOKENIZATION_BATCH_CHARACTERS, parallel_threshold:int=TOKENIZATION_PARALLEL_THRESHOLD) -> dict:
+    """ Returns the tokens of each corpus (a dict of file name to text) in corpora, by the same key, as helpers.get_corpus_files_tokens_and_versions_for_package
+        would extract them; for its corpus_tokens.  Corpora are split into batches of their files of about batch_characters of text, which are tokenized on
+        processes workers (os.cpu_count() if None), largest first, and merged back per corpus; so one large corpus (e.g. a monorepo's) is spread across workers.
+
+        Each batch's text is sent with its task, and only its tokens come back, so workers start the same however processes are created (forked or spawned)
+        and never hold more than the batches they are working on.  Corpora of fewer than parallel_threshold characters in all are tokenized in this process,
+        as starting workers and sending them the text would cost more than it saves. """
+    processes = processes or os.cpu_count() or 1
+    batches = sorted(_corpus_batches(corpora, batch_characters), key=lambda batch: -batch[2]) # So a large batch doesn't start last and leave the other workers idle.
+    if processes <= 1 or len(batches) <= 1 or sum(characters for _, _, characters in batches) < parallel_threshold:
+        return {key:tokenize_texts(corpus.values()) for key, corpus in corpora.items()}
+    corpus_tokens = {key:set() for key in corpora}
+    with multiprocessing.Pool(min(processes, len(batches))) as pool:
+        for key, tokens in pool.imap_unordered(_tokenize_corpus_batch, ((key, texts) for key, texts, _ in batches)):
+            if tokens:
+                corpus_tokens[key].update(tokens.split('\n'))
+    return corpus_tokens
@@ -0,0 +1,133 @@
+from collections import OrderedDict
+import logging
+import os
+import threading
+from typing import Callable
+
+from .classifier import AzureSDKTrackClassifier
+from .constants import Language
+
+# Prebuilt models for many (language, service) pairs, for callers that know the context of what they classify and want the model specialized for it
+# rather than the all-up one, without training or holding every model at once.
+#
+# A registry knows where each pair's saved model is (given explicitly, or found by name in a directory; see model_file_name), loads a model the first time
+# it is asked for, and keeps at most max_models of them (and, if given, max_bytes of them) resident, evicting the least recently used.  A pair without a
+# model of its own falls back to its language's all-services model, (language, None), then to the all-up model, (None, None); as does a language the
+# registry doesn't know at all.
+
+MODEL_FILE_PREFIX = 'azureSDKTrackClassifier_'
+MODEL_FILE_SUFFIX = '.model'
+DEFAULT_MAX_MODELS = 8
+
+
+def _key(language:Language, service:str) -> tuple:
+    try:
+        language = Language(language).value if language else None
+    except ValueError:
+        language = str(language) # A language with no Language of its own has no model of its own either, so resolves to the all-up model.
+    return language, service or None
+
+
+def model_file_name(language:Language=None, service:str=None) -> str:
+    """ The name a registry directory holds the model for language and service under; the name AzureSDKTrackClassifier.save gives it by default. """
+    language, service = _key(language, service)
+    return '{}{}_{}{}'.format(MODEL_FILE_PREFIX, language, service, MODEL_FILE_SUFFIX)
+
+
+def parse_model_file_name(name:str) -> tuple:
+    """ Returns the (language, service) of a model file named by model_file_name, or None if name isn't one. """
+    if not name.startswith(MODEL_FILE_PREFIX) or not name.endswith(MODEL_FILE_SUFFIX):
+        return None
+    language, _, service = name[len(MODEL_FILE_PREFIX):-len(MODEL_FILE_SUFFIX)].partition('_')
+    language = language.split('Language.', 1)[-1] # As models saved with a Language, rather than its value, are named.
+    if not _ or language not in {l.value for l in Language} | {'None'}:
+        return None
+    return (None if language == 'None' else language), (None if service == 'None' else service)
+
+
+class ModelRegistry:
+    """ Lazily loaded, least-recently-used set of prebuilt models by (language, service); see above.  Safe to use from several threads.
+
+        models maps (language, service) to the path of its saved model (either format; see AzureSDKTrackClassifier.load), and directory is searched for
+        models named by model_file_name; explicit paths win.  Resident models are accounted for by the size of their model file, so max_bytes bounds the
+        total file size of the resident models.  That is what they take in memory only for compact models loaded shared, which map their file (and hold
+        little else); other loads build tables on the heap several times the size of their file (about 3-5x, as measured for both formats), so size
+        max_bytes accordingly.  shared is passed on to AzureSDKTrackClassifier.load, and configure,
+        if given, is called with each model once loaded. (e.g. to enable_result_cache)  A model evicted while a caller still uses it stays usable; it is
+        freed once the caller lets it go. """
+
+    def __init__(self, models:dict=None, directory:str=None, max_models:int=DEFAULT_MAX_MODELS, max_bytes:int=None, shared:bool=False, configure:Callable=None):
+        self._paths = {}
+        if directory:
+            for name in sorted(os.listdir(directory)):
+                key = parse_model_file_name(name)
+                if key:
+                    self._paths[key] = os.path.join(directory, name)
+        for (language, service), path in (models or {}).items():
+            self._paths[_key(language, service)] = path
+        self.max_models, self.max_bytes = max_models, max_bytes
+        self._shared, self._configure = shared, configure
+        self._resident = OrderedDict() # (language, service) -> (classifier, bytes), least recently used first.
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._counters = {'hits':0, 'loads':0, 'evictions':0, 'fallbacks':0}
+
+    def keys(self) -> list:
+        """ The (language, service) pairs with a model of their own. """
+        return sorted(self._paths, key=lambda key: (key[0] or '', key[1] or ''))
+
+    def resolve(self, language:Language=None, service:str=None) -> tuple:
+        """ Returns the (language, service) whose model classifies for language and service; see above.  Raises KeyError if there is none. """
+        language, service = _key(language, service)
+        for key in [(language, service), (language, None), (None, None)]:
+            if key in self._paths:
+                return key
+        raise KeyError("No model for language {} and service {}, nor a fallback model. (Known: {})".format(language, service, self.keys()))
+
+    def get(self, language:Language=None, service:str=None) -> AzureSDKTrackClassifier:
+        """ Returns the model for language and service (see resolve), loading it if it isn't resident. """
+        key = self.resolve(language, service)
+        with self._lock:
+            if key != _key(language, service):
+                self._counters['fallbacks'] += 1
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock: # So concurrent callers wait for one load rather than each loading the model.
+            with self._lock:
+                if key in self._resident:
+                    self._resident.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return self._resident[key][0]
+            path = self._paths[key]
+            logging.getLogger(__name__).info("Loading model for language {} and service {} from {}".format(*key, path))
+            classifier = AzureSDKTrackClassifier.load(path, self._shared)
+            if self._configure:
+                self._configure(classifier)
+            size = os.path.getsize(path)
+            with self._lock:
+                self._counters['loads'] += 1
+                self._resident[key] = (classifier, size)
+                self._evict(keep=key)
+        return classifier
+
+    def _evict(self, keep:tuple):
+        while len(self._resident) > 1 and (len(self._resident) > self.max_models or (self.max_bytes is not None and self.resident_bytes() > self.max_bytes)):
+            key = next(k for k in self._resident if k != keep)
+            logging.getLogger(__name__).info("Evicting model for language {} and service {}".format(*key))
+            del self._resident[key]
+            self._counters['evictions'] += 1
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in self._resident.values())
+
+    def stats(self) -> dict:
+        """ Returns the resident models (as {"language/service": bytes}, least recently used first), their total bytes, and hit, load, eviction and fallback counters. """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['resident'] = {'{}/{}'.format(*key):size for key, (_, size) in self._resident.items()}
+            stats['resident_bytes'] = self.resident_bytes()
+        return stats
+
+    def clear(self):
+        """ Evicts every resident model. """
+        with self._lock:
+            self._resident.clear()
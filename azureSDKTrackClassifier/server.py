@@ -0,0 +1,399 @@
+import argparse
+import http.client
+import http.server
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Iterable
+
+from .classifier import AzureSDKTrackClassifier
+from .helpers import classify_texts, json_default
+from .inputs import walk_files
+from .model import BATCH_SIZE
+
+# Long-running classification daemon, so that callers classifying a few documents at a time don't each pay interpreter startup, imports and model loading.
+#
+# Serves JSON over HTTP, on a TCP port or a Unix socket:
+#   POST /classify       {"text": str, "verbose": bool, "early_exit": bool, "model": str}           -> summary_result, as printed by the CLI
+#   POST /classify_many  {"documents": {path: text}, "verbose": bool, "early_exit": bool, "model": str} -> summary_result
+#   GET  /health         -> {"status": "ok", "models": {name: fingerprint}}
+#   GET  /metrics        -> request, document, batch and rejection counters, and each model's result cache and relevance gate counters
+# ("verbose", "early_exit" and "model" are optional; "model" defaults to the first model served.)
+#
+# Documents from concurrent requests for the same model are classified together in batches (see _Batcher), and at most max_concurrency
+# requests are handled at once; requests waiting longer than queue_timeout for their turn are answered 503.  A request's body is only read once
+# it has its turn, so memory is bounded by max_concurrency however many clients are waiting.
+#
+# Run with `python -m azureSDKTrackClassifier.server serve --model <path>`, and query with `python -m azureSDKTrackClassifier.server classify <text>`
+# (or ClassificationClient).
+
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.005
+MAX_CONCURRENCY = 64
+QUEUE_TIMEOUT = 30
+MAX_REQUEST_BYTES = 64 << 20
+DISCARD_CHUNK_BYTES = 1 << 16
+
+
+def summarize(results:Iterable[tuple]) -> dict:
+    """ Builds the CLI's summary_result from (path, result) pairs. """
+    summary_result = {'t1_documents':0,'total_documents':0,'per_document_results':{}}
+    for path, result in results:
+        summary_result['t1_documents'] += int(result['result'] if not isinstance(result, bool) else result)
+        summary_result['total_documents'] += 1
+        summary_result['per_document_results'][path] = result
+    return summary_result
+
+
+def _to_json(value) -> bytes:
+    return json.dumps(value, default=json_default).encode('utf-8')
+
+
+class _Batcher:
+    """ Classifies the documents of concurrent requests for one model together.
+
+        Requests are queued; a single thread takes the first waiting request, gathers any others arriving within batch_window seconds (up to
+        max_batch_size documents), and classifies each group of requests sharing the same options with one call to the batch APIs.
+        Being the only thread using its classifier, it also keeps the classifier's (not thread-safe) result cache consistent. """
+
+    def __init__(self, classifier:AzureSDKTrackClassifier, max_batch_size:int, batch_window:float, metrics:"_Metrics"):
+        self._classifier, self._max_batch_size, self._batch_window, self._metrics = classifier, max_batch_size, batch_window, metrics
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def classify(self, texts:list, verbose:bool, early_exit:bool) -> list:
+        request = {'texts':texts, 'options':(verbose, early_exit), 'done':threading.Event(), 'results':None, 'error':None}
+        self._requests.put(request)
+        request['done'].wait()
+        if request['error']:
+            raise request['error']
+        return request['results']
+
+    def stop(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch, size, deadline = [request], len(request['texts']), time.monotonic() + self._batch_window
+            while size < self._max_batch_size:
+                try:
+                    request = self._requests.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._requests.put(None) # Stop once this batch is done.
+                    break
+                batch.append(request)
+                size += len(request['texts'])
+            for options in {r['options'] for r in batch}:
+                self._classify_group([r for r in batch if r['options'] == options], *options)
+
+    def _classify_group(self, requests:list, verbose:bool, early_exit:bool):
+        try:
+            results = list(classify_texts(self._classifier, [text for r in requests for text in r['texts']], verbose, early_exit))
+            self._metrics.count_batch(len(results))
+            for r in requests:
+                r['results'], results = results[:len(r['texts'])], results[len(r['texts']):]
+        except Exception as e:
+            for r in requests:
+                r['error'] = e
+        for r in requests:
+            r['done'].set()
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._counters = {'requests':0, 'documents':0, 'batches':0, 'rejected':0, 'errors':0, 'in_flight':0}
+
+    def add(self, name:str, amount:int=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def count_batch(self, documents:int):
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['documents'] += documents
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = dict(self._counters)
+        snapshot['mean_batch_size'] = snapshot['documents'] / snapshot['batches'] if snapshot['batches'] else 0
+        snapshot['uptime_seconds'] = time.monotonic() - self._started
+        return snapshot
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = 'azureSDKTrackClassifier'
+    protocol_version = 'HTTP/1.1' # Keep-alive, so clients can reuse a connection.
+
+    def address_string(self) -> str:
+        return self.client_address[0] if self.client_address else 'unix' # Unix socket peers have no address.
+
+    def log_message(self, format:str, *args):
+        logging.getLogger(__name__).debug("%s - %s", self.address_string(), format % args)
+
+    def _respond(self, status:int, body:dict):
+        data = _to_json(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        classification_server = self.server.classification_server
+        if self.path == '/health':
+            self._respond(200, {'status':'ok', 'models':{name:c._trained_model.fingerprint() for name, c in classification_server.models.items()}})
+        elif self.path == '/metrics':
+            self._respond(200, classification_server.metrics())
+        else:
+            self._respond(404, {'error':'Unknown path: {}'.format(self.path)})
+
+    def do_POST(self):
+        classification_server = self.server.classification_server
+        if self.path not in ('/classify', '/classify_many'):
+            self.close_connection = True # The unread body would otherwise be taken for the next request.
+            self._respond(404, {'error':'Unknown path: {}'.format(self.path)})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self._respond(413, {'error':'Request larger than {} bytes.'.format(MAX_REQUEST_BYTES)})
+            return
+        classification_server._metrics.add('requests')
+        if not classification_server._slots.acquire(timeout=classification_server.queue_timeout): # Before reading the body, so waiting requests hold no more than their connection.
+            classification_server._metrics.add('rejected')
+            self._respond(503, {'error':'Server busy.'})
+            self._discard(length) # So the connection can take the client's next request.
+            return
+        try:
+            self._classify(classification_server, length)
+        finally:
+            classification_server._slots.release()
+
+    def _discard(self, length:int):
+        # Reads and drops a request body a piece at a time, rather than holding all of it.
+        while length > 0:
+            chunk = self.rfile.read(min(length, DISCARD_CHUNK_BYTES))
+            if not chunk:
+                self.close_connection = True
+                return
+            length -= len(chunk)
+
+    def _classify(self, classification_server:"ClassificationServer", length:int):
+        try:
+            request = json.loads(self.rfile.read(length))
+            documents = {'text':request['text']} if self.path == '/classify' else request['documents']
+            if not all(isinstance(text, str) for text in documents.values()):
+                raise ValueError("Documents must be strings.")
+            batcher = classification_server.batcher(request.get('model'))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._respond(400, {'error':'Bad request: {!r}'.format(e)})
+            return
+
+        classification_server._metrics.add('in_flight')
+        try:
+            results = batcher.classify(list(documents.values()), bool(request.get('verbose')), bool(request.get('early_exit')))
+            self._respond(200, summarize(zip(documents.keys(), results)))
+        except Exception as e:
+            logging.getLogger(__name__).exception("Classification failed.")
+            classification_server._metrics.add('errors')
+            self._respond(500, {'error':repr(e)})
+        finally:
+            classification_server._metrics.add('in_flight', -1)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ClassificationServer:
+    """ Serves classification requests for the given models ({name: AzureSDKTrackClassifier}), which stay loaded for the server's lifetime.
+
+        Listens on host:port, or on the Unix socket at unix_socket if given.  (port 0 picks a free port; see address.) """
+
+    def __init__(self, models:dict, host:str='127.0.0.1', port:int=DEFAULT_PORT, unix_socket:str=None,
+                 max_batch_size:int=BATCH_SIZE, batch_window:float=BATCH_WINDOW, max_concurrency:int=MAX_CONCURRENCY, queue_timeout:float=QUEUE_TIMEOUT):
+        if not models:
+            raise ValueError("At least one model must be served.")
+        self.models = dict(models)
+        self.queue_timeout = queue_timeout
+        self._metrics = _Metrics()
+        self._batchers = {name:_Batcher(classifier, max_batch_size, batch_window, self._metrics) for name, classifier in self.models.items()}
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket) # Left over from a previous run.
+            self._server = _UnixServer(unix_socket, _RequestHandler)
+            self.address = 'unix:' + unix_socket
+        else:
+            self._server = http.server.ThreadingHTTPServer((host, port), _RequestHandler)
+            self.address = 'http://{}:{}'.format(*self._server.server_address[:2])
+        self._server.classification_server = self
+        self._thread = None
+
+    def batcher(self, model:str=None) -> _Batcher:
+        if model is None:
+            return next(iter(self._batchers.values()))
+        if model not in self._batchers:
+            raise KeyError("Unknown model: {}".format(model))
+        return self._batchers[model]
+
+    def metrics(self) -> dict:
+        metrics = self._metrics.snapshot()
+        metrics['result_cache'] = {name:c.result_cache_stats() for name, c in self.models.items() if c.result_cache_stats()}
+        metrics['gate'] = {name:c.gate_stats() for name, c in self.models.items()}
+        return metrics
+
+    def serve_forever(self):
+        logging.getLogger(__name__).info("Serving {} on {}".format(', '.join(self.models), self.address))
+        self._server.serve_forever()
+
+    def start(self) -> "ClassificationServer":
+        """ Serves from a background thread. """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
+        for batcher in self._batchers.values():
+            batcher.stop()
+        if isinstance(self._server, _UnixServer) and os.path.exists(self._server.server_address):
+            os.remove(self._server.server_address)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path:str, timeout:float):
+        super().__init__('localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class ClassificationClient:
+    """ Thin client for a ClassificationServer at address ('http://host:port' or 'unix:/path/to/socket'), returning the CLI's summary_result dicts.
+        Holds one connection, so use one client per thread. """
+
+    def __init__(self, address:str, timeout:float=QUEUE_TIMEOUT * 2):
+        self._address, self._timeout = address, timeout
+        self._connection = None
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._address.startswith('unix:'):
+            return _UnixHTTPConnection(self._address[len('unix:'):], self._timeout)
+        host_port = self._address.split('://', 1)[-1].rstrip('/')
+        return http.client.HTTPConnection(host_port, timeout=self._timeout)
+
+    def _request(self, method:str, path:str, body:dict=None) -> dict:
+        data = _to_json(body) if body is not None else None
+        for attempt in range(2):
+            self._connection = self._connection or self._connect()
+            try:
+                self._connection.request(method, path, body=data, headers={'Content-Type':'application/json'} if data else {})
+                response = self._connection.getresponse()
+                result = json.loads(response.read())
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close() # The server closed an idle keep-alive connection; retry once on a new one.
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise RuntimeError("Classification server responded {}: {}".format(response.status, result.get('error')))
+        return result
+
+    def classify(self, text:str, verbose:bool=False, early_exit:bool=False, model:str=None) -> dict:
+        return self._request('POST', '/classify', {'text':text, 'verbose':verbose, 'early_exit':early_exit, 'model':model})
+
+    def classify_many(self, documents:dict, verbose:bool=False, early_exit:bool=False, model:str=None) -> dict:
+        """ Classifies {path: text} documents. """
+        return self._request('POST', '/classify_many', {'documents':documents, 'verbose':verbose, 'early_exit':early_exit, 'model':model})
+
+    def health(self) -> dict:
+        return self._request('GET', '/health')
+
+    def metrics(self) -> dict:
+        return self._request('GET', '/metrics')
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve classification requests from resident models, or query such a server.', prog='azureSDKTrackClassifier.server')
+    parser.add_argument('--log-level', default=None, type=str, help='Specify log level (debug, info, warning, exception, error) to output alongside results.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='Run the server.')
+    serve.add_argument('--model', action='append', required=True, help='A saved model to serve, as PATH or NAME=PATH.  May be given more than once; the first is the default.  (NAME defaults to {language}_{service}.)')
+    serve.add_argument('--host', default='127.0.0.1', type=str)
+    serve.add_argument('--port', default=DEFAULT_PORT, type=int)
+    serve.add_argument('--unix-socket', default=None, type=str, help='Listen on a Unix socket at this path rather than on a TCP port.')
+    serve.add_argument('--max-batch-size', default=BATCH_SIZE, type=int, help='The most documents classified together in one batch.')
+    serve.add_argument('--batch-window', default=BATCH_WINDOW, type=float, help='Seconds to wait for further requests to batch with the first.')
+    serve.add_argument('--max-concurrency', default=MAX_CONCURRENCY, type=int, help='The most requests handled at once; others wait their turn.')
+    serve.add_argument('--cache-results', default=False, action='store_true', help='Cache classification results in memory, by document content and model.')
+
+    classify = subparsers.add_parser('classify', help='Classify text (or a file or directory) with a running server, printing the same JSON as the main CLI.')
+    classify.add_argument('text', type=str, help='The text to classify as containing T1 content')
+    classify.add_argument('--address', default='http://127.0.0.1:{}'.format(DEFAULT_PORT), type=str, help='The server to query: http://host:port or unix:/path/to/socket')
+    classify.add_argument('--input-is-path', default=False, action='store_true', help='Enable this flag to indicate that the text argument is a path to a file or directory that should be read and predicted.  (Directories are filtered as by the main CLI\'s defaults.)')
+    classify.add_argument('--verbose', default=False, action='store_true')
+    classify.add_argument('--early-exit', default=False, action='store_true')
+    classify.add_argument('--model', default=None, type=str, help='The name of the model to use, if the server has more than one.')
+
+    args = parser.parse_args()
+    if args.log_level:
+        logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+
+    if args.command == 'serve':
+        models = {}
+        for model in args.model:
+            name, _, path = model.rpartition('=')
+            classifier = AzureSDKTrackClassifier.load(path)
+            if args.cache_results:
+                classifier.enable_result_cache()
+            models[name or '{}_{}'.format(classifier._language, classifier._service)] = classifier
+        server = ClassificationServer(models, args.host, args.port, args.unix_socket, args.max_batch_size, args.batch_window, args.max_concurrency)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+    else:
+        client = ClassificationClient(args.address)
+        if not args.input_is_path:
+            summary_result = client.classify(args.text, args.verbose, args.early_exit, args.model)
+        else:
+            if os.path.isfile(args.text):
+                with open(args.text) as f:
+                    documents = {args.text:f.read()}
+            else:
+                documents = dict(walk_files(args.text))
+            summary_result = client.classify_many(documents, args.verbose, args.early_exit, args.model)
+        print(f"{json.dumps(summary_result)}")
+        sys.exit(summary_result.get('t1_documents', 0))
@@ -4,8 +4,36 @@ class Settings:
     # Used for identifying where to store cache files during training.  (Technically not truly constant, since set as a command line arg, but then is constant after-the-fact.)
     CACHE_BASE_PATH="."
 
+    # The most bytes of training corpora kept in the cache under CACHE_BASE_PATH; least recently used corpora are evicted beyond it. (See corpus_store.CorpusStore)
+    CORPUS_CACHE_MAX_BYTES = 8 << 30
+
     # Determines where cache, test, and apistubgen files are looked for and stored.
     TEST_CORPUS_BASE_PATH = "."
 
+    # The directory apistubgen files are looked for in, as {language}_{package}_{version}.json. (See helpers.get_apistubgen_tokens_for_package)
+    APISTUBGEN_PATH = "./ApiStubGen"
+
     # If specified, logs missing unsupervised training corpus zips not able to be fetched from the authoritative release-version lists in helpers.
-    MISSING_TRAINING_LOG = None
\ No newline at end of file
+    MISSING_TRAINING_LOG = None
+
+    # If specified, training reads release metadata and corpora from this mirror directory rather than from github. (See mirror.CorpusMirror)
+    OFFLINE_MIRROR_PATH = None
+
+    # If specified, training keeps per-package artifacts in this directory, and only fetches and tokenizes packages new or changed since they were stored. (See artifacts.ArtifactStore)
+    TRAINING_ARTIFACTS_PATH = None
+
+    # Worker processes used to tokenize training corpora; all cores if None. (See parallel.tokenize_corpora)
+    TOKENIZATION_PROCESSES = None
+
+    # If specified, training prunes English words using this wordlist (one word per line) rather than pyenchant. (See dictionary.EnglishDictionary)
+    ENGLISH_WORDLIST_PATH = None
+
+    # If True, training logs the cross-validated accuracy of candidate classifiers before fitting its own. (See evaluation.py for model selection proper.)
+    SCORE_TRAINING = False
+
+    # Bounds on fetching training corpus zips. (See downloads.ZipDownloader)
+    DOWNLOAD_CONCURRENCY = 8
+    DOWNLOAD_PER_HOST_CONCURRENCY = 4
+    DOWNLOAD_RETRIES = 3
+    # Seconds to wait for a connection, or for the next bytes of a response, before a download is retried (or, out of retries, fails).
+    DOWNLOAD_TIMEOUT = 60
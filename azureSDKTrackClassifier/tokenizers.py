@@ -1,92 +1,313 @@
+import codecs
 from collections import defaultdict
 from enum import Enum
-
-from nltk.tokenize import WordPunctTokenizer
+import json
+import re
+from typing import Iterable, Iterator, Union
 
 from .constants import Language
 
-def tokenize_apistubgen(stub_json):
-    # Ingest top level types.  May duplicate lower data, but is much more to-the-point.
-    found_types = defaultdict(set)
-    def _ingest_subtree(root):
-        try:
-            type_kind = root["Tags"]["TypeKind"] # Can be one of: enum, class, namespace, assembly, method
-        except:
-            type_kind = None
-        found_types[type_kind].add(root["Text"]) # Note: may be worth looking at NavigationId as well in the future.
-        for child in root["ChildItems"]:
-            _ingest_subtree(child)
+# NOTE: This is nltk's WordPunctTokenizer, which is somewhat arbitrary outside it being convenient and giving acceptable punctuation handling for our needs.
+# It is exactly this pattern and these flags applied via re.findall, so it is compiled directly rather than paying ~1s to import nltk on every run. (Equivalence is checked in tests.)
+_tokenizer = re.compile(r"\w+|[^\w\s]+", re.UNICODE | re.MULTILINE | re.DOTALL)
+def tokenize_text(text:str) -> set:
+    return set(_tokenizer.findall(text)) # Contemplated things like occurence filtering and the like, but this "seems workable" for the time being, although could be improved.
 
-    for root in stub_json["Navigation"]:
-        _ingest_subtree(root)
-
-    # Now process the tree we just ingested.
-    
-    # Notes to self for parsing apistubgen:
-    #
-    # 0 -> "cancellationToken" in Value and all else None | (Parameter name?)
-    # 0 -> DefinitionId and Value defined, as a module (Messaging) fully defined in #5 | (Module name?)
-    # 0 -> DefinitionId and value defined, as an Enum constant name, where the definition is the enum constant path
-    # 0 -> definitionId and value are the same, the enum path itself.
-    #
-    # 5 -> DefinitionId defined and value is an empty string -> enum option or enum itself? (e.g. ServiceBusSubQueue.Dead_Letter which has an accompanying non-null-value 0, same thing for ServiceBusSubQueue itself)
-    # 5 -> Only DefinitionId defined (full function), all else None -> class method?  (e.g. ServiceBusClient.DisposeAsync() or ServiceBus.ServiceBusClient) | (Is this the actual long-form method/class/module itself?)
-    # (Note, 5's have parens and param list in def. id if function, otherwise not.)
-    #
-    # 6 -> only value defined -> Type (e.g. CancellationToken, ValueTask)
-    # 6 -> Both Value and DefinitionId defined -> Internal Type (e.g. ServiceBusClient, where the root definition is in a #5)
-    # 6 -> NavigationId has full reference to a type, value is the text of that typename -> Internal type? (e.g. ServiceBusProcessor) | (It's either a return or parameter type, depending on placement?)
-    #
-    # 7 -> DefinitionId and Value defined (definitionID is full function and value is method name) -> method name. | (Is this the token of the methodname itself? also the property name for setters/getters?  refers to a #5.)
-    # 7 -> Value defined and nothing else -> Weird dotnet keyword thing? (Never)
-    #
-    # Oddities:
-    # - In dotnet, methods are 7s.  In python, they're 0s.
-    # - Python has a 5 AND a 0 for each param.
-    # - sometimes in python, 0s are whitespace.
-    #
-    # Broad conclusions:
-    #
-    # - Capture 0, 6, 7, and 8 "value" fields.  (these are the actual meaningful public tokens for a lib; classes, methods, parameters, constants.)
-    #    - Always remember to trim and check the value for non-null.
-    # - Don't capture 5s, they _could_ be useful, but are usually too verbose and are captured by 6/7/0.
-    # - Don't capture 1-2, useful for advanced parsing but not as tokens.
-    # - Don't capture 3-4 UNLESS doing language detection.
-    # - Don't capture 9, it's just comments, numerals, Nones, and "..." placeholder strings.
-    #
-    # (if doing N-grams this changes a bit, but not too much.)
-
-    class Kind(int, Enum):
-        child_token = 0 # A bunch of things; parameter or module name or enum path. (or in python a method as well).  Always seems to be 'a token underneath a thing', thus child_token.
-        null = 1 # Newline/"break"?
-        whitespace = 2
-        punctuation = 3
-        keyword = 4 # e.g. class, or get, or public, etc.
-        definition = 5 # This one's a bit weird, it kinda represents the "root reference" for top level stuff, methods, classes, modules.  Only DefinitionID is populated, with a fully qualified reference.
-        type = 6 # both internal (e.g. ServiceBusClient), with associated NavigationId, or external (e.g. CancellationToken)
-        property = 7 # A method is also a property, and is the most common type in some languages (dotnet).  Other languages have methods as 0s. (python)
-        constant = 8 # e.g. \"Restoring\"
-        comment=9 # Can also be e.g. "..." or certain constants e.g. numerals and Nones, in either case, ignore.
+
+def tokenize_texts(texts:Iterable[str], tokens:set=None) -> set:
+    """Adds the tokens of each of texts to tokens (a new set if None) and returns it; the same as tokenize_text of the texts joined by whitespace, but one text at a time."""
+    tokens = set() if tokens is None else tokens
+    for text in texts:
+        tokens.update(_tokenizer.findall(text))
+    return tokens
+
+
+CHUNK_SIZE = 1 << 20 # Characters (or bytes) read at a time when streaming a document.
+
+def iter_text_chunks(source:Union[str, bytes, "mmap.mmap", "io.IOBase"], chunk_size:int=CHUNK_SIZE, encoding:str='utf-8', errors:str='strict') -> Iterator[str]:
+    """Yields the text of a file object (text or binary), str, bytes or mmap in chunks of at most chunk_size, decoding binary input incrementally
+       so that multi-byte characters spanning chunk boundaries decode as they would in one piece."""
+    if hasattr(source, 'read'):
+        read = lambda: source.read(chunk_size)
+    else:
+        view, offset = source, 0
+        def read():
+            nonlocal offset
+            chunk = view[offset:offset + chunk_size]
+            offset += chunk_size
+            return chunk
+    decoder = None
+    while True:
+        chunk = read()
+        if not chunk:
+            break
+        if isinstance(chunk, str):
+            yield chunk
+        else:
+            decoder = decoder or codecs.getincrementaldecoder(encoding)(errors=errors)
+            yield decoder.decode(chunk)
+    if decoder:
+        yield decoder.decode(b'', final=True)
+
+
+_runs = re.compile(r"(?P<word>\w+)|(?P<punctuation>[^\w\s]+)|(?P<space>\s+)") # Every character is in exactly one of these classes.
+
+class StreamingTokenizer:
+    """Tokenizes a text fed in consecutive chunks, producing the same tokens tokenize_text would for the whole text.
+       A token never spans a change between word, punctuation and whitespace characters, so each chunk is tokenized up to the start of its last run of one
+       class, and only that run is carried into the next; what is carried stays small even for text without whitespace, such as minified JSON."""
+
+    def __init__(self):
+        self._carry = ''
+
+    @property
+    def carried(self) -> int:
+        """ Number of characters fed but not yet tokenized. """
+        return len(self._carry)
+
+    def feed(self, chunk:str) -> set:
+        if not chunk:
+            return set()
+        last_run = _runs.match(chunk[::-1]) # The chunk's last run, found from its end rather than by scanning all of it.
+        if last_run.end() == len(chunk) and self._carry and _runs.match(self._carry[-1] + chunk[0]).end() == 2:
+            self._carry += chunk # The whole chunk continues the carried run. (Only a single run longer than a chunk, i.e. one enormous token, gets here.)
+            return set()
+        split = len(chunk) if last_run.lastgroup == 'space' else len(chunk) - last_run.end()
+        text, self._carry = self._carry + chunk[:split], chunk[split:]
+        return tokenize_text(text)
+
+    def flush(self) -> set:
+        text, self._carry = self._carry, ''
+        return tokenize_text(text)
+
+
+# Notes to self for parsing apistubgen:
+#
+# 0 -> "cancellationToken" in Value and all else None | (Parameter name?)
+# 0 -> DefinitionId and Value defined, as a module (Messaging) fully defined in #5 | (Module name?)
+# 0 -> DefinitionId and value defined, as an Enum constant name, where the definition is the enum constant path
+# 0 -> definitionId and value are the same, the enum path itself.
+#
+# 5 -> DefinitionId defined and value is an empty string -> enum option or enum itself? (e.g. ServiceBusSubQueue.Dead_Letter which has an accompanying non-null-value 0, same thing for ServiceBusSubQueue itself)
+# 5 -> Only DefinitionId defined (full function), all else None -> class method?  (e.g. ServiceBusClient.DisposeAsync() or ServiceBus.ServiceBusClient) | (Is this the actual long-form method/class/module itself?)
+# (Note, 5's have parens and param list in def. id if function, otherwise not.)
+#
+# 6 -> only value defined -> Type (e.g. CancellationToken, ValueTask)
+# 6 -> Both Value and DefinitionId defined -> Internal Type (e.g. ServiceBusClient, where the root definition is in a #5)
+# 6 -> NavigationId has full reference to a type, value is the text of that typename -> Internal type? (e.g. ServiceBusProcessor) | (It's either a return or parameter type, depending on placement?)
+#
+# 7 -> DefinitionId and Value defined (definitionID is full function and value is method name) -> method name. | (Is this the token of the methodname itself? also the property name for setters/getters?  refers to a #5.)
+# 7 -> Value defined and nothing else -> Weird dotnet keyword thing? (Never)
+#
+# Oddities:
+# - In dotnet, methods are 7s.  In python, they're 0s.
+# - Python has a 5 AND a 0 for each param.
+# - sometimes in python, 0s are whitespace.
+#
+# Broad conclusions:
+#
+# - Capture 0, 6, 7, and 8 "value" fields.  (these are the actual meaningful public tokens for a lib; classes, methods, parameters, constants.)
+#    - Always remember to trim and check the value for non-null.
+# - Don't capture 5s, they _could_ be useful, but are usually too verbose and are captured by 6/7/0.
+# - Don't capture 1-2, useful for advanced parsing but not as tokens.
+# - Don't capture 3-4 UNLESS doing language detection.
+# - Don't capture 9, it's just comments, numerals, Nones, and "..." placeholder strings.
+#
+# (if doing N-grams this changes a bit, but not too much.)
+
+class ApiStubGenKind(int, Enum):
+    child_token = 0 # A bunch of things; parameter or module name or enum path. (or in python a method as well).  Always seems to be 'a token underneath a thing', thus child_token.
+    null = 1 # Newline/"break"?
+    whitespace = 2
+    punctuation = 3
+    keyword = 4 # e.g. class, or get, or public, etc.
+    definition = 5 # This one's a bit weird, it kinda represents the "root reference" for top level stuff, methods, classes, modules.  Only DefinitionID is populated, with a fully qualified reference.
+    type = 6 # both internal (e.g. ServiceBusClient), with associated NavigationId, or external (e.g. CancellationToken)
+    property = 7 # A method is also a property, and is the most common type in some languages (dotnet).  Other languages have methods as 0s. (python)
+    constant = 8 # e.g. \"Restoring\"
+    comment=9 # Can also be e.g. "..." or certain constants e.g. numerals and Nones, in either case, ignore.
+
+_APISTUBGEN_TOKEN_KINDS = (ApiStubGenKind.child_token, ApiStubGenKind.type, ApiStubGenKind.property, ApiStubGenKind.constant)
+
+
+def _ingest_apistubgen_navigation(root:dict, found_types:dict):
+    # Ingest top level types.  May duplicate lower data, but is much more to-the-point.  (Walked with a stack rather than by recursion, so deep trees can't exhaust it.)
+    pending = [root]
+    while pending:
+        item = pending.pop()
+        _ingest_apistubgen_navigation_item(item, found_types)
+        pending.extend(item["ChildItems"])
 
 
+def _ingest_apistubgen_navigation_item(item:dict, found_types:dict):
+    try:
+        type_kind = item["Tags"]["TypeKind"] # Can be one of: enum, class, namespace, assembly, method
+    except:
+        type_kind = None
+    found_types[type_kind].add(item["Text"]) # Note: may be worth looking at NavigationId as well in the future.
+
+
+def _ingest_apistubgen_token(token:dict, found_types:dict):
+    kind = ApiStubGenKind(token["Kind"]) # int
+    value = token["Value"] # str
+    if kind in _APISTUBGEN_TOKEN_KINDS and value and value.strip():
+        found_types[kind.name].add(value.strip())
+
+# This is an option if we find these are present. (e.g. azc0015) but they don't seem to be.
+#
+# for token in stub_json["Diagnostics"]:
+#     id = token["DiagnosticId"]
+#     found_types["DiagnosticId"].add(id)
+
+
+def tokenize_apistubgen(stub_json:dict) -> dict:
+    """Returns the tokens of an apistubgen file (its parsed json), as a dict of the type or token kind they were found as to a set of them."""
+    found_types = defaultdict(set)
+    for root in stub_json["Navigation"]:
+        _ingest_apistubgen_navigation(root, found_types)
     for token in stub_json["Tokens"]:
-        kind = Kind(token["Kind"]) # int
-        value = token["Value"] # str
-        definition_id = token.get("DefinitionId") # str
-        navigate_to_id = token.get("NavigateToId") # str
-        if kind in [Kind.child_token, Kind.type, Kind.property, Kind.constant] and value and value.strip():
-            found_types[kind.name].add(value.strip())
-
-    # This is an option if we find these are present. (e.g. azc0015) but they don't seem to be.
-    #
-    # for token in stub_json["Diagnostics"]:
-    #     id = token["DiagnosticId"]
-    #     found_types["DiagnosticId"].add(id)
+        _ingest_apistubgen_token(token, found_types)
+    return found_types
+
 
+def tokenize_apistubgen_file(f:"io.IOBase", chunk_size:int=CHUNK_SIZE) -> dict:
+    """As tokenize_apistubgen, for the apistubgen json in file object f, read a chunk at a time; only one token, or one item of the navigation tree, is held parsed at once."""
+    found_types = defaultdict(set)
+    for key, item in iter_apistubgen(f, chunk_size):
+        if key == "Navigation":
+            _ingest_apistubgen_navigation_item(item, found_types)
+        else:
+            _ingest_apistubgen_token(item, found_types)
     return found_types
 
 
-_tokenizer = WordPunctTokenizer() # NOTE: This is somewhat arbitrary outside it being convenient and giving acceptable punctuation handling for our needs.
-def tokenize_text(text:str) -> set:
-    return set(_tokenizer.tokenize(text)) # Contemplated things like occurence filtering and the like, but this "seems workable" for the time being, although could be improved.
+def iter_apistubgen(f:"io.IOBase", chunk_size:int=CHUNK_SIZE) -> Iterator[tuple]:
+    """Yields ("Navigation", item) for each item of the navigation tree (without its "ChildItems"; children before their parents), and ("Tokens", token) for each token,
+       of the apistubgen json in file object f, reading it a chunk at a time.  Other fields are skipped."""
+    stream = _JsonStream(f, chunk_size)
+    stream.expect('{')
+    while stream.peek() != '}':
+        key = stream.value()
+        stream.expect(':')
+        if key == "Navigation" and stream.peek() == '[':
+            for item in _iter_navigation_items(stream):
+                yield key, item
+        elif key == "Tokens" and stream.peek() == '[':
+            stream.expect('[')
+            while stream.peek() != ']':
+                yield key, stream.value()
+                if stream.peek() != ']':
+                    stream.expect(',')
+            stream.expect(']')
+        else:
+            stream.value()
+        if stream.peek() != '}':
+            stream.expect(',')
+
+
+def _iter_navigation_items(stream:"_JsonStream") -> Iterator[dict]:
+    """Yields each item of the navigation tree at stream (positioned at its array), without its "ChildItems", once its other fields are read.
+       Child arrays are descended into as they are reached, keeping the items whose fields are still being read on a stack, so no single value read is larger than
+       one item's own fields, however large or deep the tree."""
+    stream.expect('[')
+    items = [] # Items still being read, each inside the "ChildItems" of the one before.
+    while True:
+        # Within an array of items: before its next item, or its end.
+        if stream.peek() == ']':
+            stream.expect(']')
+            if not items:
+                return
+        else:
+            stream.expect('{')
+            items.append({})
+        # Within items[-1]: read its fields until its end, or until its children are reached.
+        item, descended = items[-1], False
+        while True:
+            key = stream.member()
+            if key is None:
+                break
+            if key == "ChildItems" and stream.peek() == '[':
+                stream.expect('[')
+                descended = True
+                break
+            item[key] = stream.value()
+        if descended:
+            continue
+        stream.expect('}')
+        yield items.pop()
+        if stream.peek() == ',':
+            stream.expect(',')
+
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = re.compile(r'[ \t\n\r]*')
+_json_member = re.compile(r'[ \t\n\r]*,?[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*:[ \t\n\r]*') # A member's key, and the comma before it if any.
+
+class _JsonStream:
+    """Reads a JSON document's structural characters and values from the text of a file object a chunk at a time, keeping only the unread text buffered."""
+
+    def __init__(self, f:"io.IOBase", chunk_size:int):
+        self._chunks = iter_text_chunks(f, chunk_size)
+        self._buffer, self._position, self._ended = '', 0, False
+
+    def _read(self, at_least:int=0) -> bool:
+        """Appends at least one more chunk, and at least at_least characters, to the unread text; False if there is no more."""
+        chunks, size = [], 0
+        while not chunks or size < at_least:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._ended = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if not chunks:
+            return False
+        self._buffer, self._position = self._buffer[self._position:] + ''.join(chunks), 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next character that isn't whitespace, without consuming it."""
+        if self._position < len(self._buffer) and self._buffer[self._position] not in ' \t\n\r': # The common case, with no whitespace to skip.
+            return self._buffer[self._position]
+        while True:
+            self._position = _json_whitespace.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read():
+                raise ValueError("Unexpected end of JSON")
+
+    def expect(self, character:str):
+        found = self.peek()
+        if found != character:
+            raise ValueError("Expected {!r} in JSON, found {!r}".format(character, found))
+        self._position += 1
+
+    def member(self) -> str:
+        """Consumes the comma before the next member of an object, if any, and its key and colon, and returns the key; or returns None at the end of the object."""
+        match = _json_member.match(self._buffer, self._position)
+        if match and match.end() < len(self._buffer): # The common case, in one step.
+            self._position = match.end()
+            key = match.group(1)
+            return json.loads('"' + key + '"') if '\\' in key else key
+        if self.peek() == ',':
+            self.expect(',')
+        if self.peek() == '}':
+            return None
+        key = self.value()
+        self.expect(':')
+        return key
 
+    def value(self):
+        """Consumes and returns the next value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self._buffer, self._position)
+                # A value running to the end of the buffer may continue in the next chunk. (e.g. a number)  Values are always followed by a delimiter otherwise.
+                if end < len(self._buffer) or self._ended:
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                if self._ended:
+                    raise
+            self._read(at_least=len(self._buffer) - self._position) # Doubling what is buffered of the value, so a large value is decoded a few times rather than once per chunk.
@@ -0,0 +1,33 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Measures the cumulative import time of the package (and the CLI entry module) via `python -X importtime`, failing if it exceeds a budget
+# or if any training/blob/dictionary-only dependency is imported on the inference path.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # Imports are measured from this checkout, wherever the script is run from.
+TRAINING_ONLY_MODULES = ['sklearn', 'nltk', 'enchant', 'exdown', 'requests', 'azure']
+
+def measure(module:str) -> tuple:
+    """Returns the cumulative import time of module in microseconds, and the top-level packages it imported."""
+    code = "import {}, sys; print(','.join(sorted(set(m.split('.')[0] for m in sys.modules))))".format(module)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True, cwd=REPO_ROOT)
+    cumulative = [int(line.split('|')[1]) for line in completed.stderr.splitlines() if line.startswith('import time:') and line.split('|')[2].strip() == module]
+    return cumulative[0], completed.stdout.strip().split(',')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the import time of the inference path.')
+    parser.add_argument('--budget-ms', type=float, default=250, help='Maximum allowed (best of --repeat) cumulative import time, in milliseconds.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in ['azureSDKTrackClassifier', 'azureSDKTrackClassifier.__main__']:
+        runs = [measure(module) for _ in range(args.repeat)]
+        best_ms = min(r[0] for r in runs) / 1000
+        imported = [m for m in TRAINING_ONLY_MODULES if m in runs[0][1]]
+        print("{}: {:.1f}ms (budget {:.0f}ms){}".format(module, best_ms, args.budget_ms, "; imports training-only modules: {}".format(imported) if imported else ""))
+        failed = failed or best_ms > args.budget_ms or bool(imported)
+    sys.exit(int(failed))
@@ -0,0 +1,44 @@
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # So the package imports from this checkout, wherever the script is run from.
+
+from azureSDKTrackClassifier import AzureSDKTrackClassifier
+from azureSDKTrackClassifier.helpers import shared_model_file
+from azureSDKTrackClassifier.parallel import WorkerPool
+
+# Compares serial multi-file classification against the WorkerPool used by --set-parallelism, over --documents copies of the TestCorpus files.
+# Pool timings include starting the workers and writing the model file they attach to (unless --load-from-file already is a compact model).
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark parallel multi-file classification on the TestCorpus files.')
+    parser.add_argument('--load-from-file', type=str, required=True, help='The saved model to classify with.')
+    parser.add_argument('--test-corpus-path', type=str, default='.', help='Directory containing the TestCorpus tree.')
+    parser.add_argument('--documents', type=int, default=400)
+    parser.add_argument('--processes', type=int, nargs='+', default=[2, 4])
+    args = parser.parse_args()
+
+    classifier = AzureSDKTrackClassifier.load(args.load_from_file)
+    texts = []
+    for file_path in glob.glob(os.path.join(args.test_corpus_path, 'TestCorpus', '**', '*.txt'), recursive=True):
+        with open(file_path, encoding='latin-1') as f:
+            texts.append(f.read())
+    documents = {'{}_{}'.format(i, len(text)):text + '\n// {}'.format(i) for i, text in zip(range(args.documents), itertools.cycle(texts))}
+
+    start = time.perf_counter()
+    expected = list(zip(documents.keys(), classifier.is_t1_many(documents.values())))
+    serial_time = time.perf_counter() - start
+    print("{} documents, {} characters, {} CPUs".format(len(documents), sum(len(t) for t in documents.values()), os.cpu_count()))
+    print("serial:              {:.3f}s".format(serial_time))
+
+    for processes in args.processes:
+        start = time.perf_counter()
+        with shared_model_file(classifier, args.load_from_file) as model_path, WorkerPool(model_path, processes) as pool:
+            results = list(pool.classify(documents.items()))
+        pool_time = time.perf_counter() - start
+        assert results == expected
+        print("{} worker processes: {:.3f}s ({:.2f}x)".format(processes, pool_time, serial_time / pool_time))
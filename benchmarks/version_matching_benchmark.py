@@ -0,0 +1,51 @@
+import argparse
+import glob
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # So the package imports from this checkout, wherever the script is run from.
+
+from azureSDKTrackClassifier import AzureSDKTrackClassifier
+from azureSDKTrackClassifier.matchers import VersionMatcher
+
+# Compares the per-version substring scan `create_feature_vector` used to do against the precompiled VersionMatcher, over the TestCorpus files.
+# If no model is provided, a synthetic version set roughly the size of the all-languages model's is used.
+
+def synthetic_versions(count:int=3000) -> set:
+    random.seed(0)
+    services = ['Storage.Blobs', 'EventHubs', 'ServiceBus', 'KeyVault', 'Cosmos', 'Identity', 'Search', 'Monitor', 'DataLake', 'AppConfiguration']
+    versions = {prefix + service for service in services for prefix in ['Azure.', 'Microsoft.Azure.', 'azure-', 'com.azure.', '@azure/', 'azure-mgmt-']}
+    while len(versions) < count:
+        versions.add('{}.{}.{}'.format(random.randint(0, 12), random.randint(0, 30), random.randint(0, 15)))
+    return versions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark version-identifier matching on the TestCorpus files.')
+    parser.add_argument('--load-from-file', type=str, help='Use the version sets of a saved model rather than a synthetic set.')
+    parser.add_argument('--test-corpus-path', type=str, default='.', help='Directory containing the TestCorpus tree.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.load_from_file:
+        trained_model = AzureSDKTrackClassifier.load(args.load_from_file)._trained_model
+        versions = trained_model._only_new_versions | trained_model._only_old_versions
+    else:
+        versions = synthetic_versions()
+
+    texts = []
+    for file_path in glob.glob(os.path.join(args.test_corpus_path, 'TestCorpus', '**', '*.txt'), recursive=True):
+        with open(file_path, encoding='latin-1') as f:
+            texts.append(f.read())
+
+    matcher = VersionMatcher(versions)
+    for text in texts:
+        assert matcher.find_all(text) == {v for v in versions if v in text}
+
+    scan_time = min(timeit.repeat(lambda: [[v for v in versions if v in text] for text in texts], number=1, repeat=args.repeat))
+    matcher_time = min(timeit.repeat(lambda: [matcher.find_all(text) for text in texts], number=1, repeat=args.repeat))
+    print("{} versions, {} documents, {} characters".format(len(versions), len(texts), sum(len(t) for t in texts)))
+    print("substring scan:  {:.4f}s".format(scan_time))
+    print("VersionMatcher:  {:.4f}s ({:.1f}x)".format(matcher_time, scan_time / matcher_time))
@@ -0,0 +1,45 @@
+import glob
+import os
+import re
+
+from sklearn.neural_network import MLPClassifier
+
+from azureSDKTrackClassifier import AzureSDKTrackClassifier
+from azureSDKTrackClassifier.model import _TrainedModel
+from azureSDKTrackClassifier.tokenizers import tokenize_text
+
+# Builds a small _TrainedModel from the TestCorpus alone, so that classification logic can be tested without network access or training-time dependencies.
+
+VERSIONS = {'T2':{'Azure.Messaging.EventHubs', 'Azure.Messaging.ServiceBus', 'Azure.Storage.Blobs', 'azure-messaging-eventhubs', 'azure-messaging-servicebus', 'azure-storage-blob'},
+            'T1':{'Microsoft.Azure.EventHubs', 'Microsoft.Azure.ServiceBus', 'Microsoft.Azure.Storage.Blob', 'azure-eventhubs', 'azure-servicebus', 'azure-storage'}}
+
+def read_corpus(test_corpus_path:str='.') -> dict:
+    corpus = {}
+    for file_path in sorted(glob.glob(os.path.join(test_corpus_path, 'TestCorpus', '*', '*', '*', '*'))):
+        with open(file_path, encoding='latin-1') as f:
+            corpus[file_path] = f.read()
+    return corpus
+
+def label_of(file_path:str) -> str:
+    return os.path.normpath(file_path).split(os.sep)[-2]
+
+def build_offline_model(test_corpus_path:str='.') -> _TrainedModel:
+    corpus = read_corpus(test_corpus_path)
+    tokens = {'T1':set(), 'T2':set()}
+    for file_path, text in corpus.items():
+        tokens[label_of(file_path)].update(tokenize_text(text))
+    intersection = tokens['T1'] & tokens['T2']
+    only_new_tokens = {t for t in tokens['T2'] - intersection if re.search('[a-zA-Z]', t)}
+    only_old_tokens = {t for t in tokens['T1'] - intersection if re.search('[a-zA-Z]', t)}
+
+    trained_model = _TrainedModel(only_new_tokens, only_old_tokens, set(VERSIONS['T2']), set(VERSIONS['T1']))
+    trained_model._model = MLPClassifier(solver='lbfgs', max_iter=1000, random_state=0)
+    trained_model._model.fit([trained_model.create_feature_vector(text) for text in corpus.values()], [label_of(p) for p in corpus])
+    return trained_model
+
+def build_offline_classifier(test_corpus_path:str='.') -> AzureSDKTrackClassifier:
+    classifier = AzureSDKTrackClassifier.__new__(AzureSDKTrackClassifier) # Skip __init__, which would train from the network.
+    classifier._language, classifier._service = None, None
+    classifier._trained_model = build_offline_model(test_corpus_path)
+    classifier._result_cache = None
+    return classifier
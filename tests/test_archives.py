@@ -0,0 +1,97 @@
+import io
+import tempfile
+import threading
+import unittest
+import zipfile
+
+from azureSDKTrackClassifier.archives import ArchiveCache, PackageArchive, open_archive
+from azureSDKTrackClassifier.corpus_store import get_corpus_store
+from azureSDKTrackClassifier.downloads import prefetch_corpora
+from azureSDKTrackClassifier.constants import Language
+from azureSDKTrackClassifier.settings import Settings
+
+def make_zip(files:dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, body in files.items():
+            zf.writestr(name, body)
+    return buffer.getvalue()
+
+MONOREPO = make_zip({'java-main/sdk/eventhubs/azure-messaging-eventhubs/src/samples/java/Send.java':'import com.azure.messaging.eventhubs.*;',
+                     'java-main/sdk/eventhubs/azure-messaging-eventhubs/src/main/java/Client.java':'not a sample',
+                     'java-main/sdk/eventhubs/azure-messaging-eventhubs/README.md':'# Event Hubs',
+                     'java-main/sdk/storage/azure-storage-blob/src/test/java/BlobTests.java':'import com.azure.storage.blob.*;',
+                     'java-main/sdk/storage/azure-storage-blob/src/samples/java/image.png':'not code',
+                     'java-main/sdk/storage/azure-storage-blob/src/samples/':''})
+
+class _CountingDownloader:
+    """ Serves zips from a dict by URI, counting fetches. """
+    concurrency = 4
+
+    def __init__(self, zips:dict):
+        self.zips, self.fetches, self.lock = zips, [], threading.Lock()
+
+    def fetch(self, uri):
+        with self.lock:
+            self.fetches.append(uri)
+        return io.BytesIO(self.zips[uri]) if uri in self.zips else None
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, self.directory.name
+
+    def tearDown(self):
+        get_corpus_store().close()
+        Settings.CACHE_BASE_PATH = self.cache_base_path
+        self.directory.cleanup()
+
+    def test_corpus_files_by_package_and_subpath(self):
+        archive = PackageArchive(io.BytesIO(MONOREPO))
+        assert archive.files('azure-messaging-eventhubs') == ['java-main/sdk/eventhubs/azure-messaging-eventhubs/src/samples/java/Send.java',
+                                                              'java-main/sdk/eventhubs/azure-messaging-eventhubs/README.md']
+        assert archive.corpus('azure-storage-blob') == {'java-main/sdk/storage/azure-storage-blob/src/test/java/BlobTests.java':'import com.azure.storage.blob.*;'}
+        assert archive.files('azure-messaging-eventhubs', 'sdk/storage') == ['java-main/sdk/storage/azure-storage-blob/src/test/java/BlobTests.java']
+        assert archive.files('azure-cosmos') == []
+
+    def test_shared_zip_is_fetched_once(self):
+        uri = 'https://github.com/Azure/azure-sdk-for-java/archive/main.zip'
+        downloader = _CountingDownloader({uri:MONOREPO})
+        metadata = [({'Package':package, 'VersionGA':'1.0.0', 'VersionPreview':'', 'RepoPath':'https://github.com/Azure/azure-sdk-for-java/tree/main/sdk/' + path}, Language.java)
+                    for package, path in [('azure-messaging-eventhubs', 'eventhubs'), ('azure-storage-blob', 'storage'), ('azure-storage-queue', 'storage')]]
+        corpora = prefetch_corpora(metadata, downloader)
+        assert downloader.fetches == [uri]
+        assert [len(corpus) for corpus in corpora.values()] == [2, 1, 1]
+
+        with ArchiveCache(max_open=1) as archives:
+            assert archives.open(uri, downloader) is archives.open(uri, downloader)
+            assert archives.open(uri + '.missing', downloader) is None
+            archives.open(uri, downloader)
+        assert downloader.fetches == [uri] + [uri, uri + '.missing', uri] # Reopened once it was dropped for the missing zip.
+
+    def test_raw_zips_are_cached_and_bad_zips_dropped(self):
+        uri = 'https://github.com/Azure/azure-sdk-for-java/archive/main.zip'
+        downloader = _CountingDownloader({uri:MONOREPO})
+        open_archive(uri, downloader, use_raw_corpus_cache=True).close()
+        archive = open_archive(uri, downloader, use_raw_corpus_cache=True)
+        assert downloader.fetches == [uri] and len(archive.files('azure-storage-blob')) == 1
+        archive.close()
+
+        downloader.zips[uri + '.bad'] = b'not a zip'
+        with self.assertRaises(zipfile.BadZipFile):
+            open_archive(uri + '.bad', downloader, use_raw_corpus_cache=True)
+        assert get_corpus_store().open('archive_{}.bad'.format(uri)) is None
+
+    def test_corrupt_cached_zip_is_fetched_again(self):
+        uri = 'https://github.com/Azure/azure-sdk-for-java/archive/main.zip'
+        downloader = _CountingDownloader({uri:MONOREPO})
+        get_corpus_store().put('archive_{}'.format(uri), MONOREPO[:len(MONOREPO) // 2], compress=False)
+        with self.assertLogs('azureSDKTrackClassifier.archives', 'WARNING'):
+            archive = open_archive(uri, downloader, use_raw_corpus_cache=True)
+        assert downloader.fetches == [uri] and len(archive.files('azure-storage-blob')) == 1
+        archive.close()
+        open_archive(uri, downloader, use_raw_corpus_cache=True).close()
+        assert downloader.fetches == [uri] # The fetched zip replaced the corrupt one in the store.
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from azureSDKTrackClassifier.artifacts import ArtifactStore
+from azureSDKTrackClassifier.constants import Language
+from azureSDKTrackClassifier.corpus_store import get_corpus_store
+from azureSDKTrackClassifier.helpers import get_corpus_arguments, get_corpus_files_tokens_and_versions_for_one_package, get_corpus_files_tokens_and_versions_for_package
+from azureSDKTrackClassifier.settings import Settings
+
+def package(name:str, version:str) -> dict:
+    return {'Package':name, 'VersionGA':version, 'VersionPreview':'', 'RepoPath':'NA'}
+
+CORPORA = {'azure-eventhub':{'eventhub/samples/send.py':'from azure.eventhub import EventHubProducerClient'},
+           'azure-servicebus':{'servicebus/samples/send.py':'from azure.servicebus import ServiceBusClient'},
+           'azure-storage-blob':{'blob/samples/upload.py':'from azure.storage.blob import BlobServiceClient'}}
+
+class TestArtifactStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_directory = tempfile.TemporaryDirectory() # The repo's own ApiStubGen files are read, and their tokens cached, for some of these packages.
+        self.cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, self.cache_directory.name
+        self.fetched = []
+
+    def tearDown(self):
+        get_corpus_store().close()
+        Settings.CACHE_BASE_PATH = self.cache_base_path
+        self.cache_directory.cleanup()
+        self.directory.cleanup()
+
+    def train(self, metadata:list) -> tuple:
+        """ Updates the artifacts as train_model does, returning its merged result. """
+        store = ArtifactStore(self.directory.name)
+        stale = store.stale(metadata)
+        self.fetched.append([each['Package'] for each, _ in stale])
+        corpora = {get_corpus_arguments(each, each_language):CORPORA[each['Package']] for each, each_language in stale}
+        for each, each_language in stale:
+            store.put(each, each_language, *get_corpus_files_tokens_and_versions_for_one_package(each, each_language, corpora))
+        store.prune([Language.python], metadata)
+        store.save()
+        return store.merge(metadata)
+
+    def test_only_new_or_changed_packages_are_rebuilt(self):
+        metadata = [(package('azure-eventhub', '5.0.0'), Language.python), (package('azure-servicebus', '7.0.0'), Language.python)]
+        merged = self.train(metadata)
+        corpora = {get_corpus_arguments(each, each_language):CORPORA[each['Package']] for each, each_language in metadata}
+        assert merged == get_corpus_files_tokens_and_versions_for_package(metadata, corpora)
+
+        assert self.train(metadata) == merged
+        metadata = [(package('azure-eventhub', '5.1.0'), Language.python), (package('azure-storage-blob', '12.0.0'), Language.python)]
+        self.train(metadata)
+        assert self.fetched == [['azure-eventhub', 'azure-servicebus'], [], ['azure-eventhub', 'azure-storage-blob']]
+        assert len(os.listdir(self.directory.name)) == 3 # Dropped packages are pruned.
+
+    def test_other_languages_are_kept(self):
+        self.train([(package('azure-eventhub', '5.0.0'), Language.python)])
+        store = ArtifactStore(self.directory.name)
+        store.put(package('Azure.Messaging.EventHubs', '5.0.0'), Language.dotnet, {}, {'EventHubProducerClient'}, {'5.0.0'})
+        store.save()
+        self.train([(package('azure-servicebus', '7.0.0'), Language.python)])
+        assert ArtifactStore(self.directory.name).get(package('Azure.Messaging.EventHubs', '5.0.0'), Language.dotnet) == ({}, {'EventHubProducerClient'}, {'5.0.0'})
+
+    def test_artifacts_are_compressed(self):
+        corpus = {'eventhub/samples/send{}.py'.format(i):'from azure.eventhub import EventHubProducerClient, EventData\n' * 50 for i in range(20)}
+        store = ArtifactStore(self.directory.name)
+        store.put(package('azure-eventhub', '5.0.0'), Language.python, corpus, {'EventHubProducerClient'}, {'5.0.0'})
+        store.save()
+        (name,) = [name for name in os.listdir(self.directory.name) if name != 'index.json']
+        assert os.path.getsize(os.path.join(self.directory.name, name)) < sum(map(len, corpus.values())) / 10
+        assert ArtifactStore(self.directory.name).get(package('azure-eventhub', '5.0.0'), Language.python) == (corpus, {'EventHubProducerClient'}, {'5.0.0'})
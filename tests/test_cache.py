@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+
+from azureSDKTrackClassifier.cache import ResultCache
+from offline_model import build_offline_classifier, read_corpus
+
+class TestResultCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = build_offline_classifier()
+        cls.texts = list(dict.fromkeys(read_corpus().values())) # Distinct texts only.
+
+    def tearDown(self):
+        self.classifier.disable_result_cache()
+
+    def test_cached_results_match_uncached(self):
+        expected = [self.classifier.is_t1_verbose(t) for t in self.texts]
+        self.classifier.enable_result_cache(max_entries=100)
+        for _ in range(2):
+            results = list(self.classifier.is_t1_verbose_many(self.texts + self.texts))
+            assert [r['result'] for r in results] == [r['result'] for r in expected + expected]
+        assert self.classifier.is_t1(self.texts[0]) == expected[0]['result']
+        stats = self.classifier.result_cache_stats()
+        assert (stats['misses'], stats['hits']) == (len(self.texts) + 1, len(self.texts) * 3)
+
+    def test_lru_bound(self):
+        self.classifier.enable_result_cache(max_entries=2)
+        list(self.classifier.is_t1_many(self.texts[:3]))
+        assert self.classifier.result_cache_stats()['entries'] == 2
+        self.classifier.is_t1(self.texts[0]) # Evicted as least recently used.
+        assert self.classifier.result_cache_stats()['misses'] == 4
+
+    def test_persistent_store_keyed_by_model(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            self.classifier.enable_result_cache(persistent=True, path=path)
+            self.classifier.is_t1(self.texts[0])
+            self.classifier.enable_result_cache(persistent=True, path=path) # Fresh memory, same store.
+            self.classifier.is_t1(self.texts[0])
+            assert self.classifier.result_cache_stats()['disk_hits'] == 1
+
+            other = build_offline_classifier()
+            other._trained_model._only_new_versions.add('Azure.Messaging.WebPubSub')
+            other._trained_model._fingerprint = None
+            other.enable_result_cache(persistent=True, path=path)
+            other.is_t1(self.texts[0])
+            assert other.result_cache_stats()['hits'] == 0
+            other.disable_result_cache()
+            self.classifier.disable_result_cache()
+
+    def test_store_pruned_and_capped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            stale = ResultCache('stale-model', persistent=True, path=path)
+            stale.put(stale.key(('is_t1',), 'text'), True)
+            stale.close()
+            cache = ResultCache('model', persistent=True, path=path, max_stored_entries=2)
+            assert cache._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0 # Other models' results are deleted on open.
+            keys = [cache.key(('is_t1',), str(i)) for i in range(3)]
+            cache.put_many([(key, True) for key in keys])
+            assert [row[0] for row in cache._connection.execute("SELECT key FROM results ORDER BY rowid")] == keys[1:]
+            cache.close()
+
+    def test_verbose_results_stored_as_json_and_copied(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.sqlite')
+            self.classifier.enable_result_cache(persistent=True, path=path)
+            expected = self.classifier.is_t1_verbose(self.texts[0])
+            expected['ml_result_probability'][0] = 0 # Mutating a returned result must not corrupt the cache.
+            stored = self.classifier._result_cache._connection.execute("SELECT value FROM results").fetchone()[0]
+            assert json.loads(stored)['t1_token_count'] == expected['t1_token_count']
+            self.classifier.enable_result_cache(persistent=True, path=path) # Fresh memory, same store.
+            for _ in range(2):
+                result = self.classifier.is_t1_verbose(self.texts[0])
+                assert result['ml_result_probability'].tolist() == self.classifier._trained_model.classify_verbose(self.texts[0])['ml_result_probability'].tolist()
+                result['ml_result_probability'][0] = 0
+
+    def test_persistent_batch_is_stored_in_one_transaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.classifier.enable_result_cache(persistent=True, path=os.path.join(directory, 'results.sqlite'))
+            statements = []
+            self.classifier._result_cache._connection.set_trace_callback(statements.append)
+            results = list(self.classifier.is_t1_many(self.texts))
+            assert [s for s in statements if s.startswith('COMMIT')] == ['COMMIT']
+            self.classifier.enable_result_cache(persistent=True, path=os.path.join(directory, 'results.sqlite')) # Fresh memory, same store.
+            assert list(self.classifier.is_t1_many(self.texts)) == results
+            assert self.classifier.result_cache_stats()['disk_hits'] == len(self.texts)
+            self.classifier.disable_result_cache()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,5 @@
+import glob
+import os
 import unittest
 
 from azureSDKTrackClassifier import AzureSDKTrackClassifier, Language
@@ -17,12 +19,83 @@ class TestClassifier(unittest.TestCase):
         is_t1_classifier = AzureSDKTrackClassifier.load(path)
         is_t1_classifier.is_t1('test')
 
+import io
+import json
+import tempfile
+from unittest import mock
+
+from azureSDKTrackClassifier.corpus_store import get_corpus_store
 from azureSDKTrackClassifier.helpers import get_apistubgen_tokens_for_package
+from azureSDKTrackClassifier.settings import Settings
+from azureSDKTrackClassifier.tokenizers import _JsonStream, tokenize_apistubgen, tokenize_apistubgen_file, tokenize_text
 
 class TestTokenizer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, self.directory.name
+
+    def tearDown(self):
+        get_corpus_store().close()
+        Settings.CACHE_BASE_PATH = self.cache_base_path
+        self.directory.cleanup()
+
     def test_apistubgen_tokenizer(self):
         assert get_apistubgen_tokens_for_package('dotnet', 'Azure.Messaging.ServiceBus', '7.0.0')
         assert get_apistubgen_tokens_for_package('python', 'azure-servicebus', '7.0.0')
 
+    def test_streaming_apistubgen_tokenizer_matches_parsed(self):
+        for file_path in glob.glob('./ApiStubGen/*.json'):
+            with open(file_path, 'rb') as f:
+                body = f.read()
+            expected = tokenize_apistubgen(json.loads(body))
+            for chunk_size in [7, 4096, 1 << 20]: # Values and multi-byte characters straddling chunks, and the whole file at once.
+                assert tokenize_apistubgen_file(io.BytesIO(body), chunk_size) == expected
+        deep = {'Name':'deep', 'Version':1, 'Navigation':[{'Text':'root', 'ChildItems':[]}], 'Tokens':[{'Kind':6, 'Value':' Client '}]}
+        node = deep['Navigation'][0]
+        for depth in range(5000): # Deeper than the recursion limit allows a recursive walk.
+            node['ChildItems'].append({'Text':'n{}'.format(depth), 'ChildItems':[], 'Tags':{'TypeKind':'class'}})
+            node = node['ChildItems'][0]
+        found = tokenize_apistubgen(deep)
+        assert found['type'] == {'Client'} and len(found['class']) == 5000 and found[None] == {'root'}
+        # As a file, without building (or serializing) the tree recursively.
+        nested = '{"Text": "root", "ChildItems": [' + ''.join('{"Text": "n%d", "Tags": {"TypeKind": "class"}, "ChildItems": [' % depth for depth in range(5000)) + ']}' * 5000 + ']}'
+        body = '{"Name": "deep", "Navigation": [' + nested + '], "Tokens": [{"Kind": 6, "Value": " Client "}]}'
+        assert tokenize_apistubgen_file(io.BytesIO(body.encode('utf-8')), 4096) == found
+
+    def test_streaming_apistubgen_tokenizer_buffers_little_of_a_large_root(self):
+        children = [{'Text':'Type{}'.format(i), 'ChildItems':[{'Text':'Member{}'.format(i), 'ChildItems':[], 'Tags':{'TypeKind':'method'}}], 'Tags':{'TypeKind':'class'}} for i in range(5000)]
+        stub = {'Name':'wide', 'Navigation':[{'Text':'Azure.Namespace', 'ChildItems':children, 'Tags':{'TypeKind':'namespace'}}], 'Tokens':[{'Kind':6, 'Value':'Client'}]}
+        body = json.dumps(stub).replace('"Text": "Azure.Namespace"', '"Te\\u0078t": "Azure.Namespace"').encode('utf-8') # An escaped key, as JSON allows.
+        assert b'"Te\\u0078t"' in body
+        buffered = []
+        read = _JsonStream._read
+        def recording_read(stream, *args, **kwargs):
+            more = read(stream, *args, **kwargs)
+            buffered.append(len(stream._buffer))
+            return more
+        with mock.patch.object(_JsonStream, '_read', recording_read):
+            found = tokenize_apistubgen_file(io.BytesIO(body), 1024)
+        assert found == tokenize_apistubgen(json.loads(body))
+        assert len(body) > 100 * 1024 and max(buffered) <= 2 * 1024 # Never more than what's left of one chunk and the next.
+
+    def test_apistubgen_tokens_are_cached_by_file_hash(self):
+        tokens = get_apistubgen_tokens_for_package('python', 'azure-servicebus', '7.0.0')
+        with mock.patch('azureSDKTrackClassifier.helpers.tokenize_apistubgen_file') as tokenize:
+            assert get_apistubgen_tokens_for_package('python', 'azure-servicebus', '7.0.0') == tokens
+            assert not tokenize.called
+
+        with tempfile.TemporaryDirectory() as stubs, mock.patch.object(Settings, 'APISTUBGEN_PATH', stubs):
+            assert get_apistubgen_tokens_for_package('python', 'azure-servicebus', '7.0.0') == set()
+            with open(os.path.join(stubs, 'python_azure-servicebus_7.0.0.json'), 'w') as f:
+                json.dump({'Navigation':[], 'Tokens':[{'Kind':0, 'Value':'changed'}]}, f)
+            assert get_apistubgen_tokens_for_package('python', 'azure-servicebus', '7.0.0') == {'changed'}
+
+    def test_text_tokenizer_matches_nltk(self):
+        from nltk.tokenize import WordPunctTokenizer
+        for file_path in glob.glob('./TestCorpus/**/*.txt', recursive=True):
+            with open(file_path, encoding='latin-1') as f:
+                text = f.read()
+            assert tokenize_text(text) == set(WordPunctTokenizer().tokenize(text))
+
 if __name__ == '__main__':
     unittest.main()
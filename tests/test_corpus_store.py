@@ -0,0 +1,65 @@
+import io
+import os
+import tempfile
+import unittest
+
+from azureSDKTrackClassifier.corpus_store import CorpusStore
+
+class _FailingReader(io.RawIOBase):
+    """ Reads a chunk, then fails, as a download interrupted part way would. """
+    def __init__(self):
+        self.reads = 0
+    def readable(self):
+        return True
+    def readinto(self, buffer):
+        self.reads += 1
+        if self.reads > 1:
+            raise ConnectionError("Interrupted")
+        buffer[:4] = b'part'
+        return 4
+
+class TestCorpusStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = CorpusStore(self.directory.name, 1 << 20)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_round_trip_compressed_and_not(self):
+        body = b'{"samples/send.py": "from azure.eventhub import EventHubProducerClient"}' * 100
+        self.store.put('trimmed', body)
+        self.store.put('raw', io.BytesIO(body), compress=False)
+        assert self.store.read('trimmed') == body
+        with self.store.open('raw') as f:
+            assert f.read() == body
+        assert self.store.read('missing') is None
+        assert self.store.total_bytes() < 2 * len(body) # The compressed entry is much smaller.
+
+    def test_least_recently_used_are_evicted_over_budget(self):
+        self.store.max_bytes = 2500
+        for name in ['a', 'b', 'c']:
+            self.store.put(name, os.urandom(1000), compress=False)
+            if name == 'b':
+                self.store.read('a') # So b is now the least recently used.
+        assert [self.store.read(name) is not None for name in ['a', 'b', 'c']] == [True, False, True]
+        self.store.put('huge', os.urandom(3000), compress=False) # Over the whole budget, so not stored, and nothing is evicted for it.
+        assert self.store.read('huge') is None and self.store.total_bytes() == 2000
+
+    def test_corrupt_and_interrupted_entries_are_not_returned(self):
+        self.store.put('trimmed', b'x' * 1000)
+        path = [os.path.join(self.directory.name, name) for name in os.listdir(self.directory.name) if name.endswith('.gz')][0]
+        with open(path, 'r+b') as f:
+            f.seek(-8, os.SEEK_END)
+            f.write(b'\0' * 8) # Same size, but fails gzip's checks.
+        assert self.store.read('trimmed') is None
+        assert self.store.total_bytes() == 0 and not os.path.exists(path)
+
+        with self.assertRaises(ConnectionError):
+            self.store.put('interrupted', io.BufferedReader(_FailingReader()), compress=False)
+        assert self.store.open('interrupted') is None
+        assert sorted(os.listdir(self.directory.name)) == ['index.sqlite'] # No partial files left behind.
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from azureSDKTrackClassifier.dictionary import EnglishDictionary
+
+ENGLISH = {'send', 'message', 'client', 'the'}
+
+class TestEnglishDictionary(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, 'dictionary.sqlite')
+        self.checked = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check(self, word:str) -> bool:
+        self.checked.append(word)
+        return word in ENGLISH
+
+    def dictionary(self, identity:str='test') -> EnglishDictionary:
+        return EnglishDictionary(cache_path=self.cache_path, check=self.check, identity=identity)
+
+    def test_verdicts_are_memoized_across_runs(self):
+        words = ['send', 'EventHubProducerClient', 'message', 'azure-eventhub', 'surrogate\ud800']
+        dictionary = self.dictionary()
+        assert dictionary.english_words(words) == {'send', 'message'}
+        dictionary.close()
+        assert sorted(self.checked) == sorted(words)
+
+        self.checked.clear()
+        dictionary = self.dictionary()
+        assert dictionary.english_words(words + ['client']) == {'send', 'message', 'client'}
+        assert sorted(self.checked) == ['client', 'surrogate\ud800'] # Only unseen words, and those sqlite can't hold.
+        dictionary.close()
+
+        self.checked.clear()
+        other = self.dictionary('other') # Verdicts of another dictionary aren't reused.
+        assert other.english_words(['send']) == {'send'} and self.checked == ['send']
+        other.close()
+
+    def test_frozen_wordlist_matches_dictionary(self):
+        words = ['send', 'EventHubProducerClient', 'the', 'ServiceBusClient']
+        dictionary = self.dictionary()
+        expected = dictionary.english_words(words)
+        wordlist_path = os.path.join(self.directory.name, 'words.txt')
+        assert dictionary.export_wordlist(wordlist_path) == 2
+        dictionary.close()
+        self.checked.clear()
+        assert EnglishDictionary(wordlist_path).english_words(words) == expected
+        assert not self.checked
+
+if __name__ == '__main__':
+    unittest.main()
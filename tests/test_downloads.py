@@ -0,0 +1,154 @@
+import http.server
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import zipfile
+
+from azureSDKTrackClassifier.constants import Language
+from azureSDKTrackClassifier.downloads import ZipDownloader, prefetch_corpora
+from azureSDKTrackClassifier.helpers import get_corpus_files_tokens_and_versions_for_package
+from azureSDKTrackClassifier.settings import Settings
+
+def make_zip(files:dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, body in files.items():
+            zf.writestr(name, body)
+    return buffer.getvalue()
+
+ARCHIVES = {'/Azure/one/archive/main.zip':make_zip({'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient', 'one-main/sdk/eventhub/setup.py':'not a sample'}),
+            '/Azure/two/archive/main.zip':make_zip({'two-main/samples/sample.cs':'using Azure.Messaging.EventHubs;'})}
+
+class _FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves ARCHIVES; failing the first request for a path with 503 if it is in the server's flaky set, stalling the first request for a path in its
+        stalled set for a second before answering, cutting short the body of the first request for a path in its truncated set, and tracking the most
+        concurrent requests. """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+            server.requests.append(self.path)
+            flaky, stalled, truncated = self.path in server.flaky, self.path in server.stalled, self.path in getattr(server, 'truncated', ())
+            server.flaky.discard(self.path)
+            server.stalled.discard(self.path)
+            if truncated:
+                server.truncated.discard(self.path)
+        try:
+            time.sleep(1 if stalled else server.delay)
+            body = ARCHIVES.get(self.path)
+            status = 503 if flaky else 404 if body is None else 200
+            body = body if status == 200 else b''
+            self.send_response(status)
+            if flaky:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2] if truncated else body)
+            self.close_connection = self.close_connection or truncated
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+class TestZipDownloader(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _FixtureHandler)
+        self.server.lock, self.server.active, self.server.most_active, self.server.requests, self.server.flaky, self.server.stalled, self.server.delay = threading.Lock(), 0, 0, [], set(), set(), 0
+        self.server.truncated = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_uri = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_retries_and_falls_back_to_main(self):
+        self.server.flaky.add('/Azure/one/archive/main.zip')
+        downloader = ZipDownloader(retries=2, backoff=0)
+        with downloader.fetch(self.base_uri + '/Azure/one/archive/master.zip') as spool:
+            assert spool.read() == ARCHIVES['/Azure/one/archive/main.zip']
+        assert self.server.requests == ['/Azure/one/archive/master.zip'] + ['/Azure/one/archive/main.zip'] * 2
+        assert downloader.fetch(self.base_uri + '/Azure/missing/archive/main.zip') is None
+        downloader.close()
+
+    def test_gives_up_after_retries(self):
+        self.server.flaky.add('/Azure/one/archive/main.zip')
+        downloader = ZipDownloader(retries=0, backoff=0)
+        with self.assertRaises(Exception):
+            downloader.fetch(self.base_uri + '/Azure/one/archive/main.zip')
+        downloader.close()
+
+    def test_stalled_requests_time_out_and_are_retried(self):
+        import requests
+        self.server.stalled.add('/Azure/two/archive/main.zip')
+        downloader = ZipDownloader(retries=1, backoff=0, timeout=0.2)
+        with downloader.fetch(self.base_uri + '/Azure/two/archive/main.zip') as spool:
+            assert spool.read() == ARCHIVES['/Azure/two/archive/main.zip']
+        assert self.server.requests == ['/Azure/two/archive/main.zip'] * 2
+
+        self.server.stalled.add('/Azure/two/archive/main.zip')
+        downloader = ZipDownloader(retries=0, backoff=0, timeout=0.2)
+        with self.assertRaises(requests.Timeout):
+            downloader.fetch(self.base_uri + '/Azure/two/archive/main.zip')
+        downloader.close()
+
+    def test_truncated_bodies_are_retried(self):
+        self.server.truncated.add('/Azure/two/archive/main.zip')
+        downloader = ZipDownloader(retries=1, backoff=0)
+        with downloader.fetch(self.base_uri + '/Azure/two/archive/main.zip') as spool:
+            assert spool.read() == ARCHIVES['/Azure/two/archive/main.zip']
+        assert self.server.requests == ['/Azure/two/archive/main.zip'] * 2
+        downloader.close()
+
+    def test_per_host_concurrency_is_capped(self):
+        self.server.delay = 0.05
+        downloader = ZipDownloader(concurrency=8, per_host_concurrency=2)
+        threads = [threading.Thread(target=downloader.fetch, args=(self.base_uri + '/Azure/two/archive/main.zip',)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        downloader.close()
+        assert len(self.server.requests) == 8
+        assert self.server.most_active <= 2
+
+    def test_prefetch_corpora(self):
+        metadata = [({'Package':'azure-eventhub', 'VersionGA':'1.0.0', 'VersionPreview':'', 'RepoPath':self.base_uri + '/Azure/one/tree/main/sdk/eventhub'}, Language.python),
+                    ({'Package':'Azure.Messaging.EventHubs', 'VersionGA':'', 'VersionPreview':'5.0.0-beta.1', 'RepoPath':self.base_uri + '/Azure/two'}, Language.dotnet)]
+        with tempfile.TemporaryDirectory() as directory:
+            cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, directory
+            try:
+                corpora = prefetch_corpora(metadata + metadata[:1], ZipDownloader(backoff=0))
+                assert len(corpora) == 2
+                assert list(corpora.values()) == [{'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient'}, {'two-main/samples/sample.cs':'using Azure.Messaging.EventHubs;'}]
+                request_count = len(self.server.requests)
+                corpus_files, tokens, versions = get_corpus_files_tokens_and_versions_for_package(metadata, corpora)
+                assert len(self.server.requests) == request_count # Nothing more is fetched once prefetched.
+                assert corpus_files == {**corpora[next(iter(corpora))], 'two-main/samples/sample.cs':'using Azure.Messaging.EventHubs;'}
+                assert {'1.0.0', 'azure-eventhub'} <= versions
+                assert prefetch_corpora(metadata, ZipDownloader(backoff=0)) == corpora
+                assert len(self.server.requests) == request_count # Served from the corpus cache.
+            finally:
+                Settings.CACHE_BASE_PATH = cache_base_path
+
+    def test_prefetch_records_failed_packages_as_missing(self):
+        self.server.flaky.add('/Azure/two/archive/main.zip')
+        metadata = [({'Package':'azure-eventhub', 'VersionGA':'1.0.0', 'VersionPreview':'', 'RepoPath':self.base_uri + '/Azure/one/tree/main/sdk/eventhub'}, Language.python),
+                    ({'Package':'Azure.Messaging.EventHubs', 'VersionGA':'', 'VersionPreview':'5.0.0-beta.1', 'RepoPath':self.base_uri + '/Azure/two'}, Language.dotnet)]
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(Settings, 'CACHE_BASE_PATH', directory), mock.patch.object(Settings, 'MISSING_TRAINING_LOG', os.path.join(directory, 'missing.tsv')):
+            failed = set()
+            with self.assertLogs('azureSDKTrackClassifier.downloads', 'WARNING'):
+                corpora = prefetch_corpora(metadata, ZipDownloader(retries=0, backoff=0), failed)
+            assert list(corpora.values()) == [{'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient'}, {}]
+            assert failed == {list(corpora)[1]}
+            with open(Settings.MISSING_TRAINING_LOG) as f:
+                assert 'Azure.Messaging.EventHubs' in f.read()
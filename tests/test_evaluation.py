@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sklearn.model_selection import cross_val_score
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.svm import SVC
+
+from azureSDKTrackClassifier import evaluation
+from azureSDKTrackClassifier.settings import Settings
+from offline_model import build_offline_model, label_of, read_corpus
+
+class TestEvaluation(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        corpus = read_corpus()
+        model = build_offline_model()
+        cls.vectors = [model.create_feature_vector(text) for text in corpus.values()]
+        cls.classes = [label_of(path) for path in corpus]
+
+    def test_matches_cross_val_score_in_parallel(self):
+        candidates = [KNeighborsClassifier(), SVC(kernel="linear")]
+        results = evaluation.evaluate(self.vectors, self.classes, candidates, folds=5, n_jobs=2)
+        for candidate, result in zip(candidates, results):
+            scores = cross_val_score(candidate, self.vectors, self.classes, cv=5)
+            assert result['classifier'] == str(candidate)
+            assert result['fold_scores'] == scores.tolist()
+            assert abs(result['accuracy_mean'] - scores.mean()) < 1e-9
+
+    def test_feature_matrix_is_cached_and_history_recorded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, directory
+            try:
+                with mock.patch('azureSDKTrackClassifier.model.build_training_set', return_value=(None, self.vectors, self.classes)) as build: # Building needs the network.
+                    vectors, classes = evaluation.feature_matrix('python')
+                    cached_vectors, cached_classes = evaluation.feature_matrix('python')
+                    assert build.call_count == 1
+                    evaluation.feature_matrix('python', rebuild=True)
+                    assert build.call_count == 2
+            finally:
+                Settings.CACHE_BASE_PATH = cache_base_path
+            assert cached_vectors.tolist() == vectors.tolist() == [[float(e) for e in v] for v in self.vectors]
+            assert cached_classes.tolist() == self.classes
+
+            history_path = os.path.join(directory, 'history.jsonl')
+            results = evaluation.evaluate(vectors, classes, [SVC(kernel="linear")], folds=3)
+            for note in ['first', 'second']:
+                evaluation.record_history(history_path, 'python', None, len(vectors), 3, results, note)
+            with open(history_path) as f:
+                records = [json.loads(line) for line in f]
+            assert [(r['language'], r['note'], r['results']) for r in records] == [('python', 'first', results), ('python', 'second', results)]
@@ -0,0 +1,14 @@
+import subprocess
+import sys
+import unittest
+
+# Guards the inference path against regressing back to importing training, blob, or dictionary dependencies.  (See benchmarks/import_time_benchmark.py for timings.)
+class TestImports(unittest.TestCase):
+    def test_inference_path_skips_heavy_dependencies(self):
+        code = "import azureSDKTrackClassifier, azureSDKTrackClassifier.__main__, sys; print(','.join(sorted(set(m.split('.')[0] for m in sys.modules))))"
+        imported = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.strip().split(',')
+        for module in ['sklearn', 'nltk', 'enchant', 'exdown', 'requests', 'azure']:
+            assert module not in imported, module
+
+if __name__ == '__main__':
+    unittest.main()
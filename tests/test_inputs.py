@@ -0,0 +1,116 @@
+from functools import partial
+import http.server
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import zipfile
+
+from azureSDKTrackClassifier.inputs import get_zip_uri_and_subpath, iter_github_archives, iter_jsonl_documents, iter_zip_members, walk_files
+from offline_model import build_offline_classifier, read_corpus
+
+def make_zip(files:dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, body in files.items():
+            zf.writestr(name, body)
+    return buffer.getvalue()
+
+class TestGithubArchiveInputs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        archives = {'one.zip':{'one-main/README.md':'from azure.eventhub import EventHubClient', 'one-main/sdk/sample.py':'import azure.eventhub'},
+                    'two/archive/main.zip':{'two-main/sdk/eventhub/sample.cs':'using Azure.Messaging.EventHubs;', 'two-main/sdk/servicebus/sample.cs':'using Azure.Messaging.ServiceBus;', 'two-main/sdk/eventhub/binary.bin':b'\x80\\x'}}
+        for name, files in archives.items():
+            os.makedirs(os.path.dirname(os.path.join(cls.directory.name, name)), exist_ok=True)
+            with open(os.path.join(cls.directory.name, name), 'wb') as f:
+                f.write(make_zip(files))
+        handler = partial(http.server.SimpleHTTPRequestHandler, directory=cls.directory.name)
+        handler.log_message = lambda *args: None
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_uri = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.directory.cleanup()
+
+    def test_zip_uri_and_subpath(self):
+        assert get_zip_uri_and_subpath('https://github.com/Azure/repo/archive/main.zip') == ('https://github.com/Azure/repo/archive/main.zip', '')
+        assert get_zip_uri_and_subpath('https://github.com/Azure/repo/tree/main/sdk/eventhub') == ('https://github.com/Azure/repo/archive/main.zip', 'sdk/eventhub')
+
+    def test_zip_members_are_filtered_and_decoded(self):
+        with open(os.path.join(self.directory.name, 'two/archive/main.zip'), 'rb') as f:
+            assert dict(iter_zip_members(f, 'sdk/eventhub')) == {'two-main/sdk/eventhub/sample.cs':'using Azure.Messaging.EventHubs;'} # binary.bin is undecodable, so skipped.
+
+    def test_fetches_multiple_archives(self):
+        # The second link is to a repo root, so is resolved to master.zip; which doesn't exist, so main.zip is used instead.
+        files = dict(iter_github_archives([self.base_uri + '/one.zip', self.base_uri + '/two', self.base_uri + '/missing.zip']))
+        assert sorted(files) == ['one-main/README.md', 'one-main/sdk/sample.py', 'two-main/sdk/eventhub/sample.cs', 'two-main/sdk/servicebus/sample.cs']
+        assert files['two-main/sdk/servicebus/sample.cs'] == 'using Azure.Messaging.ServiceBus;'
+
+class TestDirectoryWalker(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        files = {'README.md':'readme', 'src/client.py':'import azure', 'src/client.pyc':'', 'src/generated/big.py':'x' * 2000, 'src/logo.png':'',
+                 'src/binary.py':'abc\x00def', 'src/latin1.txt':b'caf\xe9', '.git/config.txt':'git', 'docs/build/out.md':'built', 'docs/keep.md':'keep',
+                 'docs/notes.txt':'notes', '.gitignore':'build/\n*.txt\n!docs/notes.txt\n', 'docs/.gitignore':'/keep.md\n'}
+        for name, body in files.items():
+            path = os.path.join(self.directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(body if isinstance(body, bytes) else body.encode('utf-8'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def walk(self, **kwargs) -> list:
+        return [os.path.relpath(path, self.directory.name).replace(os.sep, '/') for path, _ in walk_files(self.directory.name, **kwargs)]
+
+    def test_filters(self):
+        # Not .pyc or .png, nor binary.py, nor anything under .git.  latin1.txt is decoded leniently.
+        assert self.walk(max_file_size=1000) == ['README.md', 'docs/keep.md', 'docs/notes.txt', 'docs/build/out.md', 'src/client.py', 'src/latin1.txt']
+        assert 'src/generated/big.py' in self.walk(max_file_size=0)
+        assert self.walk(include=['src/*'], exclude=['.git', 'generated']) == ['src/client.py', 'src/latin1.txt']
+        assert dict(walk_files(os.path.join(self.directory.name, 'src')))[os.path.join(self.directory.name, 'src', 'client.py')] == 'import azure'
+
+    def test_gitignore(self):
+        assert self.walk(use_gitignore=True) == ['README.md', 'docs/notes.txt', 'src/client.py', 'src/generated/big.py']
+
+class TestJsonlInputs(unittest.TestCase):
+    def test_records(self):
+        path = __file__
+        lines = ['{"path": "%s"}' % path, '{"text": "abc", "id": "inline"}', '', '{"text": "def"}', 'not json', '{"path": "missing-file"}', '{"id": "empty"}']
+        documents = list(iter_jsonl_documents(lines))
+        assert [(key, error is None) for key, _, error in documents] == [(path, True), ('inline', True), (4, True), (5, False), ('missing-file', False), ('empty', False)]
+        assert documents[1][1] == 'abc' and documents[4][1] is None
+
+    def test_cli_writes_a_line_per_document(self):
+        classifier = build_offline_classifier()
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = {}
+            for i, text in enumerate(read_corpus().values()):
+                corpus[os.path.join(directory, '{}.txt'.format(i))] = text
+                with open(os.path.join(directory, '{}.txt'.format(i)), 'w', encoding='utf-8') as f:
+                    f.write(text)
+            model_path = classifier.save(os.path.join(directory, 'compact.model'), 'compact')
+            records = ''.join(json.dumps({'path':path}) + '\n' for path in corpus) + '{"text": "inline"}\n{"path": "missing-file"}\n'
+            completed = subprocess.run([sys.executable, '-m', 'azureSDKTrackClassifier', '-', '--jsonl', '--load-from-file', model_path], input=records, capture_output=True, text=True)
+        lines = [json.loads(line) for line in completed.stdout.splitlines()]
+        expected = dict(zip(corpus, classifier.is_t1_many(corpus.values())))
+        expected[len(corpus) + 1] = classifier.is_t1('inline') # Keyed by line number.
+        assert {line['id']:line['result'] for line in lines if 'result' in line} == expected
+        assert [line['id'] for line in lines if 'error' in line] == ['missing-file']
+        gated = sum(not classifier._trained_model.relevance_gate().admits(text) for text in list(corpus.values()) + ['inline'])
+        assert lines[-1] == {'summary':{'t1_documents':sum(expected.values()), 'total_documents':len(corpus) + 1, 'errors':1, 'gated_documents':gated}}
+        assert completed.returncode == lines[-1]['summary']['t1_documents']
+
+if __name__ == '__main__':
+    unittest.main()
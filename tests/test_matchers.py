@@ -0,0 +1,71 @@
+import pickle
+import random
+import re
+import tracemalloc
+import unittest
+
+from azureSDKTrackClassifier.matchers import RelevanceGate, TokenIndex, VersionMatcher, _trie_pattern
+from azureSDKTrackClassifier.tokenizers import tokenize_text
+
+class TestVersionMatcher(unittest.TestCase):
+    def test_matches_substring_semantics(self):
+        versions = {'Azure.Messaging.EventHubs', 'Microsoft.Azure.EventHubs', 'EventHubs', '5.2.0', '2.0', '12.0.0', 'azure-eventhub'}
+        text = 'using Microsoft.Azure.EventHubs; // upgrade to Azure.Messaging.EventHubs 5.2.0-beta.1 from 112.0.0'
+        assert VersionMatcher(versions).find_all(text) == {v for v in versions if v in text}
+
+    def test_matches_substring_semantics_random(self):
+        random.seed(0)
+        alphabet = 'ab.-1'
+        versions = {''.join(random.choice(alphabet) for _ in range(random.randint(1, 5))) for _ in range(200)}
+        matcher = VersionMatcher(versions)
+        for _ in range(100):
+            text = ''.join(random.choice(alphabet + 'x') for _ in range(random.randint(0, 60)))
+            assert matcher.find_all(text) == {v for v in versions if v in text}
+
+class TestTokenIndex(unittest.TestCase):
+    def test_counts_match_set_intersections(self):
+        new_tokens, old_tokens = {'EventHubProducerClient', 'EventDataBatch', 'SendAsync'}, {'EventHubClient', 'PartitionSender'}
+        document_tokens = {'EventHubProducerClient', 'SendAsync', 'EventHubClient', 'var', '='}
+        index = TokenIndex(new_tokens, old_tokens)
+        assert index.count(document_tokens) == (len(new_tokens & document_tokens), len(old_tokens & document_tokens))
+        assert index.find(document_tokens, TokenIndex.OLD) == old_tokens & document_tokens
+        assert (index.size(TokenIndex.NEW), index.size(TokenIndex.OLD)) == (3, 2)
+
+    def test_pickle_roundtrip(self):
+        index = pickle.loads(pickle.dumps(TokenIndex({'EventDataBatch', 'Shared'}, {'PartitionSender', 'Shared'})))
+        assert (index.tokens(TokenIndex.NEW), index.tokens(TokenIndex.OLD)) == (['EventDataBatch'], ['PartitionSender', 'Shared']) # A token in both counts as old.
+
+    def test_no_larger_than_token_sets(self):
+        new_tokens, old_tokens = ['NewToken{:06d}'.format(i) for i in range(50000)], ['OldToken{:06d}'.format(i) for i in range(50000)]
+        def allocated(build) -> int:
+            tracemalloc.start()
+            try:
+                built = build() # Kept alive until measured.
+                return tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+        assert allocated(lambda: TokenIndex(new_tokens, old_tokens)) <= allocated(lambda: (set(new_tokens), set(old_tokens))) * 1.05
+
+class TestRelevanceGate(unittest.TestCase):
+    def test_rejects_only_texts_without_hits(self):
+        random.seed(0)
+        new_tokens, old_tokens = {'EventHubProducerClient', 'Send', 'ab', '=>'}, {'EventHubClient', 'a1'}
+        versions = {'Azure.Messaging.EventHubs', 'b.-', '1.0'}
+        index, matcher = TokenIndex(new_tokens, old_tokens), VersionMatcher(versions)
+        gate = RelevanceGate(index, versions)
+        fragments = list(new_tokens | old_tokens | versions) + ['x', ' ', '.', '-', '=', '>', 'b', '1', '\n', 'é']
+        for _ in range(2000):
+            text = ''.join(random.choice(fragments) for _ in range(random.randint(0, 8)))
+            if not gate.admits(text): # Never rejects a text with a hit.
+                assert not index.any_hit(tokenize_text(text)) and not matcher.find_all(text), text
+        assert not gate.admits('nothing relevant here, EventHubProducer Sender abc')
+        assert RelevanceGate(index, versions | {''}).admits('nothing relevant here')
+
+    def test_trie_pattern_matches_any_string(self):
+        strings = {'Azure.Messaging.EventHubs', 'Azure.Messaging', 'Azure.Storage', '1.0', '1.0.1', 'a|b'}
+        pattern = re.compile(_trie_pattern(strings))
+        for text in ['Azure.Messaging.ServiceBus', 'Azure.Stor', 'v1.0.2', 'x a|b', 'Azure', 'a b']:
+            assert bool(pattern.search(text)) == any(s in text for s in strings), text
+
+if __name__ == '__main__':
+    unittest.main()
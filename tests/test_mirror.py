@@ -0,0 +1,97 @@
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from azureSDKTrackClassifier import mirror
+from azureSDKTrackClassifier.constants import Language
+from azureSDKTrackClassifier.downloads import ZipDownloader, prefetch_corpora
+from azureSDKTrackClassifier.helpers import parse_release_metadata
+from azureSDKTrackClassifier.settings import Settings
+from test_downloads import _FixtureHandler
+
+RELEASES = """Package,VersionGA,VersionPreview,RepoPath,ServiceName,New
+azure-eventhub,1.0.0,,{base_uri}/Azure/one/tree/main/sdk/eventhub,eventhub,true
+azure-gone,1.0.0,,{base_uri}/Azure/gone,eventhub,false
+"""
+
+class TestCorpusMirror(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _FixtureHandler)
+        self.server.lock, self.server.active, self.server.most_active, self.server.requests, self.server.flaky, self.server.stalled, self.server.delay = threading.Lock(), 0, 0, [], set(), set(), 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.releases = RELEASES.format(base_uri='http://127.0.0.1:{}'.format(self.server.server_address[1]))
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'mirror')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def build(self, **kwargs) -> dict:
+        with mock.patch.object(mirror, 'fetch_release_metadata_text', lambda language: self.releases): # Release metadata only comes from github.
+            return mirror.build_mirror(self.path, [Language.python], downloader=ZipDownloader(backoff=0), **kwargs)
+
+    def metadata(self) -> list:
+        return [(each, Language.python) for rows in parse_release_metadata(self.releases).values() for each in rows]
+
+    def test_mirror_matches_online_corpora(self):
+        manifest = self.build()
+        assert [(entry['package'], entry['kind']) for entry in manifest['packages']] == [('azure-eventhub', 'trimmed'), ('azure-gone', 'missing')]
+        corpus_mirror = mirror.CorpusMirror(self.path)
+        assert corpus_mirror.release_metadata(Language.python) == parse_release_metadata(self.releases)
+        with tempfile.TemporaryDirectory() as cache_path:
+            cache_base_path, Settings.CACHE_BASE_PATH = Settings.CACHE_BASE_PATH, cache_path
+            try:
+                online = prefetch_corpora(self.metadata(), ZipDownloader(backoff=0))
+            finally:
+                Settings.CACHE_BASE_PATH = cache_base_path
+        self.server.shutdown() # Nothing further may be fetched.
+        assert corpus_mirror.corpora(self.metadata()) == online
+        assert list(online.values()) == [{'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient'}, {}]
+
+    def test_raw_mirror_is_trimmed_when_read(self):
+        self.build(kind=mirror.RAW)
+        corpora = mirror.CorpusMirror(self.path).corpora(self.metadata())
+        assert list(corpora.values()) == [{'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient'}, {}]
+
+    def test_raw_zip_shared_by_packages_is_opened_once(self):
+        self.releases += "azure-eventhub-checkpoint,1.0.0,,{}/Azure/one/tree/main/sdk/eventhub,eventhub,true\n".format('http://127.0.0.1:{}'.format(self.server.server_address[1]))
+        self.build(kind=mirror.RAW)
+        corpus_mirror = mirror.CorpusMirror(self.path)
+        with mock.patch.object(corpus_mirror, '_open_archive', wraps=corpus_mirror._open_archive) as open_archive:
+            corpora = corpus_mirror.corpora(self.metadata())
+        assert open_archive.call_count == 1 # The two packages' zips are one file of the mirror.
+        sample = {'one-main/sdk/eventhub/samples/sample.py':'from azure.eventhub import EventHubClient'}
+        assert list(corpora.values()) == [sample, {}, sample]
+
+        with open(os.path.join(self.path, mirror.MANIFEST_NAME)) as f:
+            (path,) = {entry['path'] for entry in json.load(f)['packages'] if entry['path']}
+        with open(os.path.join(self.path, path), 'r+b') as f:
+            f.write(b'XX')
+        with self.assertRaises(ValueError):
+            corpus_mirror.corpora(self.metadata())
+
+    def test_refresh_only_fetches_new_packages(self):
+        self.build()
+        request_count = len(self.server.requests)
+        self.releases += "azure-two,2.0.0,,{}/Azure/two/tree/main/samples,eventhub,true\n".format('http://127.0.0.1:{}'.format(self.server.server_address[1]))
+        self.releases = self.releases.replace('azure-gone', 'azure-gone-too')
+        manifest = self.build()
+        assert [entry['package'] for entry in manifest['packages']] == ['azure-eventhub', 'azure-gone-too', 'azure-two']
+        assert sorted(self.server.requests[request_count:]) == ['/Azure/gone/archive/main.zip', '/Azure/gone/archive/master.zip', '/Azure/two/archive/main.zip']
+        assert len(os.listdir(os.path.join(self.path, 'corpora'))) == 2
+
+    def test_damaged_or_unmirrored_packages_are_errors(self):
+        manifest = self.build()
+        corpus_mirror = mirror.CorpusMirror(self.path)
+        with self.assertRaises(KeyError):
+            corpus_mirror.corpus('azure-sdk-for-python', 'azure-other', '1.0.0')
+        with open(os.path.join(self.path, manifest['packages'][0]['path']), 'r+b') as f:
+            f.write(b'[')
+        with self.assertRaises(ValueError):
+            corpus_mirror.corpora(self.metadata())
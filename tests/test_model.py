@@ -0,0 +1,99 @@
+import io
+import json
+import mmap
+import tempfile
+import unittest
+
+import numpy
+
+from azureSDKTrackClassifier.model import _TrainedModel
+from azureSDKTrackClassifier.tokenizers import StreamingTokenizer, tokenize_text
+from offline_model import build_offline_model, read_corpus
+
+class TestBatchClassification(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.trained_model = build_offline_model()
+        cls.corpus = read_corpus()
+
+    def test_classify_many_matches_single(self):
+        texts = list(self.corpus.values())
+        assert list(self.trained_model.classify_many(texts)) == [self.trained_model.classify(t) for t in texts]
+
+    def test_classify_verbose_many_matches_single(self):
+        texts = list(self.corpus.values()) + ['', 'nothing relevant here']
+        batched = list(self.trained_model.classify_verbose_many(texts, batch_size=4))
+        assert len(batched) == len(texts)
+        for text, result in zip(texts, batched):
+            single = self.trained_model.classify_verbose(text)
+            assert single.keys() == result.keys()
+            for key in single:
+                assert numpy.allclose(single[key], result[key]) if key == 'ml_result_probability' else single[key] == result[key]
+
+class TestStreamingClassification(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.trained_model = build_offline_model()
+        cls.corpus = read_corpus()
+
+    def test_streaming_matches_in_memory(self):
+        text = '\n'.join(self.corpus.values()) + ' Microsoft.Azure.EventHubs'
+        expected = self.trained_model.create_feature_vector(text)
+        for chunk_size in [1, 7, 4096, len(text) + 1]: # Small chunk sizes force tokens and version strings across chunk boundaries.
+            assert self.trained_model.create_feature_vector_streaming(io.StringIO(text), chunk_size=chunk_size) == expected
+            assert self.trained_model.create_feature_vector_streaming(text.encode('utf-8'), chunk_size=chunk_size) == expected
+
+    def test_streaming_decodes_across_chunk_boundaries(self):
+        text = 'Ünïcödé EventHubClient Azure.Messaging.EventHubs ÿ'
+        with tempfile.TemporaryFile() as f:
+            f.write(text.encode('utf-8'))
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                assert self.trained_model.create_feature_vector_streaming(mapped, chunk_size=3) == self.trained_model.create_feature_vector(text)
+
+    def test_streaming_tokenizer_carry_is_bounded_without_whitespace(self):
+        text = json.dumps({'key{}'.format(i):[i, 'Azure.Messaging.EventHubs', 'x' * (i % 50)] for i in range(20000)}, separators=(',', ':')) + 'ÜnïcödéTail'
+        for chunk_size in [1, 7, 4096]:
+            tokenizer, tokens, carried = StreamingTokenizer(), set(), 0
+            for start in range(0, len(text), chunk_size):
+                tokens |= tokenizer.feed(text[start:start + chunk_size])
+                carried = max(carried, tokenizer.carried)
+            assert tokens | tokenizer.flush() == tokenize_text(text)
+            assert carried <= chunk_size + 50 # At most a chunk and the run it continues, never the document.
+
+class TestEarlyExitClassification(unittest.TestCase):
+    def test_early_exit_matches_full_classification(self):
+        trained_model = build_offline_model()
+        texts = list(read_corpus().values())
+        texts += [a + '\n' + b for a, b in zip(texts, reversed(texts))]
+        for text in texts:
+            assert trained_model.classify(text, early_exit=True) == trained_model.classify(text)
+            assert trained_model._scan_stream(text, chunk_size=64, early_exit=True)[0] is not None
+
+    def test_early_exit_skips_settled_remainder(self):
+        trained_model = _TrainedModel({'EventHubProducerClient'}, {'EventHubClient'}, {'Azure.Messaging.EventHubs'}, {'Microsoft.Azure.EventHubs'})
+        text = 'using Azure.Messaging.EventHubs; var producer = new EventHubProducerClient();\n' + 'filler text\n' * 10000
+        v, skipped_fraction = trained_model._scan_stream(text, chunk_size=128, early_exit=True)
+        assert skipped_fraction > 0.99
+        assert trained_model._do_naive_prediction(v) == trained_model.classify(text) == False
+
+class TestRelevanceGate(unittest.TestCase):
+    def test_gates_only_documents_without_hits(self):
+        trained_model = build_offline_model()
+        for text in read_corpus().values():
+            if trained_model.create_feature_vector(text) != trained_model._feature_vector_from_counts(0, 0, 0, 0):
+                assert trained_model.relevance_gate().admits(text)
+
+        trained_model = _TrainedModel({'EventHubProducerClient'}, {'EventHubClient'}, {'Azure.Messaging.EventHubs'}, {'Microsoft.Azure.EventHubs'})
+        trained_model._model = build_offline_model()._model
+        texts = ['', 'filler text\n' * 100, 'var producer = new EventHubProducerClient();', 'EventHubProducerClients', 'using Microsoft.Azure.EventHubs.Processor;']
+        assert [trained_model.relevance_gate().admits(text) for text in texts] == [False, False, True, False, True]
+        gated, full = trained_model.classify_verbose(texts[1]), trained_model._verbose_results([trained_model.create_feature_vector(texts[1])])[0]
+        assert gated.pop('gated') and not full.pop('gated')
+        assert gated.keys() == full.keys() and all(numpy.allclose(gated[key], full[key]) if key == 'ml_result_probability' else gated[key] == full[key] for key in gated)
+        before = trained_model.gate_stats()['gated_documents']
+        assert list(trained_model.classify_many(texts)) == [trained_model.classify(text) for text in texts]
+        assert trained_model.gate_stats()['gated_documents'] == before + 2 * 3
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy
+
+from azureSDKTrackClassifier import AzureSDKTrackClassifier
+from azureSDKTrackClassifier.model import _TrainedModel
+from azureSDKTrackClassifier.model_file import dump_model, load_model, FORMAT_VERSION
+from offline_model import build_offline_classifier, read_corpus
+
+class TestCompactModelFormat(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = build_offline_classifier()
+        cls.texts = list(read_corpus().values()) + ['', 'test']
+
+    def test_compact_roundtrip_matches_pickle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pickle_path = self.classifier.save(os.path.join(directory, 'pickled.model'))
+            compact_path = self.classifier.save(os.path.join(directory, 'compact.model'), 'compact')
+            assert os.path.getsize(compact_path) < os.path.getsize(pickle_path)
+            pickled, compact = AzureSDKTrackClassifier.load(pickle_path), AzureSDKTrackClassifier.load(compact_path)
+            assert compact._trained_model.fingerprint() == pickled._trained_model.fingerprint() == self.classifier._trained_model.fingerprint()
+            for expected, result in zip(pickled.is_t1_verbose_many(self.texts), compact.is_t1_verbose_many(self.texts)):
+                assert expected['result'] == result['result'] and expected['ml_result'] == result['ml_result']
+                assert numpy.allclose(expected['ml_result_probability'], result['ml_result_probability'])
+            compact._trained_model._fingerprint = None # Recomputing from the loaded tables and weights gives the same fingerprint.
+            assert compact._trained_model.fingerprint() == pickled._trained_model.fingerprint()
+
+    def test_compact_load_does_not_need_sklearn(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.classifier.save(os.path.join(directory, 'compact.model'), 'compact')
+            code = "import sys; from azureSDKTrackClassifier import AzureSDKTrackClassifier; c = AzureSDKTrackClassifier.load(sys.argv[1]); c.is_t1_verbose('test'); print('sklearn' in sys.modules)"
+            assert subprocess.run([sys.executable, '-c', code, path], capture_output=True, text=True, check=True).stdout.strip() == 'False'
+
+    def test_rejects_newer_format_version(self):
+        data = dump_model(self.classifier._trained_model, {}).replace('"format_version": {}'.format(FORMAT_VERSION).encode('utf-8'), '"format_version": {}'.format(FORMAT_VERSION + 1).encode('utf-8'), 1)
+        with self.assertRaises(ValueError):
+            load_model(data)
+
+    def test_shared_load_matches_regular_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.classifier.save(os.path.join(directory, 'compact.model'), 'compact')
+            regular, shared = AzureSDKTrackClassifier.load(path), AzureSDKTrackClassifier.load(path, shared=True)
+            assert list(shared.is_t1_many(self.texts)) == list(regular.is_t1_many(self.texts))
+            for text in self.texts:
+                assert shared._trained_model.create_feature_vector(text) == regular._trained_model.create_feature_vector(text)
+                assert shared.is_t1_verbose(text, early_exit=True)['t2_token_count'] == regular.is_t1_verbose(text, early_exit=True)['t2_token_count']
+            tokens = set(self.texts[0].split()) | {'not-a-token'}
+            assert shared._trained_model._token_index.find(tokens, 1) == regular._trained_model._token_index.find(tokens, 1)
+            unpickled = AzureSDKTrackClassifier._loads(shared._dumps('pickle')) # Pickling falls back to an in-memory index.
+            assert unpickled._trained_model.create_feature_vector(self.texts[0]) == regular._trained_model.create_feature_vector(self.texts[0])
+
+# Anonymous (i.e. not file-backed, so never shared with other processes) memory a worker adds loading a model and classifying a document.
+_WORKER = '''
+import sys
+from azureSDKTrackClassifier import AzureSDKTrackClassifier
+def anonymous_kb():
+    with open('/proc/self/smaps_rollup') as f:
+        return sum(int(line.split()[1]) for line in f if line.startswith('Anonymous:'))
+before = anonymous_kb()
+classifier = AzureSDKTrackClassifier.load(sys.argv[1], shared=sys.argv[2] == 'shared')
+classifier.is_t1_verbose(sys.stdin.read())
+print(anonymous_kb() - before)
+'''
+
+@unittest.skipUnless(os.path.exists('/proc/self/smaps_rollup'), "Measures memory through Linux's /proc.")
+class TestSharedModelMemory(unittest.TestCase):
+    def test_workers_share_model(self):
+        trained_model = build_offline_classifier()._trained_model
+        versions = ['Azure.Generated{:05d}.Package 1.{}.0'.format(i, i % 30) for i in range(10000)] # More than all languages' releases name today.
+        large_model = _TrainedModel(['NewToken{:06d}'.format(i) for i in range(200000)] + trained_model._token_index.tokens(0),
+                                    ['OldToken{:06d}'.format(i) for i in range(200000)] + trained_model._token_index.tokens(1),
+                                    trained_model._only_new_versions | set(versions[::2]), trained_model._only_old_versions | set(versions[1::2]))
+        large_model._model = trained_model._model
+        text = next(iter(read_corpus().values()))
+        with tempfile.TemporaryDirectory() as directory:
+            path = AzureSDKTrackClassifier._from_trained_model(large_model).save(os.path.join(directory, 'compact.model'), 'compact')
+            def run_workers(mode:str, count:int) -> list:
+                workers = [subprocess.Popen([sys.executable, '-c', _WORKER, path, mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True) for _ in range(count)]
+                return [int(worker.communicate(text)[0]) for worker in workers]
+            (private_copy_kb,) = run_workers('private', 1)
+            shared_kb = run_workers('shared', 3)
+        assert private_copy_kb > 50000 # The in-memory token index of this model is tens of MB...
+        # ...while workers attached to the model file only add what each process builds itself: the version matcher and relevance gate, about 9 MB here.
+        assert max(shared_kb) < 16 * 1024
+
+if __name__ == '__main__':
+    unittest.main()
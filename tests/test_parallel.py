@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from azureSDKTrackClassifier.constants import Language
+from azureSDKTrackClassifier.helpers import get_apistubgen_path, get_corpora_without_apistubgen, get_corpus_arguments, shared_model_file
+from azureSDKTrackClassifier.parallel import WorkerPool, _batches, tokenize_corpora
+from azureSDKTrackClassifier.settings import Settings
+from azureSDKTrackClassifier.tokenizers import tokenize_text, tokenize_texts
+from offline_model import build_offline_classifier, read_corpus
+
+class TestWorkerPool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = build_offline_classifier()
+        cls.corpus = read_corpus()
+        cls.corpus['empty'] = ''
+
+    def test_batches_by_characters_and_count(self):
+        items = [(i, 'x' * 10) for i in range(7)]
+        assert [len(b) for b in _batches(items, 25, 100)] == [3, 3, 1]
+        assert [len(b) for b in _batches(items, 1000, 2)] == [2, 2, 2, 1]
+        assert [item for batch in _batches(items, 25, 2) for item in batch] == items
+
+    def test_results_match_serial_in_input_order(self):
+        expected = list(zip(self.corpus.keys(), self.classifier.is_t1_many(self.corpus.values())))
+        with shared_model_file(self.classifier) as model_path, WorkerPool(model_path, 2, batch_characters=1000) as pool:
+            assert list(pool.classify(self.corpus.items())) == expected
+            assert pool.gated_documents == sum(not self.classifier._trained_model.relevance_gate().admits(text) for text in self.corpus.values()) > 0 # At least the empty document.
+        assert not os.path.exists(model_path) # The temporary model file is cleaned up.
+
+    def test_verbose_early_exit_results_match_serial(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.classifier.save(os.path.join(directory, 'compact.model'), 'compact')
+            with shared_model_file(self.classifier, path) as model_path, WorkerPool(model_path, 2, verbose=True, early_exit=True, batch_characters=1000) as pool:
+                assert model_path == path # Already a compact model file, so used as is.
+                for (key, result), text in zip(pool.classify(self.corpus.items()), self.corpus.values()):
+                    expected = self.classifier.is_t1_verbose(text, early_exit=True)
+                    assert (result['result'], result['t1_token_count'], result['early_exit_skipped_fraction']) == (expected['result'], expected['t1_token_count'], expected['early_exit_skipped_fraction'])
+
+    def test_workers_share_result_cache(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(Settings, 'CACHE_BASE_PATH', directory): # Forked workers see the patched path.
+            runs = []
+            for _ in range(2):
+                with shared_model_file(self.classifier) as model_path, WorkerPool(model_path, 2, batch_characters=1000, cache_results=True) as pool:
+                    runs.append((list(pool.classify(self.corpus.items())), pool.result_cache_stats))
+        (first, first_stats), (second, second_stats) = runs
+        assert first == second
+        assert first_stats['hits'] + first_stats['misses'] == len(self.corpus) # Counted by every worker.
+        assert (second_stats['misses'], second_stats['hits']) == (0, len(self.corpus)) # Stored by the first run's workers.
+
+class TestTokenizeCorpora(unittest.TestCase):
+    def test_matches_tokenizing_joined_corpora(self):
+        corpus = read_corpus()
+        corpora = {language:{path:text for path, text in corpus.items() if os.sep + language + os.sep in path} for language in ['dotnet', 'python', 'java', 'js']}
+        corpora['empty'] = {}
+        expected = {key:tokenize_text('\n'.join(texts.values())) for key, texts in corpora.items()}
+        assert tokenize_texts(corpus.values()) == tokenize_text('\n'.join(corpus.values()))
+        assert tokenize_corpora(corpora, 1) == expected
+        assert tokenize_corpora(corpora, 2) == expected # Too little text to be worth workers.
+        assert tokenize_corpora(corpora, 2, parallel_threshold=0) == expected
+        assert tokenize_corpora(corpora, 2, batch_characters=1, parallel_threshold=0) == expected # A batch per file.
+        assert tokenize_corpora({'all':corpus}, 2, batch_characters=1000, parallel_threshold=0) == {'all':tokenize_text('\n'.join(corpus.values()))} # One corpus split across workers.
+
+    def test_packages_with_apistubgen_are_not_tokenized(self):
+        metadata = [({'Package':package, 'VersionGA':'1.0.0', 'VersionPreview':'', 'RepoPath':'NA'}, Language.python) for package in ['azure-eventhub', 'azure-servicebus']]
+        corpora = {get_corpus_arguments(each, each_language):{'sample.py':'import azure'} for each, each_language in metadata}
+        with tempfile.TemporaryDirectory() as stubs, mock.patch.object(Settings, 'APISTUBGEN_PATH', stubs):
+            open(get_apistubgen_path(Language.python, 'azure-eventhub', '1.0.0'), 'w').close()
+            assert list(get_corpora_without_apistubgen(metadata, corpora)) == [get_corpus_arguments(*metadata[1])]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from azureSDKTrackClassifier import AzureSDKTrackClassifier, Language, ModelRegistry
+from azureSDKTrackClassifier.registry import model_file_name, parse_model_file_name
+
+from offline_model import build_offline_classifier, read_corpus
+
+class TestModelRegistry(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        classifier = build_offline_classifier()
+        for language, service in [(None, None), (Language.dotnet, None), (Language.dotnet, 'EventHubs'), ('python', 'ServiceBus')]:
+            classifier._language, classifier._service = language, service
+            classifier.save(os.path.join(cls.directory.name, classifier._default_file_name()), 'compact')
+        cls.text = next(iter(read_corpus().values()))
+        cls.expected = classifier.is_t1(cls.text)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_model_file_names(self):
+        assert model_file_name(Language.dotnet, 'EventHubs') == 'azureSDKTrackClassifier_dotnet_EventHubs.model'
+        assert parse_model_file_name('azureSDKTrackClassifier_dotnet_Event_Hubs.model') == ('dotnet', 'Event_Hubs')
+        assert parse_model_file_name('azureSDKTrackClassifier_Language.java_None.model') == ('java', None) # As saved by earlier versions.
+        assert parse_model_file_name('azureSDKTrackClassifier_None_None.model') == (None, None)
+        assert parse_model_file_name('azureSDKTrackClassifier_cobol_None.model') is None
+        assert parse_model_file_name('notes.txt') is None
+
+    def test_resolves_with_fallback(self):
+        registry = ModelRegistry(directory=self.directory.name)
+        assert registry.resolve('dotnet', 'EventHubs') == ('dotnet', 'EventHubs')
+        assert registry.resolve(Language.dotnet, 'ServiceBus') == ('dotnet', None)
+        assert registry.resolve('python', 'EventHubs') == (None, None)
+        assert registry.resolve() == (None, None)
+        model = registry.get('js', 'Storage')
+        assert (model._language, model._service) == (None, None)
+        assert model.is_t1(self.text) == self.expected
+        assert registry.stats()['fallbacks'] == 1
+        assert registry.resolve('cobol', 'EventHubs') == (None, None) # Unknown languages fall back too.
+        assert registry.get('cobol') is model
+
+        with self.assertRaises(KeyError):
+            ModelRegistry({('dotnet', 'EventHubs'):registry._paths[('dotnet', 'EventHubs')]}).resolve('python')
+
+    def test_loads_lazily_and_evicts_least_recently_used(self):
+        with mock.patch.object(AzureSDKTrackClassifier, 'load', wraps=AzureSDKTrackClassifier.load) as load:
+            registry = ModelRegistry(directory=self.directory.name, max_models=2)
+            assert not load.called
+            eventhubs = registry.get('dotnet', 'EventHubs')
+            assert registry.get('dotnet', 'EventHubs') is eventhubs
+            registry.get('dotnet')
+            registry.get('dotnet', 'EventHubs') # So the all-dotnet model is now the least recently used.
+            registry.get('python', 'ServiceBus')
+            assert load.call_count == 3
+        stats = registry.stats()
+        assert list(stats['resident']) == ['dotnet/EventHubs', 'python/ServiceBus']
+        assert stats['resident_bytes'] == sum(os.path.getsize(registry._paths[key]) for key in [('dotnet', 'EventHubs'), ('python', 'ServiceBus')])
+        assert (stats['hits'], stats['loads'], stats['evictions']) == (2, 3, 1)
+
+        registry = ModelRegistry(directory=self.directory.name, max_bytes=stats['resident_bytes'] // 2) # Room for one model at a time.
+        registry.get('dotnet')
+        registry.get('python', 'ServiceBus')
+        assert list(registry.stats()['resident']) == ['python/ServiceBus']
+
+    def test_concurrent_gets_load_once(self):
+        configured = []
+        registry = ModelRegistry(directory=self.directory.name, configure=configured.append)
+        models = []
+        threads = [threading.Thread(target=lambda: models.append(registry.get('dotnet', 'EventHubs'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(configured) == 1 and all(model is configured[0] for model in models)
+
+if __name__ == '__main__':
+    unittest.main()
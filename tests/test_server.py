@@ -0,0 +1,108 @@
+import http.client
+import os
+import tempfile
+import threading
+import unittest
+
+from azureSDKTrackClassifier.server import ClassificationClient, ClassificationServer, summarize
+from offline_model import build_offline_classifier, read_corpus
+
+class TestClassificationServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.classifier = build_offline_classifier()
+        cls.corpus = read_corpus()
+        cls.server = ClassificationServer({'all':cls.classifier}, port=0, batch_window=0.05).start()
+        cls.client = ClassificationClient(cls.server.address)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        cls.server.shutdown()
+
+    def test_results_match_cli_summary(self):
+        assert self.client.classify(next(iter(self.corpus.values()))) == summarize([('text', self.classifier.is_t1(next(iter(self.corpus.values()))))])
+        assert self.client.classify_many(self.corpus) == summarize(zip(self.corpus.keys(), self.classifier.is_t1_many(self.corpus.values())))
+        verbose = self.client.classify_many(self.corpus, verbose=True, early_exit=True)['per_document_results']
+        for path, text in self.corpus.items():
+            assert verbose[path]['result'] == self.classifier.is_t1_verbose(text, early_exit=True)['result']
+
+    def test_concurrent_requests_are_batched(self):
+        before = self.client.metrics()
+        results = {}
+        def classify(path, text):
+            with_own_connection = ClassificationClient(self.server.address)
+            results[path] = with_own_connection.classify(text)['per_document_results']['text']
+            with_own_connection.close()
+        threads = [threading.Thread(target=classify, args=item) for item in self.corpus.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        after = self.client.metrics()
+        assert results == dict(zip(self.corpus.keys(), self.classifier.is_t1_many(self.corpus.values())))
+        assert after['documents'] - before['documents'] == len(self.corpus)
+        assert after['batches'] - before['batches'] < len(self.corpus)
+
+    def test_health_and_errors(self):
+        assert self.client.health() == {'status':'ok', 'models':{'all':self.classifier._trained_model.fingerprint()}}
+        with self.assertRaises(RuntimeError):
+            self.client.classify('text', model='missing')
+
+    def test_rejects_when_busy(self):
+        server = ClassificationServer({'all':self.classifier}, port=0, max_concurrency=1, queue_timeout=0.01).start()
+        client = ClassificationClient(server.address)
+        try:
+            server._slots.acquire() # Occupy the only slot.
+            with self.assertRaises(RuntimeError):
+                client.classify('text')
+            server._slots.release()
+            assert client.classify('text')['total_documents'] == 1
+            assert client.metrics()['rejected'] == 1
+        finally:
+            client.close()
+            server.shutdown()
+
+    def test_waiting_requests_are_rejected_before_their_bodies_are_read(self):
+        server = ClassificationServer({'all':self.classifier}, port=0, max_concurrency=1, queue_timeout=0.05).start()
+        statuses = []
+        def send_headers_only():
+            # Announces a large body but never sends it; the server must answer without waiting to read it.
+            connection = http.client.HTTPConnection(server.address.split('://', 1)[-1], timeout=10)
+            connection.putrequest('POST', '/classify_many')
+            connection.putheader('Content-Length', str(32 << 20))
+            connection.endheaders()
+            statuses.append(connection.getresponse().status)
+            connection.close()
+        client = ClassificationClient(server.address)
+        try:
+            server._slots.acquire() # Occupy the only slot.
+            threads = [threading.Thread(target=send_headers_only) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert statuses == [503] * 4
+            with self.assertRaises(RuntimeError):
+                client.classify('text')
+            server._slots.release()
+            assert client.classify('text')['total_documents'] == 1 # The rejected request's body was drained, so the connection is still usable.
+            assert client.metrics()['rejected'] == 5
+        finally:
+            client.close()
+            server.shutdown()
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "Unix sockets.")
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            server = ClassificationServer({'all':self.classifier}, unix_socket=os.path.join(directory, 'classifier.sock')).start()
+            client = ClassificationClient(server.address)
+            try:
+                assert client.classify_many(self.corpus)['t1_documents'] == sum(self.classifier.is_t1_many(self.corpus.values()))
+            finally:
+                client.close()
+                server.shutdown()
+            assert not os.path.exists(os.path.join(directory, 'classifier.sock'))
+
+if __name__ == '__main__':
+    unittest.main()